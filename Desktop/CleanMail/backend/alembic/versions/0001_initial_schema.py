@@ -0,0 +1,82 @@
+"""Initial schema: users, rules and email logs
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Databases created before migrations existed (with create_tables) already
+have these tables; they are left as they are.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("google_id", sa.String(), nullable=False),
+            sa.Column("name", sa.String(), nullable=True),
+            sa.Column("picture", sa.String(), nullable=True),
+            sa.Column("access_token", sa.String(), nullable=False),
+            sa.Column("refresh_token", sa.String(), nullable=True),
+            sa.Column("token_expires_at", sa.DateTime(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+        op.create_index("ix_users_google_id", "users", ["google_id"], unique=True)
+
+    if "rules" not in tables:
+        op.create_table(
+            "rules",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.Column("match_type", sa.String(), nullable=False),
+            sa.Column("match_value", sa.String(), nullable=False),
+            sa.Column("action_type", sa.String(), nullable=False),
+            sa.Column("action_value", sa.String(), nullable=True),
+            sa.Column("priority", sa.Integer(), nullable=True),
+            sa.Column("is_active", sa.Boolean(), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_rules_id", "rules", ["id"])
+
+    if "email_logs" not in tables:
+        op.create_table(
+            "email_logs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("rule_id", sa.Integer(), sa.ForeignKey("rules.id"), nullable=True),
+            sa.Column("gmail_message_id", sa.String(), nullable=False),
+            sa.Column("subject", sa.String(), nullable=True),
+            sa.Column("sender", sa.String(), nullable=True),
+            sa.Column("received_at", sa.DateTime(), nullable=True),
+            sa.Column("applied_action", sa.String(), nullable=False),
+            sa.Column("action_value", sa.String(), nullable=True),
+            sa.Column("success", sa.String(), nullable=True),
+            sa.Column("processed_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        )
+        op.create_index("ix_email_logs_id", "email_logs", ["id"])
+
+
+def downgrade():
+    op.drop_table("email_logs")
+    op.drop_table("rules")
+    op.drop_table("users")
@@ -0,0 +1,116 @@
+"""Processing jobs, sync state, message cache, rule profiles and rule-set versions
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+Adds the tables of the job queue, incremental sync, message cache and rule
+profiles, users.rule_set_version and rules.slow_flagged_at. Every step
+checks the current schema first, so databases where create_tables already
+made some of these (it creates missing tables but never adds columns) can
+be upgraded too. A message_cache table of the first cache version (with a
+format column) is recreated empty: it only holds cached Gmail content.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "rule_set_version" not in _columns(inspector, "users"):
+        op.add_column("users", sa.Column("rule_set_version", sa.Integer(), nullable=False, server_default="0"))
+    if "slow_flagged_at" not in _columns(inspector, "rules"):
+        op.add_column("rules", sa.Column("slow_flagged_at", sa.DateTime(timezone=True), nullable=True))
+
+    if "processing_jobs" not in tables:
+        op.create_table(
+            "processing_jobs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("max_emails", sa.Integer(), nullable=False),
+            sa.Column("stack_actions", sa.Boolean(), nullable=False),
+            sa.Column("incremental", sa.Boolean(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("max_attempts", sa.Integer(), nullable=False),
+            sa.Column("run_after", sa.DateTime(), nullable=False),
+            sa.Column("worker_id", sa.String(), nullable=True),
+            sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+            sa.Column("emails_processed", sa.Integer(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("stats", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_processing_jobs_id", "processing_jobs", ["id"])
+        op.create_index("ix_processing_jobs_user_id", "processing_jobs", ["user_id"])
+        op.create_index("ix_processing_jobs_status_run_after", "processing_jobs", ["status", "run_after"])
+
+    if "gmail_sync_states" not in tables:
+        op.create_table(
+            "gmail_sync_states",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("history_id", sa.String(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        )
+        op.create_index("ix_gmail_sync_states_id", "gmail_sync_states", ["id"])
+        op.create_index("ix_gmail_sync_states_user_id", "gmail_sync_states", ["user_id"], unique=True)
+
+    if "message_cache" in tables and "format" in _columns(inspector, "message_cache"):
+        op.drop_table("message_cache")
+        tables.discard("message_cache")
+    if "message_cache" not in tables:
+        op.create_table(
+            "message_cache",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("gmail_message_id", sa.String(), nullable=False),
+            sa.Column("data", sa.Text(), nullable=False),
+            sa.Column("cached_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.UniqueConstraint("user_id", "gmail_message_id"),
+        )
+        op.create_index("ix_message_cache_id", "message_cache", ["id"])
+
+    if "rule_profiles" not in tables:
+        op.create_table(
+            "rule_profiles",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("rule_id", sa.Integer(), sa.ForeignKey("rules.id"), nullable=False, unique=True),
+            sa.Column("evaluations", sa.Integer(), nullable=False),
+            sa.Column("hits", sa.Integer(), nullable=False),
+            sa.Column("sampled_evaluations", sa.Integer(), nullable=False),
+            sa.Column("sampled_seconds", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        )
+        op.create_index("ix_rule_profiles_id", "rule_profiles", ["id"])
+        op.create_index("ix_rule_profiles_user_id", "rule_profiles", ["user_id"])
+
+
+def downgrade():
+    op.drop_table("rule_profiles")
+    op.drop_table("message_cache")
+    op.drop_table("gmail_sync_states")
+    op.drop_table("processing_jobs")
+    with op.batch_alter_table("rules") as batch_op:
+        batch_op.drop_column("slow_flagged_at")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("rule_set_version")
+
+
+def _columns(inspector, table: str) -> set:
+    """Column names of a table (empty if it does not exist)"""
+    if table not in inspector.get_table_names():
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
@@ -17,6 +17,9 @@ class Settings(BaseSettings):
     google_client_id: Optional[str] = None
     google_client_secret: Optional[str] = None
     google_redirect_uri: str = "http://localhost:8000/api/auth/callback"
+    google_token_uri: str = "https://oauth2.googleapis.com/token"
+    token_refresh_margin_seconds: int = 300  # Refresh access tokens this long before expiry
+    token_refresh_backoff_seconds: float = 5.0  # First wait after a failed background refresh (doubles)
 
     # Security
     secret_key: str = "your-secret-key-change-in-production"
@@ -29,6 +32,48 @@ class Settings(BaseSettings):
         "https://www.googleapis.com/auth/gmail.modify",
         "https://www.googleapis.com/auth/gmail.labels"
     ]
+    gmail_api_base_url: str = "https://www.googleapis.com"  # Point at a fake server for local testing
+    gmail_transport: str = "live"  # "live", "record" (live + save responses) or "replay" (saved responses only)
+    gmail_recording_file: str = "gmail_recording.jsonl"
+    gmail_batch_size: int = 100  # Sub-requests per /batch call (Gmail allows up to 100)
+    gmail_page_size: int = 100  # Messages per list page / processing chunk (Gmail allows up to 500)
+    gmail_max_concurrency: int = 10  # Gmail requests in flight at once (async client)
+    gmail_max_connections: int = 20
+    gmail_http2: bool = False  # Needs the h2 package
+    gmail_timeout_seconds: float = 30.0
+    gmail_quota_units_per_second: float = 250.0  # Gmail per-user quota
+    gmail_quota_burst: Optional[float] = None  # Bucket size; defaults to one second of quota
+    gmail_max_retries: int = 5  # Retries of 429 / 5xx / rate-limit 403 responses
+    gmail_retry_base_seconds: float = 1.0
+    gmail_retry_max_seconds: float = 32.0
+    message_cache_enabled: bool = True  # Keep parsed message content in the message_cache table
+    message_cache_ttl_seconds: float = 30 * 24 * 3600.0
+    message_cache_max_messages: int = 20000  # Per user; the oldest entries are evicted first
+    label_cache_ttl_seconds: float = 300.0
+
+    # Rule engine
+    body_match_window: int = 2000  # Body characters decoded for body/regex rules
+    regex_cache_size: int = 512  # Compiled regex patterns kept in memory
+    regex_max_length: int = 500
+    regex_time_budget_ms: float = 50.0  # A regex search is stopped after this long
+    regex_budget_overruns: int = 3  # Stopped searches before a rule is disabled
+    rule_profile_sample_every: int = 100  # Time per-rule cost on 1 email in N (0 = off)
+
+    # Rule backtesting
+    backtest_chunk_size: int = 5000
+    backtest_workers: Optional[int] = None  # Defaults to the number of CPUs
+
+    # Email processing jobs
+    job_max_attempts: int = 3
+    job_retry_base_seconds: float = 30.0  # Attempt n is retried after base * 2 ** (n - 1)
+    job_lease_seconds: float = 300.0  # Running jobs not renewed for this long are requeued
+    job_max_running_per_user: int = 1
+    worker_concurrency: int = 4  # Jobs a worker runs at once
+    worker_poll_seconds: float = 1.0
+    pipeline_queue_size: int = 4  # Chunks buffered between processing stages
+    log_batch_size: int = 500  # Email log rows per bulk insert
+    log_flush_interval_ms: float = 1000.0  # Buffered log rows are written at least this often
+    embedded_worker: bool = True  # Run a worker in the API process (turn off with separate workers)
 
     # Application
     debug: bool = True
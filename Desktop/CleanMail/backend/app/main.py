@@ -3,9 +3,13 @@ CleanMail - Gmail Inbox Cleaner MVP
 FastAPI Backend Application
 """
 
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app import config
 from app.routers import auth, rules, emails, dashboard
+from app.services import gmail_async
+from app.worker import Worker
 
 # Create FastAPI app
 app = FastAPI(
@@ -42,6 +46,25 @@ app.include_router(rules.router, prefix="/api/rules", tags=["Rules"])
 app.include_router(emails.router, prefix="/api/emails", tags=["Emails"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
 
+@app.on_event("startup")
+async def start_embedded_worker():
+    """Run queued processing jobs in this process, unless separate workers do"""
+    if config.settings.embedded_worker:
+        app.state.worker = Worker()
+        app.state.worker_task = asyncio.create_task(app.state.worker.run())
+
+@app.on_event("shutdown")
+async def stop_embedded_worker():
+    """Release the jobs of the embedded worker back to the queue"""
+    if getattr(app.state, "worker", None):
+        app.state.worker.stop()
+        await app.state.worker_task
+
+@app.on_event("shutdown")
+async def close_gmail_client():
+    """Close the pooled Gmail API connections"""
+    await gmail_async.close_client()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -0,0 +1,22 @@
+"""
+Cached Gmail message model
+"""
+
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class CachedMessage(Base):
+    __tablename__ = "message_cache"
+    __table_args__ = (UniqueConstraint("user_id", "gmail_message_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    gmail_message_id = Column(String, nullable=False)
+
+    # Message content (headers and body; labels change, so they are not cached)
+    data = Column(Text, nullable=False)  # JSON of the parsed email fields
+
+    # Metadata
+    cached_at = Column(DateTime(timezone=True), server_default=func.now())
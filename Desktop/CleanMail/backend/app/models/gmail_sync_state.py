@@ -0,0 +1,20 @@
+"""
+Gmail sync state model
+"""
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class GmailSyncState(Base):
+    __tablename__ = "gmail_sync_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True, nullable=False)
+
+    # Mailbox history ID up to which messages have been processed
+    history_id = Column(String, nullable=True)
+
+    # Metadata
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,40 @@
+"""
+Email processing job model
+"""
+
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+    __table_args__ = (
+        Index("ix_processing_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+
+    # Processing parameters (see POST /api/emails/process)
+    max_emails = Column(Integer, nullable=False, default=50)
+    stack_actions = Column(Boolean, nullable=False, default=False)
+    incremental = Column(Boolean, nullable=False, default=False)
+
+    # Queue state
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False)  # Not claimed before this time (retry backoff)
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # A running job whose lease expired is requeued
+
+    # Outcome
+    emails_processed = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    stats = Column(Text, nullable=True)  # JSON per-stage pipeline stats, updated while running
+
+    # Metadata
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -29,6 +29,7 @@ class Rule(Base):
     # Rule settings
     priority = Column(Integer, default=0)  # Lower number = higher priority
     is_active = Column(Boolean, default=True)
+    slow_flagged_at = Column(DateTime(timezone=True), nullable=True)  # Regex skipped for blowing its time budget
 
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,24 @@
+"""
+Rule profile model
+"""
+
+from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class RuleProfile(Base):
+    __tablename__ = "rule_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    rule_id = Column(Integer, ForeignKey("rules.id"), unique=True, nullable=False)
+
+    # Counters summed over every processing run, whichever process ran it
+    evaluations = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    sampled_evaluations = Column(Integer, nullable=False, default=0)
+    sampled_seconds = Column(Float, nullable=False, default=0.0)
+
+    # Metadata
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
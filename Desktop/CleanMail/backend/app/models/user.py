@@ -22,6 +22,9 @@ class User(Base):
     refresh_token = Column(String, nullable=True)
     token_expires_at = Column(DateTime, nullable=False)
 
+    # Bumped on every rule change, so each process knows to recompile the rules
+    rule_set_version = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Metadata
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -45,7 +45,7 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
         "redirect_uri": config.settings.google_redirect_uri,
     }
 
-    token_response = requests.post("https://oauth2.googleapis.com/token", data=token_data)
+    token_response = requests.post(config.settings.google_token_uri, data=token_data)
     if token_response.status_code != 200:
         raise HTTPException(status_code=400, detail="Failed to get access token")
 
@@ -6,9 +6,11 @@ from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
+from app import config
 from app.database import get_db
 from app.models.rule import Rule
 from app.models.email_log import EmailLog
+from app.services import rule_engine
 from app.services.auth_service import verify_token
 
 router = APIRouter()
@@ -95,6 +97,49 @@ async def get_dashboard_stats(
     }
 
 
+@router.get("/rules/profile")
+async def get_rules_profile(
+    current_user_id: int = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get per-rule evaluation cost and hit counters to find dead and slow rules"""
+    rules = db.query(Rule).filter(Rule.user_id == current_user_id).order_by(Rule.priority).all()
+    profile = rule_engine.get_rule_profile(db, current_user_id)
+
+    # Processed emails per rule, as in the stats rule_performance
+    rule_performance = dict(db.query(
+        EmailLog.rule_id,
+        func.count(EmailLog.id)
+    ).filter(
+        EmailLog.user_id == current_user_id
+    ).group_by(EmailLog.rule_id).all())
+
+    rule_profiles = []
+    for rule in rules:
+        stats = profile.get(rule.id, {})
+        evaluations = stats.get("evaluations", 0)
+        hits = stats.get("hits", 0)
+        rule_profiles.append({
+            "rule_id": rule.id,
+            "rule_name": rule.name,
+            "match_type": rule.match_type,
+            "priority": rule.priority,
+            "is_active": rule.is_active,
+            "evaluations": evaluations,
+            "hits": hits,
+            "hit_rate": stats.get("hit_rate", 0.0),
+            "avg_eval_us": stats.get("avg_eval_us"),
+            "estimated_total_ms": stats.get("estimated_total_ms"),
+            "processed_count": rule_performance.get(rule.id, 0),
+            "never_fired": evaluations > 0 and hits == 0
+        })
+
+    return {
+        "sample_every": config.settings.rule_profile_sample_every,
+        "rules": rule_profiles
+    }
+
+
 @router.get("/activity")
 async def get_activity_log(
     current_user_id: int = Depends(get_current_user),
@@ -2,15 +2,13 @@
 Emails router - Email processing and Gmail API integration
 """
 
-from typing import List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.user import User
-from app.models.rule import Rule
-from app.schemas.email_log import EmailLogCreate
-from app.services import gmail_service, rule_engine
+from app.schemas.processing_job import ProcessingJob as ProcessingJobSchema
+from app.services import gmail_async, job_queue
 from app.services.auth_service import verify_token
 
 router = APIRouter()
@@ -36,92 +34,52 @@ async def preview_emails(
         raise HTTPException(status_code=404, detail="User not found")
 
     try:
-        emails = gmail_service.get_emails(user, max_results=max_results)
-        return {"emails": emails}
+        emails = await gmail_async.get_emails(user, max_results=max_results)
+        return {"emails": [email.to_dict() for email in emails]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch emails: {str(e)}")
 
 
 @router.post("/process")
 async def process_emails(
-    background_tasks: BackgroundTasks,
     current_user_id: int = Depends(get_current_user),
     max_emails: int = 50,
+    stack_actions: bool = False,
+    incremental: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Process emails using user's rules"""
+    """Queue an email processing job using user's rules
+
+    With stack_actions, every matching rule is applied to an email (e.g. tag
+    and mark_read) instead of only the first one by priority.
+
+    With incremental, only emails that reached the unread inbox since the
+    last run are fetched (Gmail history), instead of the max_emails most
+    recent unread ones; the first run, or one whose history has expired,
+    falls back to a full sync.
+
+    The job is run by a worker; poll GET /jobs/{job_id} for its status.
+    """
     user = db.query(User).filter(User.id == current_user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Add background task for processing
-    background_tasks.add_task(process_emails_background, current_user_id, max_emails, db)
+    job = job_queue.enqueue_job(db, current_user_id, max_emails, stack_actions, incremental)
 
-    return {"message": "Email processing started in background"}
+    return {"message": "Email processing queued", "job_id": job.id, "status": job.status}
 
 
-async def process_emails_background(user_id: int, max_emails: int, db: Session):
-    """Background task to process emails"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return
-
-    try:
-        # Get user's rules (use built-in rules if no custom rules)
-        rules = db.query(Rule).filter(Rule.user_id == user_id, Rule.is_active == True).all()
-        if not rules:
-            # Use built-in rules if no custom rules exist
-            from app.services.rule_engine import get_built_in_rules
-            built_in_rules = get_built_in_rules()
-            for rule_data in built_in_rules:
-                rule = Rule(
-                    user_id=user_id,
-                    name=rule_data["name"],
-                    description=rule_data["description"],
-                    match_type=rule_data["match_type"],
-                    match_value=rule_data["match_value"],
-                    action_type=rule_data["action_type"],
-                    action_value=rule_data["action_value"],
-                    priority=rule_data["priority"],
-                    is_active=True
-                )
-                db.add(rule)
-            db.commit()
-            rules = db.query(Rule).filter(Rule.user_id == user_id, Rule.is_active == True).all()
-
-        # Get emails to process
-        emails = gmail_service.get_emails(user, max_results=max_emails)
-
-        # Process each email
-        for email in emails:
-            matched_rule = rule_engine.find_matching_rule(email, rules)
-
-            if matched_rule:
-                # Apply the rule
-                success = gmail_service.apply_rule(user, email, matched_rule)
-
-                # Log the action
-                log_data = EmailLogCreate(
-                    user_id=user_id,
-                    rule_id=matched_rule.id,
-                    gmail_message_id=email["id"],
-                    subject=email.get("subject"),
-                    sender=email.get("sender"),
-                    received_at=email.get("received_at"),
-                    applied_action=matched_rule.action_type,
-                    action_value=matched_rule.action_value,
-                    success=success
-                )
-
-                # Save log to database
-                from app.models.email_log import EmailLog
-                log_entry = EmailLog(**log_data.model_dump())
-                db.add(log_entry)
-                db.commit()
-
-    except Exception as e:
-        # TODO: Log error
-        print(f"Error processing emails: {e}")
+@router.get("/jobs/{job_id}", response_model=ProcessingJobSchema)
+async def get_processing_job(
+    job_id: int,
+    current_user_id: int = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the status of an email processing job"""
+    job = job_queue.get_job(db, job_id, current_user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @router.get("/patterns")
@@ -2,13 +2,17 @@
 Rules router - CRUD operations for email processing rules
 """
 
+import json
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.rule import Rule
-from app.schemas.rule import RuleCreate, RuleUpdate, Rule as RuleSchema
+from app.models.rule_profile import RuleProfile
+from app.schemas.rule import RuleCreate, RuleUpdate, RuleBacktest, Rule as RuleSchema
+from app.services import backtest_service, rule_engine
 
 router = APIRouter()
 
@@ -30,13 +34,44 @@ async def create_rule(
     db: Session = Depends(get_db)
 ):
     """Create a new rule"""
+    errors = rule_engine.validate_rule(rule.model_dump())
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
     db_rule = Rule(**rule.model_dump(), user_id=user_id)
     db.add(db_rule)
+    rule_engine.bump_rule_set_version(db, user_id)
     db.commit()
     db.refresh(db_rule)
     return db_rule
 
 
+@router.post("/backtest")
+async def backtest_rules(
+    backtest: RuleBacktest,
+    user_id: int,  # TODO: Get from JWT token
+):
+    """Replay a candidate rule set against processed emails
+
+    Streams newline-delimited JSON: one object per chunk of emails listing
+    those whose category would change, then a summary object.
+    """
+    rule_data = [rule.model_dump() for rule in backtest.rules]
+    errors = [
+        f"{rule['name']}: {error}"
+        for rule in rule_data
+        for error in rule_engine.validate_rule(rule)
+    ]
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    results = backtest_service.iter_backtest(user_id, rule_data, limit=backtest.limit)
+    return StreamingResponse(
+        (json.dumps(result, default=str) + "\n" for result in results),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.get("/{rule_id}", response_model=RuleSchema)
 async def get_rule(
     rule_id: int,
@@ -62,9 +97,18 @@ async def update_rule(
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
 
-    for field, value in rule_update.model_dump(exclude_unset=True).items():
+    update_data = rule_update.model_dump(exclude_unset=True)
+    rule_data = {field: getattr(rule, field) for field in RuleCreate.model_fields}
+    errors = rule_engine.validate_rule({**rule_data, **update_data})
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    for field, value in update_data.items():
         setattr(rule, field, value)
+    if "match_type" in update_data or "match_value" in update_data:
+        rule.slow_flagged_at = None  # A new pattern gets a fresh chance
 
+    rule_engine.bump_rule_set_version(db, user_id)
     db.commit()
     db.refresh(rule)
     return rule
@@ -81,6 +125,8 @@ async def delete_rule(
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
 
+    db.query(RuleProfile).filter(RuleProfile.rule_id == rule.id).delete(synchronize_session=False)
     db.delete(rule)
+    rule_engine.bump_rule_set_version(db, user_id)
     db.commit()
     return {"message": "Rule deleted successfully"}
@@ -0,0 +1,34 @@
+"""
+Pydantic schemas for ProcessingJob model
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, field_validator
+
+
+class ProcessingJob(BaseModel):
+    id: int
+    user_id: int
+    max_emails: int
+    stack_actions: bool
+    incremental: bool
+    status: str  # queued, running, succeeded, failed
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    emails_processed: Optional[int] = None
+    error: Optional[str] = None
+    stats: Optional[Dict[str, Any]] = None  # Per-stage throughput and queue depth of the run
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @field_validator("stats", mode="before")
+    @classmethod
+    def parse_stats(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+    class Config:
+        from_attributes = True
@@ -3,7 +3,7 @@ Pydantic schemas for Rule model
 """
 
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -33,11 +33,17 @@ class RuleUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class RuleBacktest(BaseModel):
+    rules: List[RuleBase]  # Candidate rule set to replay
+    limit: Optional[int] = None  # Most recent emails to replay (default: all)
+
+
 class Rule(RuleBase):
     id: int
     user_id: int
     created_at: datetime
     updated_at: Optional[datetime]
+    slow_flagged_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,181 @@
+"""
+Backtest service - Replay candidate rules against a user's email history
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, groupby
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+from app import config
+from app.database import SessionLocal
+from app.models.email_log import EmailLog
+from app.services import message_cache
+from app.services.rule_engine import CompiledRuleSet
+
+# Candidate rule set of a pool worker process, built once by _init_worker
+_worker_rules: Optional[CompiledRuleSet] = None
+
+
+def iter_backtest(user_id: int, rule_data: List[Dict[str, Any]], limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Replay candidate rules over the user's processed emails.
+
+    Reads the log entry of the first-priority rule of each message's latest
+    run from email_logs and yields one result per chunk of messages,
+    listing the emails whose category would change, then a final summary.
+    Chunks are evaluated in a process pool when there is more than one of
+    them.
+
+    Logs only keep sender and subject; messages found in the message cache
+    are replayed from their cached record instead, so body rules only fire
+    for those.
+    """
+    compiled = CompiledRuleSet(_candidate_rules(rule_data))
+    chunk_size = config.settings.backtest_chunk_size
+
+    processed = 0
+    changed = 0
+    transitions: Dict[str, int] = {}
+
+    db = SessionLocal()
+    try:
+        chunks = _iter_history_chunks(db, user_id, chunk_size, limit)
+        head = [chunk for chunk in (next(chunks, None), next(chunks, None)) if chunk]
+
+        executor = None
+        if len(head) < 2:
+            # Not worth starting a pool for a single chunk
+            results = ((chunk, compiled.match_batch(_chunk_emails(user_id, chunk))) for chunk in head)
+        else:
+            workers = config.settings.backtest_workers or os.cpu_count() or 1
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(rule_data,)
+            )
+            results = _map_in_pool(executor, user_id, chain(head, chunks), window=workers * 2)
+
+        try:
+            for chunk, matches in results:
+                changes = []
+                for row, rank in zip(chunk, matches):
+                    new_rule = compiled.rules[rank] if rank is not None else None
+                    old_category = _category(row.applied_action, row.action_value)
+                    new_category = _category(new_rule.action_type, new_rule.action_value) if new_rule else None
+                    if old_category == new_category:
+                        continue
+
+                    changes.append({
+                        "gmail_message_id": row.gmail_message_id,
+                        "subject": row.subject,
+                        "sender": row.sender,
+                        "old_category": old_category,
+                        "new_category": new_category,
+                        "new_rule": new_rule.name if new_rule else None
+                    })
+                    transition = f"{old_category} -> {new_category}"
+                    transitions[transition] = transitions.get(transition, 0) + 1
+
+                processed += len(chunk)
+                changed += len(changes)
+                yield {"type": "chunk", "processed": processed, "changes": changes}
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+    finally:
+        db.close()
+
+    yield {
+        "type": "summary",
+        "total_emails": processed,
+        "changed_emails": changed,
+        "transitions": transitions
+    }
+
+
+def _candidate_rules(rule_data: List[Dict[str, Any]]) -> List[SimpleNamespace]:
+    """Build lightweight rule objects for the active candidate rules"""
+    return [
+        SimpleNamespace(id=None, **data)
+        for data in rule_data
+        if data.get("is_active", True)
+    ]
+
+
+def _category(action_type: Optional[str], action_value: Optional[str]) -> Optional[str]:
+    """Category an action puts an email in: the label for tag/move, else the action"""
+    if action_type in ("tag", "move"):
+        return action_value
+    return action_type
+
+
+def _iter_history_chunks(db, user_id: int, chunk_size: int, limit: Optional[int]) -> Iterator[list]:
+    """Stream one log row per message, from its latest run, newest first, in chunks.
+
+    A stacked run logs one row per matching rule, in priority order, with a
+    single processed_at; the first of them (lowest ID) stands for the run.
+    """
+    rows = db.query(
+        EmailLog.gmail_message_id,
+        EmailLog.subject,
+        EmailLog.sender,
+        EmailLog.applied_action,
+        EmailLog.action_value,
+        EmailLog.processed_at
+    ).filter(
+        EmailLog.user_id == user_id
+    ).order_by(EmailLog.processed_at.desc(), EmailLog.id.desc()).yield_per(chunk_size)
+
+    seen = set()
+    chunk = []
+    for _, run_rows in groupby(rows, key=lambda row: row.processed_at):
+        # Rows come newest ID first, so the last one per message was logged first
+        latest = {row.gmail_message_id: row for row in run_rows if row.gmail_message_id not in seen}
+        for message_id, row in latest.items():
+            seen.add(message_id)
+            chunk.append(row)
+
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+            if limit and len(seen) >= limit:
+                break
+        if limit and len(seen) >= limit:
+            break
+
+    if chunk:
+        yield chunk
+
+
+def _chunk_emails(user_id: int, chunk: list) -> list:
+    """Email records the rule engine can match: cached messages, else log rows"""
+    cached = message_cache.get_cached_messages(user_id, [row.gmail_message_id for row in chunk])
+    return [
+        cached.get(row.gmail_message_id) or {"sender": row.sender or "", "subject": row.subject or ""}
+        for row in chunk
+    ]
+
+
+def _map_in_pool(executor: ProcessPoolExecutor, user_id: int, chunks: Iterator[list], window: int):
+    """Evaluate chunks in the pool, in order, with at most window chunks in flight"""
+    pending = []
+    for chunk in chunks:
+        pending.append((chunk, executor.submit(_evaluate_chunk, _chunk_emails(user_id, chunk))))
+        if len(pending) >= window:
+            chunk, future = pending.pop(0)
+            yield chunk, future.result()
+
+    for chunk, future in pending:
+        yield chunk, future.result()
+
+
+def _init_worker(rule_data: List[Dict[str, Any]]):
+    """Pool initializer: compile the candidate rules once per worker process"""
+    global _worker_rules
+    _worker_rules = CompiledRuleSet(_candidate_rules(rule_data))
+
+
+def _evaluate_chunk(emails: list) -> List[Optional[int]]:
+    """Pool task: first matching rule rank per email of a chunk"""
+    return _worker_rules.match_batch(emails)
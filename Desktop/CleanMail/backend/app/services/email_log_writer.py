@@ -0,0 +1,102 @@
+"""
+Email log writer - Buffered, bulk-inserted email processing logs
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+
+from app import config
+from app.database import SessionLocal
+from app.models.email_log import EmailLog
+from app.schemas.email_log import EmailLogCreate
+
+
+class EmailLogWriter:
+    """Buffers email log records and writes them in bulk.
+
+    Records are inserted with one multi-row INSERT and a single commit per
+    flush: when settings.log_batch_size records are buffered, or when the
+    oldest buffered record is settings.log_flush_interval_ms old. Writes run
+    in a thread on a session of their own, so commits don't stall the event
+    loop. Use as an async context manager; leaving it flushes the rest. When
+    processing failed the rest is still written (those actions were applied
+    already), but best effort: a write error is printed and the processing
+    error is the one raised.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, flush_interval_ms: Optional[float] = None):
+        settings = config.settings
+        self.batch_size = batch_size or settings.log_batch_size
+        self.flush_interval = (flush_interval_ms or settings.log_flush_interval_ms) / 1000
+        self.written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "EmailLogWriter":
+        self._timer = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+            return
+        try:
+            await self.close()
+        except Exception as e:
+            print(f"Error writing email logs after a processing error: {e}")
+
+    async def add(self, log_data: EmailLogCreate):
+        """Buffer a log record, flushing when the batch is full"""
+        if not self._buffer:
+            self._oldest = time.monotonic()
+        self._buffer.append(log_data.model_dump())
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Write every buffered record in one transaction (kept buffered if it fails)"""
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                await asyncio.to_thread(_insert_logs, rows)
+            except Exception:
+                self._buffer = rows + self._buffer
+                raise
+            self.written += len(rows)
+
+    async def close(self):
+        """Stop the flush timer and write what is left"""
+        self._closing.set()
+        if self._timer is not None:
+            await self._timer  # Lets a flush in progress finish
+            self._timer = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if self._buffer and time.monotonic() - self._oldest >= self.flush_interval:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"Error writing email logs: {e}")
+
+
+def _insert_logs(rows: List[Dict[str, Any]]):
+    db = SessionLocal()
+    try:
+        db.execute(insert(EmailLog), rows)
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,180 @@
+"""
+Email processor - Fetch, match, apply and log one processing run of a user
+"""
+
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from app import config
+from app.models.rule import Rule
+from app.models.user import User
+from app.schemas.email_log import EmailLogCreate
+from app.services import gmail_service, rule_engine, sync_service
+from app.services.email_log_writer import EmailLogWriter
+from app.services.job_queue import PermanentJobError
+from app.services.pipeline import Pipeline
+from app.services.prepared_email import PreparedEmail
+from app.services.rule_engine import CompiledRuleSet
+
+
+async def process_emails(
+    db: Session,
+    user_id: int,
+    max_emails: int,
+    stack_actions: bool = False,
+    incremental: bool = False,
+    pipeline: Optional[Pipeline] = None
+) -> int:
+    """Process a user's unread emails with their rules; returns how many were evaluated.
+
+    Chunks of emails go through a pipeline of fetch, match, apply and log
+    stages running concurrently; pass a Pipeline to read its per-stage
+    stats during or after the run.
+
+    Errors are raised to the caller (the job worker retries them), except a
+    missing user, which raises PermanentJobError.
+
+    Database calls on db run in a thread, one at a time, so they never
+    block the event loop.
+    """
+    user = await asyncio.to_thread(lambda: db.query(User).filter(User.id == user_id).first())
+    if not user:
+        raise PermanentJobError(f"User {user_id} not found")
+    # The fields Gmail calls need, read now: commits below expire the row
+    gmail_user = gmail_service.detached_user(user)
+
+    rules = await asyncio.to_thread(load_rules, db, user_id)
+    rules.begin_run()
+
+    # Resolve label IDs from one labels.list call for the whole run
+    await asyncio.to_thread(gmail_service.warm_label_cache, gmail_user)
+
+    # Stream the emails to process in chunks, fetching bodies only where
+    # a rule needs them
+    chunks, history_id = await sync_service.sync_emails(
+        db, gmail_user, max_results=max_emails, rules=rules, match_all=stack_actions, incremental=incremental
+    )
+
+    async def fetched(chunks) -> AsyncIterator[ProcessingChunk]:
+        async for emails in chunks:
+            yield ProcessingChunk(emails)
+
+    async def match(chunk: ProcessingChunk) -> ProcessingChunk:
+        # Match the whole chunk at once, off the event loop so fetching goes on
+        chunk.matched = await asyncio.to_thread(match_chunk, chunk.emails, rules, stack_actions)
+        return chunk
+
+    async def apply(chunk: ProcessingChunk) -> ProcessingChunk:
+        # Apply the actions of each matched email (the rule, or the combined
+        # actions of all matching rules) with batchModify, off the event loop
+        cancelled = threading.Event()
+        try:
+            chunk.results = await asyncio.to_thread(apply_actions, gmail_user, chunk.matched, cancelled)
+        except asyncio.CancelledError:
+            # The thread outlives the task (e.g. the job lost its lease):
+            # stop it from sending more batches
+            cancelled.set()
+            raise
+        return chunk
+
+    processed = 0
+
+    async def log(chunk: ProcessingChunk):
+        nonlocal processed
+        # Log the action of each applied rule, written in bulk by log_writer
+        for email, email_rules in chunk.matched:
+            success = chunk.results.get(email["id"], False)
+            for matched_rule in email_rules:
+                log_data = EmailLogCreate(
+                    user_id=user_id,
+                    rule_id=matched_rule.id,
+                    gmail_message_id=email["id"],
+                    subject=email.get("subject"),
+                    sender=email.get("sender"),
+                    received_at=email.get("received_at"),
+                    applied_action=matched_rule.action_type,
+                    action_value=matched_rule.action_value,
+                    success=success
+                )
+                await log_writer.add(log_data)
+        processed += len(chunk)
+
+    # Fetching, matching, Gmail actions and log writes of successive chunks
+    # overlap; bounded queues between the stages provide backpressure
+    pipeline = pipeline or Pipeline(config.settings.pipeline_queue_size)
+    async with EmailLogWriter() as log_writer:
+        await pipeline.run(fetched(chunks), [("match", match), ("apply", apply), ("log", log)], source_name="fetch")
+
+    # Next incremental run starts from here
+    await asyncio.to_thread(sync_service.save_history_id, db, user_id, history_id)
+
+    await asyncio.to_thread(rule_engine.save_rule_stats, db, user_id, rules)
+
+    # Disable regex rules that kept hitting the evaluation time budget, or
+    # that failed the complexity check on load
+    for slow_rule in await asyncio.to_thread(rule_engine.disable_slow_rules, db, user_id, rules):
+        print(f"Disabled rule {slow_rule.name}: regex exceeded the evaluation time budget or is unsafe")
+
+    return processed
+
+
+def load_rules(db: Session, user_id: int) -> CompiledRuleSet:
+    """Get user's compiled rules, adding the built-in rules if they have none"""
+    rules = rule_engine.get_compiled_rules(db, user_id)
+    if rules:
+        return rules
+
+    for rule_data in rule_engine.get_built_in_rules():
+        rule = Rule(
+            user_id=user_id,
+            name=rule_data["name"],
+            description=rule_data["description"],
+            match_type=rule_data["match_type"],
+            match_value=rule_data["match_value"],
+            action_type=rule_data["action_type"],
+            action_value=rule_data["action_value"],
+            priority=rule_data["priority"],
+            is_active=True
+        )
+        db.add(rule)
+    rule_engine.bump_rule_set_version(db, user_id)
+    db.commit()
+    return rule_engine.get_compiled_rules(db, user_id)
+
+
+class ProcessingChunk:
+    """A chunk of fetched emails moving through the processing pipeline"""
+
+    __slots__ = ("emails", "matched", "results")
+
+    def __init__(self, emails: List[PreparedEmail]):
+        self.emails = emails
+        self.matched: List[Tuple[PreparedEmail, list]] = []  # (email, matching rules) of matched emails
+        self.results: Dict[str, bool] = {}  # Action success per message ID
+
+    def __len__(self) -> int:
+        return len(self.emails)
+
+
+def match_chunk(emails: List[PreparedEmail], rules, stack_actions: bool) -> List[Tuple[PreparedEmail, list]]:
+    """Matched emails of a chunk with their first matching rule (every matching rule when stacked)"""
+    if stack_actions:
+        masks = rule_engine.find_all_matching_rules_batch(emails, rules)
+        matched_rules = [rules.rules_for_mask(mask) for mask in masks]
+    else:
+        matches = rule_engine.find_matching_rules_batch(emails, rules)
+        matched_rules = [[rules.rules[index]] if index is not None else [] for index in matches]
+    return [(email, email_rules) for email, email_rules in zip(emails, matched_rules) if email_rules]
+
+
+def apply_actions(user, matched: list, cancelled: Optional[threading.Event] = None) -> Dict[str, bool]:
+    """Apply the rules matched per email with batchModify; success per message ID.
+
+    Stops sending batches once cancelled is set (see ActionBatch).
+    """
+    actions = gmail_service.ActionBatch(user, cancelled=cancelled)
+    for email, email_rules in matched:
+        actions.add(email["id"], email_rules)
+    return actions.flush()
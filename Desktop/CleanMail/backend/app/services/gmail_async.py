@@ -0,0 +1,408 @@
+"""
+Async Gmail API service - Non-blocking message fetching on a pooled httpx client
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, TypeVar
+
+import httpx
+
+from app import config
+from app.models.user import User
+from app.services import gmail_service, message_cache
+from app.services.gmail_quota import get_quota_limiter, is_retryable, quota_units, retry_delay
+from app.services.gmail_service import GMAIL_API_PATH, GMAIL_BATCH_PATH
+from app.services.gmail_transport import get_transport
+from app.services.prepared_email import PreparedEmail
+from app.services.rule_engine import CompiledRuleSet
+from app.services.token_manager import token_manager
+
+T = TypeVar("T")
+
+# Shared client and request limit, created on first use (see get_client)
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared, connection-pooled Gmail API client.
+
+    Connections are kept alive between requests; HTTP/2 is used when
+    settings.gmail_http2 is on and the h2 package is installed.
+    """
+    global _client, _semaphore
+    if _client is None or _client.is_closed:
+        settings = config.settings
+        _client = httpx.AsyncClient(
+            base_url=settings.gmail_api_base_url,
+            http2=_http2_available() if settings.gmail_http2 else False,
+            limits=httpx.Limits(
+                max_connections=settings.gmail_max_connections,
+                max_keepalive_connections=settings.gmail_max_connections
+            ),
+            timeout=settings.gmail_timeout_seconds
+        )
+        _semaphore = asyncio.Semaphore(settings.gmail_max_concurrency)
+    return _client
+
+
+async def close_client():
+    """Close the shared client (application shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("Warning: gmail_http2 is enabled but the h2 package is not installed, using HTTP/1.1")
+        return False
+
+
+async def _gmail_request(user: User, method: str, path: str, units: Optional[int] = None, **kwargs) -> httpx.Response:
+    """Send an authenticated Gmail API request, at most gmail_max_concurrency at a time.
+
+    Authorized, paced and retried like gmail_service._gmail_request.
+    """
+    settings = config.settings
+    client = get_client()
+    transport = get_transport()
+    headers = kwargs.pop("headers", {})
+    limiter = get_quota_limiter(user.id)
+    units = units if units is not None else quota_units(method, path)
+    reauthorized = False
+
+    for attempt in range(settings.gmail_max_retries + 1):
+        access_token = await token_manager.get_access_token_async(user)
+        headers["Authorization"] = f"Bearer {access_token}"
+        await asyncio.sleep(limiter.reserve(units))
+        try:
+            async with _semaphore:
+                response = await transport.send_async(client, method, path, headers=headers, **kwargs)
+        except httpx.TransportError:
+            if attempt == settings.gmail_max_retries:
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+            continue
+
+        if response.status_code == 401 and not reauthorized:
+            # Token revoked or expired early: refresh once and retry
+            reauthorized = True
+            await asyncio.to_thread(token_manager.refresh, user.id, access_token)
+            continue
+
+        if attempt == settings.gmail_max_retries or not is_retryable(response.status_code, response.text):
+            return response
+
+        delay = retry_delay(attempt, response.headers.get("Retry-After"))
+        if response.status_code in (403, 429):
+            # Over quota: hold back every call of this user, not just this one
+            limiter.pause(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    return response
+
+
+async def get_emails(
+    user: User,
+    max_results: int = 10,
+    rules: Optional[CompiledRuleSet] = None,
+    match_all: bool = False
+) -> List[PreparedEmail]:
+    """Fetch recent emails from user's Gmail inbox.
+
+    Retrieves unread emails from the inbox for processing. Automatically
+    refreshes OAuth tokens if expired. Message details are fetched through
+    the Gmail batch endpoint, up to settings.gmail_batch_size per call.
+
+    Args:
+        user: User object with Gmail API credentials
+        max_results: Maximum number of emails to retrieve (default: 10)
+        rules: Compiled rule set the emails will be matched against; when
+            given, only the parts of each message the rules need are fetched
+            (see get_message_details)
+        match_all: Whether every matching rule will be evaluated
+
+    Returns:
+        List of PreparedEmail records containing:
+        - id: Gmail message ID
+        - subject: Email subject line
+        - sender: Email sender address
+        - received_at: Email timestamp
+        - body_preview: First 200 characters of email body
+        - labels: Gmail labels applied to the email
+        plus the normalized fields the rule engine matches against
+
+    Raises:
+        Exception: If Gmail API request fails or token refresh fails
+    """
+    emails = []
+    async for chunk in iter_emails(user, max_results=max_results, rules=rules, match_all=match_all):
+        emails.extend(chunk)
+    return emails
+
+
+def iter_emails(
+    user: User,
+    max_results: Optional[int] = None,
+    rules: Optional[CompiledRuleSet] = None,
+    match_all: bool = False,
+    page_size: Optional[int] = None
+) -> AsyncIterator[List[PreparedEmail]]:
+    """Stream the unread inbox as chunks of emails, one chunk per list page.
+
+    Follows nextPageToken until max_results emails (None: the whole unread
+    inbox) have been listed. The next page is listed and fetched in a task
+    while the caller works on the current one, so at most two pages
+    (settings.gmail_page_size emails each) are held in memory. rules and
+    match_all are passed on to get_message_details.
+    """
+    page_size = page_size or config.settings.gmail_page_size
+    user = gmail_service.detached_user(user)
+    return _prefetching(_iter_email_pages(user, max_results, rules, match_all, page_size))
+
+
+async def _iter_email_pages(
+    user: User,
+    max_results: Optional[int],
+    rules: Optional[CompiledRuleSet],
+    match_all: bool,
+    page_size: int
+) -> AsyncIterator[List[PreparedEmail]]:
+    params: Dict[str, Any] = {
+        "labelIds": ["INBOX"],
+        "q": "is:unread"  # Only get unread emails for processing
+    }
+    remaining = max_results
+
+    while remaining is None or remaining > 0:
+        params["maxResults"] = page_size if remaining is None else min(page_size, remaining)
+        response = await _gmail_request(user, "GET", f"{GMAIL_API_PATH}/messages", params=params)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch messages: {response.text}")
+
+        messages_data = response.json()
+        message_ids = [message_info["id"] for message_info in messages_data.get("messages", [])]
+        if remaining is not None:
+            remaining -= len(message_ids)
+        if message_ids:
+            # Listed by labelIds and q, so every message is in the unread inbox
+            yield await get_message_details(user, message_ids, rules, match_all, listed_labels=["INBOX", "UNREAD"])
+
+        if not messages_data.get("nextPageToken"):
+            break
+        params["pageToken"] = messages_data["nextPageToken"]
+
+
+def iter_message_details(
+    user: User,
+    message_ids: List[str],
+    rules: Optional[CompiledRuleSet] = None,
+    match_all: bool = False,
+    page_size: Optional[int] = None
+) -> AsyncIterator[List[PreparedEmail]]:
+    """get_message_details in chunks of page_size messages, prefetching the next chunk"""
+    page_size = page_size or config.settings.gmail_page_size
+    user = gmail_service.detached_user(user)
+
+    async def chunks():
+        for start in range(0, len(message_ids), page_size):
+            yield await get_message_details(user, message_ids[start:start + page_size], rules, match_all)
+
+    return _prefetching(chunks())
+
+
+async def _prefetching(items: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Produce the next item in a task while the caller handles the current one"""
+    async def next_item():
+        try:
+            return await items.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    pending = asyncio.ensure_future(next_item())
+    try:
+        while True:
+            item = await pending
+            if item is None:
+                return
+            pending = asyncio.ensure_future(next_item())
+            yield item
+    finally:
+        if not pending.done():
+            pending.cancel()
+
+
+async def get_message_detail(user: User, message_id: str, format: str = "full") -> Optional[PreparedEmail]:
+    """Get detailed message information, from the message cache when possible"""
+    messages = await fetch_messages(user, [message_id], format)
+    return messages[0] if messages else None
+
+
+async def _get_message(user: User, message_id: str, format: str) -> Optional[PreparedEmail]:
+    params = gmail_service.message_params(format)
+    response = await _gmail_request(user, "GET", f"{GMAIL_API_PATH}/messages/{message_id}", params=params)
+    if response.status_code != 200:
+        return None
+    return gmail_service.parse_message(response.json())
+
+
+async def get_message_details(
+    user: User,
+    message_ids: List[str],
+    rules: Optional[CompiledRuleSet] = None,
+    match_all: bool = False,
+    listed_labels: Optional[List[str]] = None
+) -> List[PreparedEmail]:
+    """Get several messages with Gmail batch requests, in message_ids order.
+
+    Without rules every message is fetched in full. With a compiled rule set
+    the fetch is planned from its match types: when no body or regex rule
+    exists only metadata (METADATA_HEADERS) is downloaded; otherwise
+    metadata comes first and the full message is fetched only for the
+    emails that reach a body rule (see CompiledRuleSet.needs_body).
+    Messages fetched as metadata have an empty body_preview. listed_labels
+    is passed on to fetch_messages.
+    """
+    if gmail_service.fetch_full_upfront(rules, match_all):
+        return await fetch_messages(user, message_ids, "full", listed_labels=listed_labels)
+
+    messages = await fetch_messages(user, message_ids, "metadata", listed_labels=listed_labels)
+    if rules.first_body_rank is None:
+        return messages
+
+    full_ids = [message.id for message in messages if rules.needs_body(message, match_all)]
+    if not full_ids:
+        return messages
+    fresh = {message.id: message for message in messages}
+    full_messages = {message.id: message for message in await fetch_messages(user, full_ids, "full", fresh, listed_labels)}
+    return [full_messages.get(message.id, message) for message in messages]
+
+
+async def fetch_messages(
+    user: User,
+    message_ids: List[str],
+    format: str = "full",
+    fresh: Optional[Dict[str, PreparedEmail]] = None,
+    listed_labels: Optional[List[str]] = None
+) -> List[PreparedEmail]:
+    """Fetch messages through concurrent batch requests, in message_ids order.
+
+    Messages in the message cache are read from it (off the event loop);
+    it holds full messages, so it serves metadata fetches too. Only their
+    labels are not cached: they are taken from fresh, records of the same
+    messages just fetched in another format, else are listed_labels when
+    the caller listed the messages by those labels (the unread inbox of a
+    full sync), else are fetched (format=minimal). The other messages are
+    fetched, and cached when full. Messages that cannot be fetched are left
+    out.
+    """
+    cached: Dict[str, PreparedEmail] = {}
+    if format in ("full", "metadata"):
+        cached = await asyncio.to_thread(message_cache.get_cached_messages, user.id, message_ids)
+    missing = [message_id for message_id in message_ids if message_id not in cached]
+    fresh = fresh or {}
+    unlabeled = [] if listed_labels is not None else [message_id for message_id in cached if message_id not in fresh]
+
+    fetched, labeled = await asyncio.gather(
+        _fetch_batches(user, missing, format),
+        _fetch_batches(user, unlabeled, "minimal")
+    )
+    if fetched and format == "full":
+        await asyncio.to_thread(message_cache.cache_messages, user.id, list(fetched.values()))
+
+    fresh = {**fresh, **labeled}
+    for message_id, message in cached.items():
+        if message_id in fresh:  # Otherwise it was deleted since it was cached
+            message.labels = fresh[message_id].labels
+            message.history_id = fresh[message_id].history_id
+            fetched[message_id] = message
+        elif listed_labels is not None:
+            message.labels = list(listed_labels)
+            fetched[message_id] = message
+    return [fetched[message_id] for message_id in message_ids if message_id in fetched]
+
+
+async def _fetch_batches(user: User, message_ids: List[str], format: str) -> Dict[str, PreparedEmail]:
+    """Fetch messages in concurrent /batch calls of settings.gmail_batch_size.
+
+    Messages a batch could not return are retried individually (also
+    concurrently); messages that still fail are left out.
+    """
+    batch_size = max(1, min(config.settings.gmail_batch_size, 100))
+    chunks = [message_ids[start:start + batch_size] for start in range(0, len(message_ids), batch_size)]
+
+    fetched: Dict[str, PreparedEmail] = {}
+    for batch in await asyncio.gather(*(_fetch_message_batch(user, chunk, format) for chunk in chunks)):
+        fetched.update(batch)
+
+    failed = [message_id for message_id in message_ids if message_id not in fetched]
+    for message_id, message in zip(failed, await asyncio.gather(
+        *(_get_message(user, message_id, format) for message_id in failed),
+        return_exceptions=True
+    )):
+        if isinstance(message, PreparedEmail):
+            fetched[message_id] = message
+    return fetched
+
+
+async def _fetch_message_batch(user: User, message_ids: List[str], format: str) -> Dict[str, PreparedEmail]:
+    headers, body = gmail_service.build_message_batch(message_ids, format)
+    try:
+        response = await _gmail_request(
+            user, "POST", GMAIL_BATCH_PATH, units=gmail_service.batch_units(message_ids),
+            headers=headers, content=body
+        )
+    except httpx.HTTPError as e:
+        print(f"Gmail batch request failed: {e}")
+        return {}
+
+    if response.status_code != 200:
+        print(f"Gmail batch request failed: {response.status_code} {response.text[:200]}")
+        return {}
+
+    return gmail_service.parse_message_batch(message_ids, response.headers.get("Content-Type", ""), response.content)
+
+
+async def get_history_id(user: User) -> Optional[str]:
+    """Current history ID of the user's mailbox (users.getProfile)"""
+    response = await _gmail_request(user, "GET", f"{GMAIL_API_PATH}/profile")
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch profile: {response.text}")
+    return response.json().get("historyId")
+
+
+async def list_history(user: User, start_history_id: str) -> Optional[tuple[List[str], List[str], str]]:
+    """IDs of messages that arrived in (or came back to) the unread inbox since a history ID.
+
+    Follows users.history.list pages and collects messages added to INBOX
+    plus messages that got the INBOX or UNREAD label back, oldest first,
+    without the ones deleted since. Returns (message IDs, deleted message
+    IDs, latest history ID), or None when start_history_id has expired and
+    a full sync is needed.
+    """
+    params = gmail_service.history_params(start_history_id)
+    message_ids: Dict[str, None] = {}  # Insertion-ordered sets
+    deleted_ids: Dict[str, None] = {}
+    latest_history_id = start_history_id
+
+    while True:
+        response = await _gmail_request(user, "GET", f"{GMAIL_API_PATH}/history", params=params)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch history: {response.text}")
+
+        data = response.json()
+        gmail_service.collect_history(message_ids, deleted_ids, data)
+        latest_history_id = data.get("historyId", latest_history_id)
+        if not data.get("nextPageToken"):
+            break
+        params["pageToken"] = data["nextPageToken"]
+
+    return list(message_ids), list(deleted_ids), latest_history_id
@@ -0,0 +1,151 @@
+"""
+Gmail quota - Per-user quota-unit rate limiting and retry scheduling
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from app import config
+
+# Quota units per Gmail API method (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.modify": 5,
+    "messages.batchModify": 50,
+    "labels.list": 1,
+    "labels.create": 5,
+    "history.list": 2,
+    "getProfile": 1,
+}
+
+# HTTP statuses worth retrying; 403 only with a rate-limit reason
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+_MESSAGE_PATH = re.compile(r"/messages/[^/]+$")
+
+
+def quota_method(http_method: str, path: str) -> str:
+    """Name of the Gmail API method a request path calls (a QUOTA_UNITS key)"""
+    if path.endswith("/messages/batchModify"):
+        return "messages.batchModify"
+    if path.endswith("/modify"):
+        return "messages.modify"
+    if path.endswith("/messages"):
+        return "messages.list"
+    if _MESSAGE_PATH.search(path):
+        return "messages.get"
+    if path.endswith("/labels"):
+        return "labels.create" if http_method == "POST" else "labels.list"
+    if path.endswith("/history"):
+        return "history.list"
+    if path.endswith("/profile"):
+        return "getProfile"
+    return "messages.get"
+
+
+def quota_units(http_method: str, path: str) -> int:
+    """Quota units a single (non-batch) Gmail request costs"""
+    return QUOTA_UNITS[quota_method(http_method, path)]
+
+
+class QuotaLimiter:
+    """Token bucket of quota units for one user.
+
+    Refills at units_per_second up to burst units. reserve() takes the units
+    straight away, possibly going into debt, and returns how long the
+    caller must wait, so concurrent callers are spaced out in arrival order
+    and the same limiter serves threads and asyncio tasks alike.
+    """
+
+    def __init__(self, units_per_second: float, burst: float):
+        self.units_per_second = units_per_second
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, units: float) -> float:
+        """Take units from the bucket; returns the delay (seconds) before sending"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.units_per_second)
+            self._updated = now
+            self._tokens -= units
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.units_per_second
+
+    def pause(self, seconds: float):
+        """Hold every caller back for at least seconds (the server asked us to slow down)"""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.units_per_second)
+            self._updated = time.monotonic()
+
+
+# Per-user limiters, keyed by user ID
+_limiters: Dict[int, QuotaLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_quota_limiter(user_id: int) -> QuotaLimiter:
+    """Get (or create) the quota limiter of a user"""
+    with _limiters_lock:
+        limiter = _limiters.get(user_id)
+        if limiter is None:
+            settings = config.settings
+            limiter = _limiters[user_id] = QuotaLimiter(
+                settings.gmail_quota_units_per_second,
+                settings.gmail_quota_burst or settings.gmail_quota_units_per_second
+            )
+        return limiter
+
+
+def is_retryable(status_code: int, body: str = "") -> bool:
+    """Whether a Gmail response is a transient failure worth retrying"""
+    if status_code in RETRYABLE_STATUSES:
+        return True
+    if status_code != 403:
+        return False
+    try:
+        errors = json.loads(body).get("error", {}).get("errors", [])
+    except (ValueError, AttributeError):
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry number attempt + 1.
+
+    Honors a Retry-After header (seconds or HTTP date); otherwise uses
+    exponential backoff with full jitter, capped at
+    settings.gmail_retry_max_seconds.
+    """
+    settings = config.settings
+    if retry_after:
+        delay = _parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, settings.gmail_retry_max_seconds)
+
+    ceiling = min(settings.gmail_retry_max_seconds, settings.gmail_retry_base_seconds * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -2,158 +2,453 @@
 Gmail API service - Handle Gmail interactions
 """
 
-from typing import List, Dict, Any
-import base64
+from typing import List, Dict, Any, Optional
+import json
 import re
+import threading
+import time
+import uuid
 from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import urlencode
 import requests
+from app import config
 from app.models.user import User
 from app.models.rule import Rule
+from app.services.gmail_quota import get_quota_limiter, is_retryable, quota_units, retry_delay
+from app.services.gmail_transport import get_transport
+from app.services.mime_walker import extract_body_text
+from app.services.label_cache import LabelCache, get_label_cache, invalidate_label_cache
+from app.services.prepared_email import PreparedEmail
+from app.services.rule_engine import CompiledRuleSet
+from app.services.token_manager import token_manager
+
+GMAIL_API_PATH = "/gmail/v1/users/me"
+GMAIL_BATCH_PATH = "/batch/gmail/v1"
+
+# Headers requested with format=metadata: everything non-body rules match on
+METADATA_HEADERS = ["From", "To", "Subject", "Date"]
+
+# Characters of body text kept in email records for display
+BODY_PREVIEW_LENGTH = 200
+
+# Most message IDs a single batchModify call accepts
+BATCH_MODIFY_MAX_IDS = 1000
+
+# Names Gmail reserves for its system labels (casefolded); rule labels with
+# these names are created under LABEL_NAMESPACE instead (e.g. "CleanMail/Trash")
+RESERVED_LABEL_NAMES = {
+    "inbox", "unread", "starred", "important", "sent", "draft", "drafts",
+    "spam", "trash", "chat", "chats", "muted",
+}
+LABEL_NAMESPACE = "CleanMail"
+
+def _gmail_request(user: User, method: str, path: str, units: Optional[int] = None, **kwargs) -> requests.Response:
+    """Send an authenticated request to the Gmail API.
+
+    path is relative to the API base URL (settings.gmail_api_base_url), so
+    every Gmail call can be pointed at a local fake server; the request goes
+    through the transport of settings.gmail_transport (live, record, replay).
+
+    The access token comes from the token manager, which refreshes it ahead
+    of expiry; a 401 forces one refresh and retry. Calls are paced by the
+    user's QuotaLimiter (units defaults to the quota cost of the method path
+    calls). Transient failures (429, 5xx, rate-limit 403s, connection
+    errors) are retried up to settings.gmail_max_retries times with backoff,
+    honoring Retry-After; the last response is then returned, or the last
+    connection error raised.
+    """
+    settings = config.settings
+    headers = kwargs.pop("headers", {})
+    transport = get_transport()
+    limiter = get_quota_limiter(user.id)
+    units = units if units is not None else quota_units(method, path)
+    reauthorized = False
+
+    for attempt in range(settings.gmail_max_retries + 1):
+        access_token = token_manager.get_access_token(user)
+        headers["Authorization"] = f"Bearer {access_token}"
+        time.sleep(limiter.reserve(units))
+        try:
+            response = transport.send(method, path, headers=headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == settings.gmail_max_retries:
+                raise
+            time.sleep(retry_delay(attempt))
+            continue
+
+        if response.status_code == 401 and not reauthorized:
+            # Token revoked or expired early: refresh once and retry
+            reauthorized = True
+            token_manager.refresh(user.id, stale_token=access_token)
+            continue
+
+        if attempt == settings.gmail_max_retries or not is_retryable(response.status_code, response.text):
+            return response
+
+        delay = retry_delay(attempt, response.headers.get("Retry-After"))
+        if response.status_code in (403, 429):
+            # Over quota: hold back every call of this user, not just this one
+            limiter.pause(delay)
+        else:
+            time.sleep(delay)
+
+    return response
+
+
+def detached_user(user: User) -> SimpleNamespace:
+    """The user fields Gmail calls need, safe to read from a worker thread.
+
+    ORM instances expire on commit and reload through their session, which
+    must not happen from another thread.
+    """
+    return SimpleNamespace(
+        id=user.id,
+        access_token=user.access_token,
+        refresh_token=user.refresh_token,
+        token_expires_at=user.token_expires_at
+    )
 
 
-def get_emails(user: User, max_results: int = 10) -> List[Dict[str, Any]]:
-    """Fetch recent emails from user's Gmail inbox.
-
-    Retrieves unread emails from the inbox for processing. Automatically
-    refreshes OAuth tokens if expired.
+def history_params(start_history_id: str) -> Dict[str, Any]:
+    """Query parameters of the users.history.list calls of gmail_async.list_history"""
+    return {
+        "startHistoryId": start_history_id,
+        "labelId": "INBOX",
+        "historyTypes": ["messageAdded", "labelAdded", "messageDeleted"],
+        "maxResults": 500
+    }
 
-    Args:
-        user: User object with Gmail API credentials
-        max_results: Maximum number of emails to retrieve (default: 10)
 
-    Returns:
-        List of email dictionaries containing:
-        - id: Gmail message ID
-        - subject: Email subject line
-        - sender: Email sender address
-        - received_at: Email timestamp
-        - body_preview: First 200 characters of email body
-        - labels: Gmail labels applied to the email
+def collect_history(message_ids: Dict[str, None], deleted_ids: Dict[str, None], data: Dict[str, Any]):
+    """Fold one users.history.list page into the ordered sets of added and deleted message IDs"""
+    for record in data.get("history", []):
+        for added in record.get("messagesAdded", []):
+            message_ids[added["message"]["id"]] = None
+            deleted_ids.pop(added["message"]["id"], None)
+        for added in record.get("labelsAdded", []):
+            if {"INBOX", "UNREAD"} & set(added.get("labelIds", [])):
+                message_ids[added["message"]["id"]] = None
+        for deleted in record.get("messagesDeleted", []):
+            message_ids.pop(deleted["message"]["id"], None)
+            deleted_ids[deleted["message"]["id"]] = None
+
+
+def fetch_full_upfront(rules: Optional[CompiledRuleSet], match_all: bool = False) -> bool:
+    """Whether every email needs its body: no rules to plan with, or every email reaches a body rule"""
+    if rules is None:
+        return True
+    return rules.first_body_rank is not None and (match_all or rules.first_body_rank == 0)
+
+
+def message_params(format: str) -> Dict[str, Any]:
+    """Query parameters of a messages.get call in the given format"""
+    params: Dict[str, Any] = {"format": format}
+    if format == "metadata":
+        params["metadataHeaders"] = METADATA_HEADERS
+    return params
+
+
+def batch_units(message_ids: List[str]) -> int:
+    """Quota cost of a /batch call getting message_ids (each sub-request counts)"""
+    return len(message_ids) * quota_units("GET", f"{GMAIL_API_PATH}/messages/id")
+
+
+def build_message_batch(message_ids: List[str], format: str = "full") -> tuple[Dict[str, str], bytes]:
+    """Headers and multipart body of a /batch call getting message_ids"""
+    query = urlencode(message_params(format), doseq=True)
+    boundary = f"batch_{uuid.uuid4().hex}"
+    parts = []
+    for index, message_id in enumerate(message_ids):
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <item{index}>\r\n"
+            "\r\n"
+            f"GET {GMAIL_API_PATH}/messages/{message_id}?{query}\r\n"
+            "\r\n"
+        )
+    body = "".join(parts) + f"--{boundary}--\r\n"
+    return {"Content-Type": f"multipart/mixed; boundary={boundary}"}, body.encode("utf-8")
+
+
+def parse_message_batch(message_ids: List[str], content_type: str, content: bytes) -> Dict[str, PreparedEmail]:
+    """Messages of a build_message_batch response that succeeded, by ID"""
+    fetched = {}
+    for content_id, (status, payload) in parse_batch_response(content_type, content).items():
+        index = content_id.rpartition("item")[2]
+        if status != 200 or not payload or not index.isdigit() or int(index) >= len(message_ids):
+            continue
+        fetched[message_ids[int(index)]] = parse_message(payload)
+    return fetched
+
+
+def parse_batch_response(content_type: str, content: bytes) -> Dict[str, tuple[int, Any]]:
+    """Split a multipart/mixed batch response into {Content-ID: (status, JSON body)}"""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        return {}
+    delimiter = b"--" + match.group(1).encode()
+
+    responses = {}
+    for part in content.replace(b"\r\n", b"\n").split(delimiter):
+        part = part.strip()
+        if not part or part == b"--":
+            continue
+
+        part_headers, _, http_response = part.partition(b"\n\n")
+        content_id = re.search(rb"content-id:\s*<?([^>\s]+)>?", part_headers, re.IGNORECASE)
+        status_line, _, rest = http_response.partition(b"\n")
+        status = status_line.split()
+        if not content_id or len(status) < 2 or not status[1].isdigit():
+            continue
+
+        _, _, payload = rest.partition(b"\n\n")
+        try:
+            data = json.loads(payload) if payload.strip() else None
+        except ValueError:
+            data = None
+        responses[content_id.group(1).decode()] = (int(status[1]), data)
+
+    return responses
+
+
+def parse_message(message_data: Dict[str, Any]) -> PreparedEmail:
+    """Build an email record from a Gmail message resource (format=full or metadata)"""
+    # Extract headers
+    headers = {header["name"]: header["value"] for header in message_data.get("payload", {}).get("headers", [])}
 
-    Raises:
-        Exception: If Gmail API request fails or token refresh fails
+    # Extract the body text body rules match against (the preview is its start)
+    body = extract_body_text(
+        message_data.get("payload", {}),
+        max(config.settings.body_match_window, BODY_PREVIEW_LENGTH + 1)
+    )
+
+    return PreparedEmail(
+        id=message_data.get("id"),
+        subject=headers.get("Subject", ""),
+        sender=headers.get("From", ""),
+        to=headers.get("To", ""),
+        received_at=parse_date(headers.get("Date")),
+        body_preview=body[:BODY_PREVIEW_LENGTH] + "..." if len(body) > BODY_PREVIEW_LENGTH else body,
+        labels=message_data.get("labelIds", []),
+        body_text=body,
+        history_id=message_data.get("historyId")
+    )
+
+
+def apply_rule(user: User, email: Dict[str, Any], rule) -> bool:
+    """Apply a rule, or a combined set of rules, to an email.
+
+    A list of rules (e.g. every rule matching the email) is folded into one
+    action set: all tag/move labels are added and archive/mark_read remove
+    INBOX/UNREAD, in a single modify call.
     """
-    # Check if token is expired and refresh if needed
-    if is_token_expired(user):
-        refresh_access_token(user)
-
-    headers = {"Authorization": f"Bearer {user.access_token}"}
-
-    # Get message list
-    messages_url = "https://www.googleapis.com/gmail/v1/users/me/messages"
-    params = {
-        "maxResults": max_results,
-        "labelIds": ["INBOX"],
-        "q": "is:unread"  # Only get unread emails for processing
-    }
+    if isinstance(rule, (list, tuple)):
+        return apply_rules(user, email, rule)
 
-    response = requests.get(messages_url, headers=headers, params=params)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch messages: {response.text}")
+    try:
+        if rule.action_type == "tag":
+            return add_label(user, email["id"], rule.action_value)
+        elif rule.action_type == "archive":
+            return archive_email(user, email["id"])
+        elif rule.action_type == "mark_read":
+            return mark_as_read(user, email["id"])
+        elif rule.action_type == "move":
+            return move_to_folder(user, email["id"], rule.action_value)
+        return False
+    except Exception as e:
+        print(f"Error applying rule {rule.name}: {e}")
+        return False
 
-    messages_data = response.json()
-    messages = []
 
-    # Get full message details
-    for message_info in messages_data.get("messages", []):
-        message_detail = get_message_detail(user, message_info["id"])
-        if message_detail:
-            messages.append(message_detail)
+def apply_rules(user: User, email: Dict[str, Any], rules: List[Rule]) -> bool:
+    """Apply the combined actions of several rules with one modify call"""
+    try:
+        label_ids = resolve_actions(user, rules)
+        if not label_ids:
+            return False
+        return modify_message(user, email["id"], *label_ids)
+    except Exception as e:
+        print(f"Error applying rules {', '.join(rule.name for rule in rules)}: {e}")
+        return False
 
-    return messages
 
+def combine_actions(rules: List[Rule]) -> tuple[List[str], List[str]]:
+    """Fold rule actions into (label names to add, label IDs to remove)"""
+    label_names: List[str] = []
+    remove_label_ids: List[str] = []
+    for rule in rules:
+        if rule.action_type in ("tag", "move"):
+            if rule.action_value and rule.action_value not in label_names:
+                label_names.append(rule.action_value)
+        elif rule.action_type == "archive":
+            if "INBOX" not in remove_label_ids:
+                remove_label_ids.append("INBOX")
+        elif rule.action_type == "mark_read":
+            if "UNREAD" not in remove_label_ids:
+                remove_label_ids.append("UNREAD")
+    return label_names, remove_label_ids
 
-def get_message_detail(user: User, message_id: str) -> Dict[str, Any]:
-    """Get detailed message information"""
-    headers = {"Authorization": f"Bearer {user.access_token}"}
 
-    message_url = f"https://www.googleapis.com/gmail/v1/users/me/messages/{message_id}"
-    params = {"format": "full"}
+def resolve_actions(user: User, rules: List[Rule]) -> Optional[tuple[List[str], List[str]]]:
+    """Label IDs (to add, to remove) for the combined actions of rules.
 
-    response = requests.get(message_url, headers=headers, params=params)
-    if response.status_code != 200:
+    Returns None when a label cannot be resolved or there is nothing to do.
+    """
+    label_names, remove_label_ids = combine_actions(rules)
+    add_label_ids = []
+    for label_name in label_names:
+        label_id = get_or_create_label(user, label_name)
+        if not label_id:
+            return None
+        add_label_ids.append(label_id)
+
+    if not add_label_ids and not remove_label_ids:
         return None
+    return add_label_ids, remove_label_ids
 
-    message_data = response.json()
 
-    # Extract headers
-    headers = {header["name"]: header["value"] for header in message_data.get("payload", {}).get("headers", [])}
+class ActionBatch:
+    """Pending rule actions of many emails, applied with batchModify.
 
-    # Extract body (simplified)
-    body = ""
-    if "parts" in message_data.get("payload", {}):
-        for part in message_data["payload"]["parts"]:
-            if part.get("mimeType") == "text/plain":
-                body_data = part.get("body", {}).get("data", "")
-                if body_data:
-                    body = base64.urlsafe_b64decode(body_data).decode("utf-8", errors="ignore")
-                    break
+    Emails are grouped by the exact label changes their rules make, so a
+    run that tags thousands of emails with a handful of labels needs only a
+    handful of calls. A group is sent as soon as it reaches
+    BATCH_MODIFY_MAX_IDS messages; flush() sends the rest.
 
-    return {
-        "id": message_id,
-        "subject": headers.get("Subject", ""),
-        "sender": headers.get("From", ""),
-        "to": headers.get("To", ""),
-        "received_at": parse_date(headers.get("Date")),
-        "body_preview": body[:200] + "..." if len(body) > 200 else body,
-        "labels": message_data.get("labelIds", [])
-    }
+    batchModify succeeds or fails as a whole; the messages of a failed call
+    are retried one by one with modify_message so the per-message results
+    returned by flush() stay accurate.
 
+    Once cancelled (a threading.Event) is set, no further call is made and
+    the messages not yet sent are reported as failed: a batch running in a
+    thread is not stopped by cancelling the task that awaits it.
+    """
+
+    def __init__(self, user: User, max_ids: int = BATCH_MODIFY_MAX_IDS, cancelled: Optional[threading.Event] = None):
+        self.user = user
+        self.max_ids = max(1, min(max_ids, BATCH_MODIFY_MAX_IDS))
+        self.cancelled = cancelled
+        self._pending: Dict[tuple[tuple[str, ...], tuple[str, ...]], List[str]] = {}
+        self._results: Dict[str, bool] = {}
+
+    def add(self, message_id: str, rules) -> bool:
+        """Queue the actions of a rule (or list of rules) for a message.
+
+        Returns False, and records the message as failed, when the actions
+        cannot be resolved (e.g. a label could not be created).
+        """
+        if not isinstance(rules, (list, tuple)):
+            rules = [rules]
+        try:
+            label_ids = resolve_actions(self.user, rules)
+        except Exception as e:
+            print(f"Error resolving rules {', '.join(rule.name for rule in rules)}: {e}")
+            label_ids = None
+
+        if not label_ids:
+            self._results[message_id] = False
+            return False
+
+        key = (tuple(label_ids[0]), tuple(label_ids[1]))
+        message_ids = self._pending.setdefault(key, [])
+        message_ids.append(message_id)
+        if len(message_ids) >= self.max_ids:
+            self._send(key, self._pending.pop(key))
+        return True
+
+    def flush(self) -> Dict[str, bool]:
+        """Send every pending group; returns success per message added since the last flush"""
+        pending, self._pending = self._pending, {}
+        for key, message_ids in pending.items():
+            self._send(key, message_ids)
+
+        results, self._results = self._results, {}
+        return results
+
+    def _send(self, key: tuple[tuple[str, ...], tuple[str, ...]], message_ids: List[str]):
+        add_label_ids, remove_label_ids = key
+        if self._is_cancelled():
+            for message_id in message_ids:
+                self._results[message_id] = False
+            return
+
+        if batch_modify_messages(self.user, message_ids, list(add_label_ids), list(remove_label_ids)):
+            for message_id in message_ids:
+                self._results[message_id] = True
+            return
+
+        for message_id in message_ids:
+            if self._is_cancelled():
+                self._results[message_id] = False
+                continue
+            try:
+                self._results[message_id] = modify_message(
+                    self.user, message_id, list(add_label_ids), list(remove_label_ids)
+                )
+            except Exception as e:
+                print(f"Error modifying message {message_id}: {e}")
+                self._results[message_id] = False
+
+    def _is_cancelled(self) -> bool:
+        return self.cancelled is not None and self.cancelled.is_set()
+
+
+def batch_modify_messages(user: User, message_ids: List[str], add_label_ids: List[str] = None, remove_label_ids: List[str] = None) -> bool:
+    """Add and remove labels on up to BATCH_MODIFY_MAX_IDS emails with one call"""
+    data: Dict[str, Any] = {"ids": message_ids}
+    if add_label_ids:
+        data["addLabelIds"] = add_label_ids
+    if remove_label_ids:
+        data["removeLabelIds"] = remove_label_ids
 
-def apply_rule(user: User, email: Dict[str, Any], rule: Rule) -> bool:
-    """Apply a rule to an email"""
     try:
-        if rule.action_type == "tag":
-            return add_label(user, email["id"], rule.action_value)
-        elif rule.action_type == "archive":
-            return archive_email(user, email["id"])
-        elif rule.action_type == "mark_read":
-            return mark_as_read(user, email["id"])
-        elif rule.action_type == "move":
-            return move_to_folder(user, email["id"], rule.action_value)
-        return False
-    except Exception as e:
-        print(f"Error applying rule {rule.name}: {e}")
+        response = _gmail_request(user, "POST", f"{GMAIL_API_PATH}/messages/batchModify", json=data)
+    except requests.RequestException as e:
+        print(f"Gmail batchModify failed: {e}")
         return False
 
+    if response.status_code == 400 and add_label_ids:
+        # A cached label may have been deleted in Gmail: reload labels next time
+        invalidate_label_cache(user.id)
+    return response.status_code in (200, 204)
+
+
+def modify_message(user: User, message_id: str, add_label_ids: List[str] = None, remove_label_ids: List[str] = None) -> bool:
+    """Add and remove labels on an email"""
+    data = {}
+    if add_label_ids:
+        data["addLabelIds"] = add_label_ids
+    if remove_label_ids:
+        data["removeLabelIds"] = remove_label_ids
+
+    response = _gmail_request(user, "POST", f"{GMAIL_API_PATH}/messages/{message_id}/modify", json=data)
+    if response.status_code == 400 and add_label_ids:
+        # A cached label may have been deleted in Gmail: reload labels next time
+        invalidate_label_cache(user.id)
+    return response.status_code == 200
+
 
 def add_label(user: User, message_id: str, label_name: str) -> bool:
     """Add a label to an email"""
-    headers = {"Authorization": f"Bearer {user.access_token}"}
-
     # First, ensure the label exists
     label_id = get_or_create_label(user, label_name)
     if not label_id:
         return False
 
     # Add label to message
-    modify_url = f"https://www.googleapis.com/gmail/v1/users/me/messages/{message_id}/modify"
-    data = {"addLabelIds": [label_id]}
-
-    response = requests.post(modify_url, headers=headers, json=data)
-    return response.status_code == 200
+    return modify_message(user, message_id, add_label_ids=[label_id])
 
 
 def archive_email(user: User, message_id: str) -> bool:
     """Archive an email (remove from inbox)"""
-    headers = {"Authorization": f"Bearer {user.access_token}"}
-
-    modify_url = f"https://www.googleapis.com/gmail/v1/users/me/messages/{message_id}/modify"
-    data = {"removeLabelIds": ["INBOX"]}
-
-    response = requests.post(modify_url, headers=headers, json=data)
-    return response.status_code == 200
+    return modify_message(user, message_id, remove_label_ids=["INBOX"])
 
 
 def mark_as_read(user: User, message_id: str) -> bool:
     """Mark an email as read"""
-    headers = {"Authorization": f"Bearer {user.access_token}"}
-
-    modify_url = f"https://www.googleapis.com/gmail/v1/users/me/messages/{message_id}/modify"
-    data = {"removeLabelIds": ["UNREAD"]}
-
-    response = requests.post(modify_url, headers=headers, json=data)
-    return response.status_code == 200
+    return modify_message(user, message_id, remove_label_ids=["UNREAD"])
 
 
 def move_to_folder(user: User, message_id: str, folder_name: str) -> bool:
@@ -163,44 +458,93 @@ def move_to_folder(user: User, message_id: str, folder_name: str) -> bool:
 
 
 def get_or_create_label(user: User, label_name: str) -> str:
-    """Get label ID or create label if it doesn't exist"""
-    headers = {"Authorization": f"Bearer {user.access_token}"}
-
-    # Check if label exists
-    labels_url = "https://www.googleapis.com/gmail/v1/users/me/labels"
-    response = requests.get(labels_url, headers=headers)
-
-    if response.status_code == 200:
-        labels = response.json().get("labels", [])
-        for label in labels:
-            if label["name"] == label_name:
-                return label["id"]
-
-    # Create new label
-    create_url = "https://www.googleapis.com/gmail/v1/users/me/labels"
-    data = {
-        "name": label_name,
-        "labelListVisibility": "labelShow",
-        "messageListVisibility": "show"
-    }
+    """Get label ID or create label if it doesn't exist.
+
+    Rule labels are always user labels: a name Gmail reserves for a system
+    label (e.g. "Trash", which Gmail empties after 30 days) becomes the
+    namespaced label "CleanMail/Trash" (see gmail_label_name).
+
+    IDs come from the user's LabelCache, so labels.list is only called when
+    the cache is stale. Callers creating the same label concurrently wait
+    on one another and a single create call is made; a label that cannot
+    be created is not tried again until the cache is reloaded or the next
+    run (see warm_label_cache).
+    """
+    label_name = gmail_label_name(label_name)
+    cache = get_label_cache(user.id)
+    label_id = cache.get(label_name)
+    if label_id:
+        return label_id
+    if cache.failed(label_name):
+        return None
 
-    response = requests.post(create_url, headers=headers, json=data)
-    if response.status_code == 200:
-        return response.json()["id"]
+    with cache.creation_lock(label_name):
+        # Another caller may have loaded or created it while we waited
+        if not cache.fresh:
+            load_labels(user, cache)
+        label_id = cache.get(label_name)
+        if label_id or cache.failed(label_name):
+            return label_id
+
+        # Create new label
+        data = {
+            "name": label_name,
+            "labelListVisibility": "labelShow",
+            "messageListVisibility": "show"
+        }
+
+        response = _gmail_request(user, "POST", f"{GMAIL_API_PATH}/labels", json=data)
+        if response.status_code == 200:
+            label_id = response.json()["id"]
+            cache.add(label_name, label_id)
+            return label_id
+
+        if response.status_code == 409:
+            # Created by another process since the cache was loaded
+            if load_labels(user, cache):
+                label_id = cache.get(label_name)
+                if label_id:
+                    return label_id
+
+        print(f"Could not create label {label_name}: {response.status_code} {response.text[:200]}")
+        cache.mark_failed(label_name)
 
     return None
 
 
+def gmail_label_name(label_name: str) -> str:
+    """Name of the Gmail user label for a rule label, namespaced if Gmail reserves it"""
+    if label_name.casefold() in RESERVED_LABEL_NAMES:
+        return f"{LABEL_NAMESPACE}/{label_name}"
+    return label_name
+
+
+def load_labels(user: User, cache: Optional[LabelCache] = None) -> bool:
+    """(Re)load the user's label cache with one labels.list call"""
+    cache = cache or get_label_cache(user.id)
+    response = _gmail_request(user, "GET", f"{GMAIL_API_PATH}/labels")
+    if response.status_code != 200:
+        return False
+    cache.load(response.json().get("labels", []))
+    return True
+
+
+def warm_label_cache(user: User):
+    """Start of a run: load the user's labels unless the cache is still fresh, and retry failed labels"""
+    cache = get_label_cache(user.id)
+    cache.reset_failures()
+    if not cache.fresh:
+        load_labels(user, cache)
+
+
 def is_token_expired(user: User) -> bool:
     """Check if access token is expired"""
     return datetime.utcnow() >= user.token_expires_at
 
 
 def refresh_access_token(user: User):
-    """Refresh expired access token"""
-    # This would need to be implemented with proper token refresh logic
-    # For now, we'll assume tokens don't expire during development
-    pass
+    """Refresh the user's access token now (Gmail calls otherwise refresh it on demand)"""
+    token_manager.refresh(user.id, stale_token=token_manager.get_access_token(user))
 
 
 def parse_date(date_string: str) -> datetime:
@@ -0,0 +1,183 @@
+"""
+Gmail transport - Pluggable HTTP layer of every Gmail API call (live, recording, replay)
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlencode
+
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from app import config
+
+# Response headers kept in recordings (the rest are connection details)
+RECORDED_HEADERS = ("Content-Type", "Retry-After")
+
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?')
+
+
+class ReplayMissError(Exception):
+    """A replayed request has no recorded response"""
+
+
+def request_key(method: str, path: str, params: Any = None, json_body: Any = None,
+                content: Optional[bytes] = None, content_type: str = "") -> str:
+    """Stable key of a Gmail request: method, path, sorted query and body digest.
+
+    Multipart boundaries are random per call, so they are blanked out of the
+    body before hashing; the access token is not part of the key.
+    """
+    query = ""
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        query = urlencode(sorted(
+            (name, item) for name, value in items
+            for item in (value if isinstance(value, (list, tuple)) else [value])
+        ))
+
+    body = b""
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True).encode()
+    elif content:
+        body = content
+        match = _BOUNDARY.search(content_type)
+        if match:
+            body = body.replace(match.group(1).encode(), b"BOUNDARY")
+
+    digest = hashlib.sha1(body).hexdigest()[:16] if body else "-"
+    return f"{method} {path}?{query} {digest}"
+
+
+class GmailTransport:
+    """Sends Gmail API requests over the network (the "live" transport).
+
+    send() serves gmail_service (requests), send_async() serves gmail_async
+    (its pooled httpx client). path is relative to settings.gmail_api_base_url.
+    """
+
+    def send(self, method: str, path: str, **kwargs) -> requests.Response:
+        url = f"{config.settings.gmail_api_base_url}{path}"
+        return requests.request(method, url, timeout=config.settings.gmail_timeout_seconds, **kwargs)
+
+    async def send_async(self, client: httpx.AsyncClient, method: str, path: str, **kwargs) -> httpx.Response:
+        return await client.request(method, path, **kwargs)
+
+
+class RecordingTransport(GmailTransport):
+    """Live transport that appends every exchange to a JSON Lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = super().send(method, path, **kwargs)
+        self._record(method, path, kwargs, response.status_code, response.headers, response.content)
+        return response
+
+    async def send_async(self, client: httpx.AsyncClient, method: str, path: str, **kwargs) -> httpx.Response:
+        response = await super().send_async(client, method, path, **kwargs)
+        self._record(method, path, kwargs, response.status_code, response.headers, response.content)
+        return response
+
+    def _record(self, method: str, path: str, kwargs: Dict[str, Any], status: int, headers, content: bytes):
+        entry = {
+            "key": _key_of(method, path, kwargs),
+            "status": status,
+            "headers": {name: headers[name] for name in RECORDED_HEADERS if name in headers},
+            "body": content.decode("utf-8", errors="replace"),
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class ReplayTransport(GmailTransport):
+    """Serves recorded responses without touching the network.
+
+    Responses of the same request are replayed in recording order; once
+    they run out the last one is repeated. A request that was never
+    recorded raises ReplayMissError.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._responses: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._responses.setdefault(entry["key"], deque()).append(entry)
+
+    def send(self, method: str, path: str, **kwargs) -> requests.Response:
+        entry = self._next(method, path, kwargs)
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = f"{config.settings.gmail_api_base_url}{path}"
+        return response
+
+    async def send_async(self, client: httpx.AsyncClient, method: str, path: str, **kwargs) -> httpx.Response:
+        entry = self._next(method, path, kwargs)
+        return httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            content=entry["body"].encode("utf-8"),
+            request=httpx.Request(method, f"{config.settings.gmail_api_base_url}{path}")
+        )
+
+    def _next(self, method: str, path: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        key = _key_of(method, path, kwargs)
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                raise ReplayMissError(f"No recorded response for {key}")
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+
+def _key_of(method: str, path: str, kwargs: Dict[str, Any]) -> str:
+    headers = kwargs.get("headers") or {}
+    return request_key(
+        method,
+        path,
+        params=kwargs.get("params"),
+        json_body=kwargs.get("json"),
+        content=kwargs.get("content") or kwargs.get("data"),
+        content_type=headers.get("Content-Type", "")
+    )
+
+
+# Transport of the process, built from settings on first use (see get_transport)
+_transport: Optional[GmailTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> GmailTransport:
+    """The transport selected by settings.gmail_transport ("live", "record" or "replay")"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            settings = config.settings
+            if settings.gmail_transport == "record":
+                _transport = RecordingTransport(settings.gmail_recording_file)
+            elif settings.gmail_transport == "replay":
+                _transport = ReplayTransport(settings.gmail_recording_file)
+            else:
+                _transport = GmailTransport()
+        return _transport
+
+
+def set_transport(transport: Optional[GmailTransport]):
+    """Swap the transport (None: rebuild it from settings on next use)"""
+    global _transport
+    with _transport_lock:
+        _transport = transport
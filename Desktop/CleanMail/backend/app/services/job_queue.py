@@ -0,0 +1,201 @@
+"""
+Job queue - Durable email processing jobs, claimed by workers from the database
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+
+from app import config
+from app.models.processing_job import ProcessingJob
+from app.models.user import User
+
+
+class PermanentJobError(Exception):
+    """A job failure that retrying cannot fix (the job fails straight away)"""
+
+
+def enqueue_job(
+    db: Session,
+    user_id: int,
+    max_emails: int = 50,
+    stack_actions: bool = False,
+    incremental: bool = False
+) -> ProcessingJob:
+    """Queue an email processing job for a user"""
+    job = ProcessingJob(
+        user_id=user_id,
+        max_emails=max_emails,
+        stack_actions=stack_actions,
+        incremental=incremental,
+        status="queued",
+        attempts=0,
+        max_attempts=config.settings.job_max_attempts,
+        run_after=datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: int, user_id: int) -> Optional[ProcessingJob]:
+    """Get a job of a user"""
+    return db.query(ProcessingJob).filter(ProcessingJob.id == job_id, ProcessingJob.user_id == user_id).first()
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[ProcessingJob]:
+    """Claim the next due job for worker_id, if any.
+
+    Jobs run oldest first, skipping users that already have
+    settings.job_max_running_per_user jobs running. The claim is a
+    conditional UPDATE made while holding a lock on the user's row
+    (SELECT ... FOR UPDATE), so concurrent workers (threads or processes)
+    never claim the same job, and claims for one user are serialized so
+    they cannot exceed the limit together. SQLite has no row locks but
+    serializes writes, which gives the same guarantee. Running jobs whose
+    lease expired (their worker died) are requeued first.
+    """
+    settings = config.settings
+    now = datetime.utcnow()
+    requeue_expired_jobs(db, now)
+
+    running = aliased(ProcessingJob)
+    candidates = db.query(ProcessingJob.id, ProcessingJob.user_id).filter(
+        ProcessingJob.status == "queued",
+        ProcessingJob.run_after <= now
+    ).order_by(ProcessingJob.run_after, ProcessingJob.id).limit(50).all()
+
+    full_users = set()
+    for job_id, user_id in candidates:
+        if user_id in full_users:
+            continue
+        # Taken before counting the user's running jobs; released by the commit
+        db.query(User.id).filter(User.id == user_id).with_for_update().first()
+        user_running = select(func.count()).where(
+            running.user_id == user_id,
+            running.status == "running"
+        ).scalar_subquery()
+
+        claimed = db.query(ProcessingJob).filter(
+            ProcessingJob.id == job_id,
+            ProcessingJob.status == "queued",
+            user_running < settings.job_max_running_per_user
+        ).update({
+            ProcessingJob.status: "running",
+            ProcessingJob.worker_id: worker_id,
+            ProcessingJob.attempts: ProcessingJob.attempts + 1,
+            ProcessingJob.started_at: now,
+            ProcessingJob.lease_expires_at: now + timedelta(seconds=settings.job_lease_seconds)
+        }, synchronize_session=False)
+        db.commit()
+
+        if claimed:
+            return db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+        full_users.add(user_id)
+
+    return None
+
+
+def requeue_expired_jobs(db: Session, now: Optional[datetime] = None):
+    """Requeue running jobs whose lease expired, or fail them when out of attempts"""
+    now = now or datetime.utcnow()
+    expired = [
+        ProcessingJob.status == "running",
+        ProcessingJob.lease_expires_at < now
+    ]
+    db.query(ProcessingJob).filter(*expired, ProcessingJob.attempts >= ProcessingJob.max_attempts).update({
+        ProcessingJob.status: "failed",
+        ProcessingJob.error: "Worker stopped responding",
+        ProcessingJob.finished_at: now
+    }, synchronize_session=False)
+    db.query(ProcessingJob).filter(*expired).update({
+        ProcessingJob.status: "queued",
+        ProcessingJob.worker_id: None,
+        ProcessingJob.run_after: now
+    }, synchronize_session=False)
+    db.commit()
+
+
+def renew_lease(db: Session, job_id: int, worker_id: str, stats: Optional[Dict[str, Any]] = None) -> bool:
+    """Extend the lease of a running job and store its progress stats; False if the worker no longer owns it"""
+    values = {
+        ProcessingJob.lease_expires_at: datetime.utcnow() + timedelta(seconds=config.settings.job_lease_seconds)
+    }
+    if stats is not None:
+        values[ProcessingJob.stats] = json.dumps(stats)
+    renewed = db.query(ProcessingJob).filter(
+        ProcessingJob.id == job_id,
+        ProcessingJob.worker_id == worker_id,
+        ProcessingJob.status == "running"
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+
+def complete_job(
+    db: Session,
+    job_id: int,
+    worker_id: str,
+    emails_processed: int,
+    stats: Optional[Dict[str, Any]] = None
+):
+    """Mark a running job as succeeded"""
+    _finish(db, job_id, worker_id, {
+        ProcessingJob.status: "succeeded",
+        ProcessingJob.emails_processed: emails_processed,
+        ProcessingJob.stats: json.dumps(stats) if stats is not None else None,
+        ProcessingJob.error: None,
+        ProcessingJob.finished_at: datetime.utcnow()
+    })
+
+
+def fail_job(db: Session, job_id: int, worker_id: str, error: str, retry: bool = True):
+    """Record a failed attempt: requeue the job with backoff, or fail it for good.
+
+    Attempt n is retried after settings.job_retry_base_seconds * 2 ** (n - 1),
+    while attempts remain.
+    """
+    job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+    if job is None:
+        return
+
+    now = datetime.utcnow()
+    if retry and job.attempts < job.max_attempts:
+        delay = config.settings.job_retry_base_seconds * 2 ** max(job.attempts - 1, 0)
+        values = {
+            ProcessingJob.status: "queued",
+            ProcessingJob.worker_id: None,
+            ProcessingJob.run_after: now + timedelta(seconds=delay),
+            ProcessingJob.error: error
+        }
+    else:
+        values = {
+            ProcessingJob.status: "failed",
+            ProcessingJob.error: error,
+            ProcessingJob.finished_at: now
+        }
+    _finish(db, job_id, worker_id, values)
+
+
+def release_job(db: Session, job_id: int, worker_id: str):
+    """Put a running job back in the queue (its worker is shutting down)"""
+    _finish(db, job_id, worker_id, {
+        ProcessingJob.status: "queued",
+        ProcessingJob.worker_id: None,
+        ProcessingJob.attempts: ProcessingJob.attempts - 1,  # Not the job's fault
+        ProcessingJob.run_after: datetime.utcnow()
+    })
+
+
+def _finish(db: Session, job_id: int, worker_id: str, values: dict):
+    # Only the worker holding the job may settle it: after a lost lease the
+    # job may already run elsewhere
+    db.query(ProcessingJob).filter(
+        ProcessingJob.id == job_id,
+        ProcessingJob.worker_id == worker_id,
+        ProcessingJob.status == "running"
+    ).update(values, synchronize_session=False)
+    db.commit()
@@ -0,0 +1,161 @@
+"""
+Keyword matcher - Multi-keyword matching for rule keywords
+"""
+
+import re
+from typing import Dict, List, Optional, Pattern, Tuple
+
+# Matchers holding fewer keywords than this check them one by one with "in";
+# larger ones compile them into a single regex (crossover measured with
+# benchmarks/bench_rule_engine.py)
+SCAN_THRESHOLD = 24
+
+
+class KeywordMatcher:
+    """Matches the keywords of many rules against a text.
+
+    Each keyword is tagged with a rule rank (its index in priority order), so
+    a search finds the lowest rank whose keywords occur in a text, or the
+    bitmask (bit n = rank n) of every rank that does. Add all keywords, then
+    call build() before searching.
+
+    Fewer than SCAN_THRESHOLD keywords are checked one by one with "in", in
+    rank order. Larger sets are folded into one regex shaped like a trie of
+    the keywords, which the re engine runs at C speed: at each position it
+    matches the longest keyword starting there, and that keyword's mask also
+    covers every shorter keyword it starts with, so no occurrence is missed.
+    """
+
+    def __init__(self):
+        self._ranks: Dict[str, int] = {}  # Keyword -> bitmask of its ranks
+        self._scan: Optional[List[Tuple[int, int, List[str]]]] = None  # (rank, bit, keywords)
+        self._pattern: Optional[Pattern] = None
+        self._masks: Dict[str, int] = {}
+        self._best: Dict[str, int] = {}
+        self._lowest = 0
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._ranks)
+
+    def add(self, keyword: str, rank: int):
+        """Register a keyword for the rule at the given rank"""
+        if not keyword:
+            return
+        self._ranks[keyword] = self._ranks.get(keyword, 0) | 1 << rank
+        self._built = False
+
+    def build(self):
+        """Prepare the keyword scan or compile the keyword regex"""
+        self._scan = None
+        self._pattern = None
+        if not self._ranks:
+            self._built = True
+            return
+
+        all_ranks = 0
+        for ranks in self._ranks.values():
+            all_ranks |= ranks
+        self._lowest = lowest_rank(all_ranks)
+
+        if len(self._ranks) < SCAN_THRESHOLD:
+            by_rank: Dict[int, List[str]] = {}
+            for keyword, ranks in self._ranks.items():
+                while ranks:
+                    by_rank.setdefault(lowest_rank(ranks), []).append(keyword)
+                    ranks &= ranks - 1
+            self._scan = [(rank, 1 << rank, by_rank[rank]) for rank in sorted(by_rank)]
+        else:
+            # A match is the longest keyword at its position: its mask adds
+            # the keywords it starts with
+            self._masks = {}
+            for keyword in self._ranks:
+                mask = 0
+                for prefix_end in range(1, len(keyword) + 1):
+                    mask |= self._ranks.get(keyword[:prefix_end], 0)
+                self._masks[keyword] = mask
+            self._best = {keyword: lowest_rank(mask) for keyword, mask in self._masks.items()}
+            self._pattern = re.compile(_trie_pattern(self._ranks))
+        self._built = True
+
+    def find_best(self, text: str, limit: Optional[int] = None) -> Optional[int]:
+        """Return the lowest rank whose keyword occurs in text.
+
+        Ranks greater than or equal to limit are ignored; the search stops as
+        soon as the lowest registered rank is found since nothing can beat it.
+        """
+        if not self._built:
+            self.build()
+
+        if self._scan is not None:
+            for rank, _, keywords in self._scan:
+                if limit is not None and rank >= limit:
+                    break
+                for keyword in keywords:
+                    if keyword in text:
+                        return rank
+            return None
+
+        if self._pattern is None:
+            return None
+        best = limit
+        best_of = self._best
+        search = self._pattern.search
+        match = search(text)
+        while match:
+            rank = best_of[match.group()]
+            if best is None or rank < best:
+                best = rank
+                if best == self._lowest:
+                    break
+            match = search(text, match.start() + 1)
+        return best if best != limit else None
+
+    def find_mask(self, text: str) -> int:
+        """Return the bitmask of every rank whose keyword occurs in text"""
+        if not self._built:
+            self.build()
+
+        mask = 0
+        if self._scan is not None:
+            for _, bit, keywords in self._scan:
+                for keyword in keywords:
+                    if keyword in text:
+                        mask |= bit
+                        break
+            return mask
+
+        if self._pattern is None:
+            return mask
+        masks = self._masks
+        search = self._pattern.search
+        match = search(text)
+        while match:
+            mask |= masks[match.group()]
+            match = search(text, match.start() + 1)
+        return mask
+
+
+def _trie_pattern(keywords) -> str:
+    """Regex alternation of keywords with shared prefixes factored out, longest match first"""
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End of a keyword
+
+    def branch(node: dict) -> str:
+        alternatives = [re.escape(char) + branch(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        pattern = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+        # A keyword ending here is tried after the longer ones
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return branch(trie)
+
+
+def lowest_rank(mask: int) -> int:
+    """Return the lowest rank set in a non-zero rank bitmask"""
+    return (mask & -mask).bit_length() - 1
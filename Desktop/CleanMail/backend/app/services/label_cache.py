@@ -0,0 +1,111 @@
+"""
+Label cache - Per-user Gmail label name to ID mapping
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app import config
+
+
+class LabelCache:
+    """A user's Gmail user labels by name, loaded from labels.list.
+
+    The whole mapping expires ttl_seconds after it was loaded (or on
+    invalidate()); get() returns None for a stale cache so callers reload
+    it. Gmail label names are case-insensitive, and so are lookups.
+    creation_lock(name) hands out one lock per label name so concurrent
+    callers creating the same label can collapse into a single API call.
+
+    Names that could not be created are remembered (mark_failed) until the
+    next reset_failures() or reload, so a run does not retry them for
+    every email.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._labels: Dict[str, str] = {}  # Casefolded name -> ID
+        self._failed: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._creation_locks: Dict[str, threading.Lock] = {}
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the labels were loaded less than ttl_seconds ago"""
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def get(self, label_name: str) -> Optional[str]:
+        """Cached label ID, or None if unknown or the cache is stale"""
+        if not self.fresh:
+            return None
+        return self._labels.get(label_name.casefold())
+
+    def load(self, labels: List[Dict[str, Any]]):
+        """Replace the cache with the user labels of a labels.list response"""
+        with self._lock:
+            # System labels (INBOX, TRASH, ...) are never rule labels
+            self._labels = {
+                label["name"].casefold(): label["id"]
+                for label in labels
+                if label.get("type") != "system"
+            }
+            self._failed = set()
+            self._loaded_at = time.monotonic()
+
+    def add(self, label_name: str, label_id: str):
+        """Remember a label created after the cache was loaded"""
+        with self._lock:
+            self._labels[label_name.casefold()] = label_id
+
+    def mark_failed(self, label_name: str):
+        """Remember that a label could not be created"""
+        with self._lock:
+            self._failed.add(label_name.casefold())
+
+    def failed(self, label_name: str) -> bool:
+        """Whether creating the label already failed"""
+        return label_name.casefold() in self._failed
+
+    def reset_failures(self):
+        """Let labels that failed to be created be tried again"""
+        with self._lock:
+            self._failed = set()
+
+    def invalidate(self):
+        """Force the next lookup to reload the labels"""
+        with self._lock:
+            self._loaded_at = None
+
+    def creation_lock(self, label_name: str) -> threading.Lock:
+        """Lock serializing the lookup-or-create of one label name"""
+        label_name = label_name.casefold()
+        with self._lock:
+            lock = self._creation_locks.get(label_name)
+            if lock is None:
+                lock = self._creation_locks[label_name] = threading.Lock()
+            return lock
+
+
+# Per-user label caches, keyed by user ID
+_label_caches: Dict[int, LabelCache] = {}
+_label_caches_lock = threading.Lock()
+
+
+def get_label_cache(user_id: int) -> LabelCache:
+    """Get (or create) the label cache of a user"""
+    with _label_caches_lock:
+        cache = _label_caches.get(user_id)
+        if cache is None:
+            cache = _label_caches[user_id] = LabelCache(config.settings.label_cache_ttl_seconds)
+        return cache
+
+
+def invalidate_label_cache(user_id: int):
+    """Drop a user's cached labels (e.g. after labels were edited in Gmail)"""
+    with _label_caches_lock:
+        cache = _label_caches.get(user_id)
+    if cache is not None:
+        cache.invalidate()
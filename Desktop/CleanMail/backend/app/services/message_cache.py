@@ -0,0 +1,115 @@
+"""
+Message cache - Parsed Gmail message content persisted per user and message ID
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import config
+from app.database import SessionLocal
+from app.models.cached_message import CachedMessage
+from app.services.prepared_email import PreparedEmail
+
+# Fields that never change once a message exists in Gmail. Labels (and the
+# message historyId) do change, so they are never cached.
+CACHED_FIELDS = ("subject", "sender", "to", "received_at", "body_preview", "body_text")
+
+
+def get_cached_messages(user_id: int, message_ids: List[str]) -> Dict[str, PreparedEmail]:
+    """Cached full messages of message_ids, by message ID, without labels.
+
+    Only headers and body are cached; callers take labels from a fresh
+    Gmail response. Entries older than settings.message_cache_ttl_seconds
+    are ignored.
+    """
+    if not config.settings.message_cache_enabled or not message_ids:
+        return {}
+
+    db = SessionLocal()
+    try:
+        rows = db.query(CachedMessage).filter(
+            CachedMessage.user_id == user_id,
+            CachedMessage.gmail_message_id.in_(message_ids),
+            CachedMessage.cached_at >= _expiry()
+        ).all()
+        return {row.gmail_message_id: _load(row) for row in rows}
+    finally:
+        db.close()
+
+
+def cache_messages(user_id: int, messages: List[PreparedEmail]):
+    """Store the content of freshly fetched full messages.
+
+    Expired entries are dropped, and the user's oldest entries past
+    settings.message_cache_max_messages are evicted.
+    """
+    if not config.settings.message_cache_enabled or not messages:
+        return
+
+    db = SessionLocal()
+    try:
+        user_rows = db.query(CachedMessage).filter(CachedMessage.user_id == user_id)
+        user_rows.filter(CachedMessage.cached_at < _expiry()).delete(synchronize_session=False)
+
+        existing = {
+            message_id
+            for (message_id,) in db.query(CachedMessage.gmail_message_id).filter(
+                CachedMessage.user_id == user_id,
+                CachedMessage.gmail_message_id.in_([message.id for message in messages])
+            )
+        }
+        for message in messages:
+            if message.id not in existing:
+                existing.add(message.id)
+                db.add(CachedMessage(user_id=user_id, gmail_message_id=message.id, data=_dump(message)))
+        db.flush()
+
+        overflow = select(CachedMessage.id).where(
+            CachedMessage.user_id == user_id
+        ).order_by(CachedMessage.id.desc()).offset(config.settings.message_cache_max_messages)
+        user_rows.filter(CachedMessage.id.in_(overflow)).delete(synchronize_session=False)
+        db.commit()
+    except SQLAlchemyError as e:
+        # The cache is best effort (e.g. a concurrent fetch cached the same message)
+        db.rollback()
+        print(f"Error caching messages: {e}")
+    finally:
+        db.close()
+
+
+def invalidate_messages(user_id: int, message_ids: List[str]):
+    """Drop cached messages deleted from Gmail"""
+    if not config.settings.message_cache_enabled or not message_ids:
+        return
+
+    db = SessionLocal()
+    try:
+        db.query(CachedMessage).filter(
+            CachedMessage.user_id == user_id,
+            CachedMessage.gmail_message_id.in_(message_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _expiry() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=config.settings.message_cache_ttl_seconds)
+
+
+def _dump(message: PreparedEmail) -> str:
+    data: Dict[str, Any] = {field: getattr(message, field) for field in CACHED_FIELDS}
+    if data["received_at"] is not None:
+        data["received_at"] = data["received_at"].isoformat()
+    return json.dumps(data)
+
+
+def _load(row: CachedMessage) -> PreparedEmail:
+    data = json.loads(row.data)
+    if data.get("received_at"):
+        data["received_at"] = datetime.fromisoformat(data["received_at"])
+    return PreparedEmail(id=row.gmail_message_id, **data)
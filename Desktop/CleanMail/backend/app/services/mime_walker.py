@@ -0,0 +1,140 @@
+"""
+MIME walker - Find and decode the readable text of a Gmail message payload
+"""
+
+import base64
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterator, Optional
+
+# Base64 characters decoded per step (a multiple of 4: 3 bytes per 4 characters)
+_DECODE_STEP = 4 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def extract_body_text(payload: Dict[str, Any], max_chars: int) -> str:
+    """Up to max_chars of readable body text from a Gmail message payload.
+
+    Walks nested multipart parts for the best text part: the first
+    text/plain part, else the first text/html part with its tags stripped.
+    Only as much base64 data as the text prefix needs is decoded, and
+    attachments (parts with a filename or an attachmentId) are never read.
+    """
+    plain, html = _find_text_parts(payload)
+    if plain is not None:
+        return _decode_plain(plain["body"]["data"], plain, max_chars)
+    if html is not None:
+        return _decode_html(html["body"]["data"], html, max_chars)
+    return ""
+
+
+def _find_text_parts(payload: Dict[str, Any]) -> tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """First inline text/plain and text/html parts, depth first.
+
+    A part with sub-parts is treated as a container whatever its mimeType.
+    """
+    plain = html = None
+    stack = [payload]
+    while stack and plain is None:
+        part = stack.pop()
+        mime_type = (part.get("mimeType") or "").lower()
+        # Some payloads carry parts without a multipart mimeType (or none at
+        # all); descend into any part that has children
+        if mime_type.startswith("multipart/") or part.get("parts"):
+            stack.extend(reversed(part.get("parts", [])))
+            continue
+        if not _is_inline_text(part):
+            continue
+        if mime_type == "text/plain":
+            plain = part
+        elif mime_type == "text/html" and html is None:
+            html = part
+    return plain, html
+
+
+def _is_inline_text(part: Dict[str, Any]) -> bool:
+    body = part.get("body", {})
+    return not part.get("filename") and not body.get("attachmentId") and bool(body.get("data"))
+
+
+def _charset(part: Dict[str, Any]) -> str:
+    """Charset from the part's Content-Type header, defaulting to UTF-8"""
+    for header in part.get("headers", []):
+        if header.get("name", "").lower() == "content-type":
+            match = re.search(r'charset="?([\w.:-]+)', header.get("value", ""), re.IGNORECASE)
+            if match:
+                try:
+                    return codecs.lookup(match.group(1)).name
+                except LookupError:
+                    break
+    return "utf-8"
+
+
+def _iter_decoded(data: str, part: Dict[str, Any]) -> Iterator[str]:
+    """Decode base64url data step by step into text"""
+    decoder = codecs.getincrementaldecoder(_charset(part))(errors="ignore")
+    data = data.strip()
+    for start in range(0, len(data), _DECODE_STEP):
+        chunk = data[start:start + _DECODE_STEP]
+        chunk += "=" * (-len(chunk) % 4)
+        try:
+            raw = base64.urlsafe_b64decode(chunk)
+        except (ValueError, TypeError):
+            return
+        yield decoder.decode(raw)
+    yield decoder.decode(b"", final=True)
+
+
+def _decode_plain(data: str, part: Dict[str, Any], max_chars: int) -> str:
+    text = ""
+    for piece in _iter_decoded(data, part):
+        text += piece
+        if len(text) >= max_chars:
+            break
+    return text[:max_chars]
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document"""
+
+    SKIPPED_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.length = 0
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag in ("br", "p", "div", "tr", "li"):
+            self._add(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self._add(data)
+
+    def _add(self, text: str):
+        self.pieces.append(text)
+        self.length += len(text)
+
+    def text(self) -> str:
+        return _WHITESPACE.sub(" ", "".join(self.pieces)).strip()
+
+
+def _decode_html(data: str, part: Dict[str, Any], max_chars: int) -> str:
+    extractor = _TextExtractor()
+    for piece in _iter_decoded(data, part):
+        extractor.feed(piece)
+        # Whitespace collapses, so keep some slack before stopping
+        if extractor.length >= 2 * max_chars and len(extractor.text()) >= max_chars:
+            break
+    extractor.close()
+    return extractor.text()[:max_chars]
@@ -0,0 +1,158 @@
+"""
+Pipeline - Concurrent asyncio stages connected by bounded queues, with per-stage stats
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# End of stream marker passed down the queues
+_DONE = object()
+
+
+class StageStats:
+    """Counters of one pipeline stage.
+
+    busy_seconds is time spent working on batches, starved_seconds waiting
+    for input (upstream is slower) and blocked_seconds waiting for room in
+    the output queue (downstream is slower). Queue depth is the input queue
+    of the stage, sampled whenever it takes a batch.
+    """
+
+    __slots__ = (
+        "name", "batches", "items", "busy_seconds", "starved_seconds", "blocked_seconds",
+        "queue", "depth_samples", "depth_total", "depth_max"
+    )
+
+    def __init__(self, name: str, queue: Optional[asyncio.Queue] = None):
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.queue = queue
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def sample_depth(self):
+        depth = self.queue.qsize()
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "items_per_sec": round(self.items / self.busy_seconds, 1) if self.busy_seconds else None,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "starved_seconds": round(self.starved_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "queue_depth": self.queue.qsize() if self.queue is not None else None,
+            "avg_queue_depth": round(self.depth_total / self.depth_samples, 2) if self.depth_samples else None,
+            "max_queue_depth": self.depth_max if self.queue is not None else None,
+        }
+
+
+class Pipeline:
+    """Runs a source and a chain of stages concurrently.
+
+    Each stage is an async function taking the batch produced upstream and
+    returning the batch for the next stage (len() of a batch is its item
+    count). Stages are connected by queues of queue_size batches, so a slow
+    stage holds back the ones before it instead of letting batches pile up
+    in memory. An error in any stage cancels the others and is raised by
+    run().
+    """
+
+    def __init__(self, queue_size: int = 4):
+        self.queue_size = queue_size
+        self._stats: List[StageStats] = []
+        self._started: Optional[float] = None
+        self._elapsed: Optional[float] = None
+
+    async def run(
+        self,
+        source: AsyncIterator[Any],
+        stages: List[Tuple[str, Callable[[Any], Awaitable[Any]]]],
+        source_name: str = "source"
+    ):
+        """Feed every batch of source through the stages, in order"""
+        queues = [asyncio.Queue(self.queue_size) for _ in stages]
+        self._stats = [StageStats(source_name)] + [StageStats(name, queue) for (name, _), queue in zip(stages, queues)]
+        self._started = time.perf_counter()
+        self._elapsed = None
+
+        tasks = [asyncio.create_task(self._produce(source, queues[0], self._stats[0]))]
+        for index, (_, function) in enumerate(stages):
+            output = queues[index + 1] if index + 1 < len(queues) else None
+            tasks.append(asyncio.create_task(
+                self._consume(function, queues[index], output, self._stats[index + 1])
+            ))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._elapsed = time.perf_counter() - self._started
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage stats (so far, while running) and the busiest stage"""
+        stages = {stats.name: stats.snapshot() for stats in self._stats}
+        elapsed = self._elapsed
+        if elapsed is None and self._started is not None:
+            elapsed = time.perf_counter() - self._started
+        busiest = max(self._stats, key=lambda stats: stats.busy_seconds, default=None)
+        return {
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "bottleneck": busiest.name if busiest and busiest.busy_seconds else None,
+            "stages": stages,
+        }
+
+    async def _produce(self, source: AsyncIterator[Any], output: asyncio.Queue, stats: StageStats):
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = await source.__anext__()
+            except StopAsyncIteration:
+                break
+            stats.busy_seconds += time.perf_counter() - started
+            _count(stats, batch)
+            await _put(output, batch, stats)
+        await output.put(_DONE)
+
+    async def _consume(self, function, input: asyncio.Queue, output: Optional[asyncio.Queue], stats: StageStats):
+        while True:
+            started = time.perf_counter()
+            batch = await input.get()
+            stats.starved_seconds += time.perf_counter() - started
+            if batch is _DONE:
+                break
+            stats.sample_depth()
+
+            started = time.perf_counter()
+            result = await function(batch)
+            stats.busy_seconds += time.perf_counter() - started
+            _count(stats, batch)
+            if output is not None:
+                await _put(output, result, stats)
+
+        if output is not None:
+            await output.put(_DONE)
+
+
+async def _put(queue: asyncio.Queue, batch: Any, stats: StageStats):
+    started = time.perf_counter()
+    await queue.put(batch)
+    stats.blocked_seconds += time.perf_counter() - started
+
+
+def _count(stats: StageStats, batch: Any):
+    stats.batches += 1
+    stats.items += len(batch)
@@ -0,0 +1,153 @@
+"""
+Prepared email records - Compact, pre-normalized emails for rule matching
+"""
+
+import re
+import unicodedata
+from datetime import datetime
+from email.utils import parseaddr
+from typing import Any, Dict, List, Optional
+
+# The usual From header shapes: "Name <address>" and a bare address
+_ANGLE_ADDRESS = re.compile(r"<([^<>\s@]+@[^<>\s@]+)>\s*$")
+_BARE_ADDRESS = re.compile(r"\s*([^<>\s@\"(),:;]+@[^<>\s@\"(),:;]+)\s*$")
+
+
+class _CombiningMarks(dict):
+    """str.translate table deleting combining marks, filled in as characters show up"""
+
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        value = None if unicodedata.combining(chr(codepoint)) else codepoint
+        self[codepoint] = value
+        return value
+
+
+_STRIP_COMBINING = _CombiningMarks()
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Casefold text and strip accents so "Boletín" and "boletin" compare equal"""
+    if not text:
+        return ""
+    if text.isascii():
+        # Nothing to decompose, and casefold() is lower() for ASCII
+        return text.lower()
+    return unicodedata.normalize("NFKD", text.casefold()).translate(_STRIP_COMBINING)
+
+
+def parse_sender(sender: Optional[str]) -> tuple[str, str]:
+    """Extract the lowercase (address, domain) from a From header value"""
+    sender = sender or ""
+    match = _ANGLE_ADDRESS.search(sender) or _BARE_ADDRESS.match(sender)
+    address = match.group(1) if match else parseaddr(sender)[1].strip()
+    address = address.lower()
+    domain = address.rpartition("@")[2] if "@" in address else ""
+    return address, domain
+
+
+class PreparedEmail:
+    """A fetched email with its match targets normalized once.
+
+    Keeps the raw fields returned by the Gmail service (readable with
+    email["id"] / email.get("subject") like the old dict records) plus the
+    casefolded, accent-stripped versions keyword rules match against and the
+    parsed sender address and domain.
+
+    Body rules match body_text, the decoded body window (see
+    settings.body_match_window), which defaults to body_preview.
+    history_id is the Gmail historyId of the message when it was fetched.
+    """
+
+    FIELDS = ("id", "subject", "sender", "to", "received_at", "body_preview", "labels")
+
+    __slots__ = FIELDS + (
+        "body_text", "history_id", "sender_norm", "subject_norm", "body_norm", "sender_address", "sender_domain",
+        "_header_norm", "_regex_target"
+    )
+
+    def __init__(
+        self,
+        id: Optional[str] = None,
+        subject: str = "",
+        sender: str = "",
+        to: str = "",
+        received_at: Optional[datetime] = None,
+        body_preview: str = "",
+        labels: Optional[List[str]] = None,
+        body_text: Optional[str] = None,
+        history_id: Optional[str] = None
+    ):
+        self.id = id
+        self.subject = subject or ""
+        self.sender = sender or ""
+        self.to = to or ""
+        self.received_at = received_at
+        self.body_preview = body_preview or ""
+        self.labels = labels or []
+        self.body_text = body_text or self.body_preview
+        self.history_id = history_id
+
+        self.sender_norm = normalize_text(self.sender)
+        self.subject_norm = normalize_text(self.subject)
+        self.body_norm = normalize_text(self.body_text)
+
+        self.sender_address, self.sender_domain = parse_sender(self.sender)
+
+        self._header_norm = None
+        self._regex_target = None
+
+    @classmethod
+    def from_dict(cls, email: Dict[str, Any]) -> "PreparedEmail":
+        """Build a prepared email from a plain email dictionary"""
+        return cls(**{field: email.get(field) for field in cls.FIELDS if field in email})
+
+    @property
+    def header_norm(self) -> str:
+        """Normalized sender, recipients and subject, for header rules"""
+        if self._header_norm is None:
+            self._header_norm = f"{self.sender_norm} {normalize_text(self.to)} {self.subject_norm}"
+        return self._header_norm
+
+    @property
+    def regex_target(self) -> str:
+        """Raw combined content regex rules are matched against"""
+        if self._regex_target is None:
+            self._regex_target = f"{self.sender} {self.subject} {self.body_text}"
+        return self._regex_target
+
+    def keyword_target(self, match_type: str) -> str:
+        """Normalized target for keyword rules of the given match type"""
+        if match_type == "sender":
+            return self.sender_norm
+        elif match_type == "subject":
+            return self.subject_norm
+        elif match_type == "body":
+            return self.body_norm
+        elif match_type == "header":
+            return self.header_norm
+        return ""
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Read a raw field, dict style"""
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Raw fields as a dictionary (API responses)"""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def prepare_email(email) -> PreparedEmail:
+    """Return the email as a PreparedEmail, converting plain dictionaries"""
+    if isinstance(email, PreparedEmail):
+        return email
+    return PreparedEmail.from_dict(email)
@@ -3,43 +3,762 @@ Rule engine - Match emails against rules and determine actions
 """
 
 import re
-from typing import Dict, Any, Optional
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, Optional, Pattern, Sequence
+import regex
+from sqlalchemy.orm import Session
+from app import config
 from app.models.rule import Rule
+from app.services.keyword_matcher import KeywordMatcher, lowest_rank
+from app.services.prepared_email import PreparedEmail, normalize_text, parse_sender, prepare_email
+from app.models.user import User
+from app.services.rule_profiler import RuleSetCounters, load_rule_profile, save_rule_profile
 
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
 
-def find_matching_rule(email: Dict[str, Any], rules: list[Rule]) -> Optional[Rule]:
+# Non-regex rules hold several keywords separated by "|" (e.g. "noreply|no-reply")
+KEYWORD_SEPARATOR = "|"
+
+MATCH_TYPES = ["sender", "subject", "body", "regex", "header"]
+
+# Match types that look at the message body (regex rules match sender, subject and body)
+BODY_MATCH_TYPES = ("body", "regex")
+
+# Sender keywords marked with EXACT_PREFIX ("=bob@example.com", "=example.com")
+# are matched exactly against the parsed sender address or domain; domains
+# cover their subdomains. Unmarked keywords, domain-shaped or not, match
+# anywhere in the sender.
+EXACT_PREFIX = "="
+_ADDRESS_KEYWORD = re.compile(r"^[^@\s]+@[a-z0-9-]+(\.[a-z0-9-]+)+$")
+_DOMAIN_KEYWORD = re.compile(r"^@?[a-z0-9-]+(\.[a-z0-9-]+)+$")
+
+# Repeats allowing more than this many iterations count as unbounded when
+# looking for nested quantifiers
+_MAX_SAFE_REPEAT = 10
+
+
+class CompiledRule:
+    """Snapshot of a Rule with its match pattern compiled once.
+
+    Only plain column values are copied so a compiled rule set can outlive the
+    database session that loaded it. Exposes the same attributes the Gmail
+    service and the email log use (id, name, action_type, action_value...).
+    """
+
+    __slots__ = (
+        "id", "name", "match_type", "match_value", "action_type",
+        "action_value", "priority", "position", "keywords", "pattern",
+        "addresses", "domains", "unsafe"
+    )
+
+    def __init__(self, rule: Rule, position: int):
+        self.id = rule.id
+        self.name = rule.name
+        self.match_type = rule.match_type
+        self.match_value = rule.match_value
+        self.action_type = rule.action_type
+        self.action_value = rule.action_value
+        self.priority = rule.priority or 0
+        self.position = position  # Index in the sequence the set was built from
+        self.keywords = split_keywords(rule.match_value) if rule.match_type != "regex" else []
+        self.addresses = frozenset()
+        self.domains = frozenset()
+        if rule.match_type == "sender":
+            self.keywords, self.addresses, self.domains = split_sender_keywords(rule.match_value or "")
+        # Regexes are checked again on load: rules saved before the check (or
+        # by older versions of it) must not reach the matcher
+        self.unsafe = check_regex_complexity(rule.match_value or "") if rule.match_type == "regex" else []
+        self.pattern = None if self.unsafe else compile_match_pattern(rule.match_type, rule.match_value or "")
+
+    @property
+    def can_match(self) -> bool:
+        """False for rules that can never match (invalid regex, no keywords)"""
+        return self.pattern is not None or bool(self.addresses or self.domains)
+
+    def matches(self, email: Dict[str, Any]) -> bool:
+        """Check if an email matches this rule"""
+        if (self.addresses or self.domains) and _sender_keys_match(self.addresses, self.domains, email):
+            return True
+        return _pattern_matches(self.pattern, self.match_type, email)
+
+
+class SenderIndex:
+    """Hash index from exact sender addresses and domains to rule ranks.
+
+    Lets sender rules listing addresses or domains (block/allow lists) match
+    in constant time, whatever the number of entries. Each key maps to the
+    bitmask of the ranks listing it.
+    """
+
+    def __init__(self):
+        self.addresses: Dict[str, int] = {}
+        self.domains: Dict[str, int] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.addresses or self.domains)
+
+    def add(self, rank: int, addresses, domains):
+        """Index a rule's addresses and domains"""
+        bit = 1 << rank
+        for address in addresses:
+            self.addresses[address] = self.addresses.get(address, 0) | bit
+        for domain in domains:
+            self.domains[domain] = self.domains.get(domain, 0) | bit
+
+    def lookup_mask(self, address: str, domain: str) -> int:
+        """Return the bitmask of ranks indexed for the address or its domain"""
+        mask = self.addresses.get(address, 0) if address else 0
+        while domain:
+            mask |= self.domains.get(domain, 0)
+            domain = domain.partition(".")[2]
+        return mask
+
+    def lookup(self, address: str, domain: str) -> Optional[int]:
+        """Return the lowest rank indexed for the address or its domain"""
+        mask = self.lookup_mask(address, domain)
+        return lowest_rank(mask) if mask else None
+
+
+class CompiledRuleSet:
+    """A user's active rules, sorted by priority and compiled for matching.
+
+    Build it once per rule-set version (see get_compiled_rules) and reuse it
+    for every email of a processing run. Keywords of all non-regex rules that
+    look at the same field share one KeywordMatcher, so each field is
+    searched once per email however many rules there are. Sender addresses and
+    domains are looked up in a SenderIndex first, and the keyword and regex
+    rules are only tried while they could still beat the best hit so far.
+
+    Every regex search is stopped after settings.regex_time_budget_ms (the
+    regex module's timeout). A rule whose searches hit the budget
+    settings.regex_budget_overruns times is skipped for the rest of the run
+    and listed in self.disabled (rank -> number of searches stopped) for
+    the caller to disable (see disable_slow_rules). Regex rules failing
+    check_regex_complexity never run; they are listed in self.unsafe
+    (rank -> reasons).
+
+    Evaluations are counted in self.counters (see rule_profiler); one email
+    every settings.rule_profile_sample_every also gets each rule it reached
+    timed individually.
+
+    self.first_body_rank is the rank of the first rule that looks at the
+    body (None when no rule does); with needs_body it lets the Gmail service
+    fetch headers only and download bodies just for the emails that need it.
+    """
+
+    def __init__(self, rules: Sequence[Rule]):
+        # Stable sort keeps insertion order for rules sharing a priority
+        ordered = sorted(enumerate(rules), key=lambda item: item[1].priority or 0)
+        self.rules = [CompiledRule(rule, position) for position, rule in ordered]
+
+        self.disabled: Dict[int, int] = {}
+        self.overruns: Dict[int, int] = {}  # Rank -> searches stopped at the time budget
+        self.unsafe = {rank: rule.unsafe for rank, rule in enumerate(self.rules) if rule.unsafe}
+        self.regex_timeout = config.settings.regex_time_budget_ms / 1000
+        self.regex_budget_overruns = config.settings.regex_budget_overruns
+        self.sender_index = SenderIndex()
+        self.keyword_matchers: Dict[str, KeywordMatcher] = {}
+        self.regex_ranks: list[int] = []
+        for rank, rule in enumerate(self.rules):
+            if not rule.can_match or rule.match_type not in MATCH_TYPES:
+                continue
+            if rule.match_type == "regex":
+                self.regex_ranks.append(rank)
+                continue
+            if rule.addresses or rule.domains:
+                self.sender_index.add(rank, rule.addresses, rule.domains)
+            if not rule.keywords:
+                continue
+            matcher = self.keyword_matchers.setdefault(rule.match_type, KeywordMatcher())
+            for keyword in rule.keywords:
+                matcher.add(keyword, rank)
+
+        for matcher in self.keyword_matchers.values():
+            matcher.build()
+        self._all_regex_ranks = list(self.regex_ranks)
+
+        self.first_body_rank = next(
+            (rank for rank, rule in enumerate(self.rules)
+             if rule.can_match and rule.match_type in BODY_MATCH_TYPES),
+            None
+        )
+
+        self.counters = RuleSetCounters(
+            [rule.id for rule in self.rules],
+            sample_every=config.settings.rule_profile_sample_every
+        )
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def begin_run(self):
+        """Forget the overruns of earlier runs and re-enable skipped regex rules"""
+        self.disabled = {}
+        self.overruns = {}
+        self.regex_ranks = list(self._all_regex_ranks)
+
+    def needs_body(self, email: Dict[str, Any], match_all: bool = False) -> bool:
+        """Whether matching an email fetched without its body needs the body.
+
+        True unless a header rule ranked above every body/regex rule already
+        matches (first-match evaluation); always True for all-matches
+        evaluation when any body/regex rule exists. Nothing is recorded.
+        """
+        if self.first_body_rank is None:
+            return False
+        if match_all or self.first_body_rank == 0:
+            return True
+
+        email = prepare_email(email)
+        best = None
+        if self.sender_index:
+            best = self.sender_index.lookup(email.sender_address, email.sender_domain)
+        for match_type, matcher in self.keyword_matchers.items():
+            if match_type == "body":
+                continue
+            match_target = email.keyword_target(match_type)
+            if match_target:
+                rank = matcher.find_best(match_target, best)
+                if rank is not None:
+                    best = rank
+        return best is None or best > self.first_body_rank
+
+    def match_index(self, email: Dict[str, Any]) -> Optional[int]:
+        """Return the index (in self.rules) of the first matching rule"""
+        email = prepare_email(email)
+        rank = self._match_index(email)
+        self._record(email, rank)
+        return rank
+
+    def _match_index(self, email: PreparedEmail) -> Optional[int]:
+        best = None
+        if self.sender_index:
+            best = self.sender_index.lookup(email.sender_address, email.sender_domain)
+            if best == 0:
+                return best
+
+        for match_type, matcher in self.keyword_matchers.items():
+            match_target = email.keyword_target(match_type)
+            if not match_target:
+                continue
+            rank = matcher.find_best(match_target, best)
+            if rank is not None:
+                best = rank
+                if best == 0:
+                    return best
+
+        for rank in self.regex_ranks:
+            if best is not None and rank > best:
+                break
+            if self._search_regex(rank, email.regex_target):
+                return rank
+        return best
+
+    def match_batch(self, emails: Sequence[Dict[str, Any]]) -> list[Optional[int]]:
+        """Return the index (in self.rules) of the first matching rule per email.
+
+        Works column-wise: each match target is extracted once per email, each
+        field matcher sweeps its column, then each regex rule sweeps the
+        combined-content column for the emails it can still win.
+        """
+        emails = [prepare_email(email) for email in emails]
+        if self.sender_index:
+            lookup = self.sender_index.lookup
+            best = [lookup(email.sender_address, email.sender_domain) for email in emails]
+        else:
+            best: list[Optional[int]] = [None] * len(emails)
+
+        for match_type, matcher in self.keyword_matchers.items():
+            column = [email.keyword_target(match_type) for email in emails]
+            for i, match_target in enumerate(column):
+                if not match_target or best[i] == 0:
+                    continue
+                rank = matcher.find_best(match_target, best[i])
+                if rank is not None:
+                    best[i] = rank
+
+        if self.regex_ranks:
+            column = [email.regex_target for email in emails]
+            for rank in list(self.regex_ranks):
+                for i, match_target in enumerate(column):
+                    if rank in self.disabled:
+                        break
+                    if (best[i] is None or rank < best[i]) and self._search_regex(rank, match_target):
+                        best[i] = rank
+
+        for email, rank in zip(emails, best):
+            self._record(email, rank)
+        return best
+
+    def _search_regex(self, rank: int, match_target: str) -> bool:
+        """Run a regex rule within the time budget, skipping it for the run once it keeps hitting it"""
+        try:
+            return self.rules[rank].pattern.search(match_target, timeout=self.regex_timeout) is not None
+        except TimeoutError:
+            overruns = self.overruns[rank] = self.overruns.get(rank, 0) + 1
+            if overruns >= self.regex_budget_overruns:
+                self.disabled[rank] = overruns
+                self.regex_ranks = [other for other in self.regex_ranks if other != rank]
+            return False
+
+    def match(self, email: Dict[str, Any]) -> Optional[CompiledRule]:
+        """Return the first matching compiled rule, if any"""
+        index = self.match_index(email)
+        return self.rules[index] if index is not None else None
+
+    def match_all(self, email: Dict[str, Any]) -> int:
+        """Return the bitmask (bit n = self.rules[n]) of every matching rule"""
+        email = prepare_email(email)
+        mask = 0
+        if self.sender_index:
+            mask = self.sender_index.lookup_mask(email.sender_address, email.sender_domain)
+
+        for match_type, matcher in self.keyword_matchers.items():
+            match_target = email.keyword_target(match_type)
+            if match_target:
+                mask |= matcher.find_mask(match_target)
+
+        if self.regex_ranks:
+            match_target = email.regex_target
+            for rank in list(self.regex_ranks):
+                if self._search_regex(rank, match_target):
+                    mask |= 1 << rank
+
+        self._record(email, None, mask)
+        return mask
+
+    def _record(self, email: PreparedEmail, rank: Optional[int], mask: Optional[int] = None):
+        """Count an evaluation (first-match rank, or all-matches mask)"""
+        counters = self.counters
+        if mask is None:
+            counters.record_first_match(rank)
+            reached = len(self.rules) if rank is None else rank + 1
+        else:
+            counters.record_all_match(mask)
+            reached = len(self.rules)
+
+        if counters.should_sample():
+            for sampled_rank in range(reached):
+                if sampled_rank in self.disabled:
+                    continue
+                started = time.perf_counter()
+                self.rules[sampled_rank].matches(email)
+                counters.record_sample(sampled_rank, time.perf_counter() - started)
+
+    def match_all_batch(self, emails: Sequence[Dict[str, Any]]) -> list[int]:
+        """Return the bitmask of every matching rule, per email"""
+        emails = [prepare_email(email) for email in emails]
+        if self.sender_index:
+            lookup_mask = self.sender_index.lookup_mask
+            masks = [lookup_mask(email.sender_address, email.sender_domain) for email in emails]
+        else:
+            masks = [0] * len(emails)
+
+        for match_type, matcher in self.keyword_matchers.items():
+            find_mask = matcher.find_mask
+            column = [email.keyword_target(match_type) for email in emails]
+            for i, match_target in enumerate(column):
+                if match_target:
+                    masks[i] |= find_mask(match_target)
+
+        if self.regex_ranks:
+            column = [email.regex_target for email in emails]
+            for rank in list(self.regex_ranks):
+                bit = 1 << rank
+                for i, match_target in enumerate(column):
+                    if rank in self.disabled:
+                        break
+                    if self._search_regex(rank, match_target):
+                        masks[i] |= bit
+
+        for email, mask in zip(emails, masks):
+            self._record(email, None, mask)
+        return masks
+
+    def rules_for_mask(self, mask: int) -> list[CompiledRule]:
+        """Return the rules set in a match bitmask, in priority order"""
+        matched = []
+        while mask:
+            rank = lowest_rank(mask)
+            matched.append(self.rules[rank])
+            mask &= mask - 1
+        return matched
+
+
+# Compiled rule sets of this process: user ID -> (users.rule_set_version
+# they were compiled at, CompiledRuleSet)
+_compiled_cache: Dict[int, tuple[int, CompiledRuleSet]] = {}
+
+
+def get_rule_set_version(db: Session, user_id: int) -> int:
+    """Get the current rule-set version for a user"""
+    return db.query(User.rule_set_version).filter(User.id == user_id).scalar() or 0
+
+
+def bump_rule_set_version(db: Session, user_id: int):
+    """Mark a user's rules as changed so every process rebuilds its compiled set.
+
+    The version lives in the users table; call this before committing the
+    rule change so both land in the same transaction.
+    """
+    db.query(User).filter(User.id == user_id).update(
+        {User.rule_set_version: User.rule_set_version + 1}, synchronize_session=False
+    )
+
+
+def get_compiled_rules(db: Session, user_id: int) -> CompiledRuleSet:
+    """Get the compiled active rule set for a user, compiling it when the stored version changed"""
+    version = get_rule_set_version(db, user_id)
+    cached = _compiled_cache.get(user_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    rules = db.query(Rule).filter(Rule.user_id == user_id, Rule.is_active == True).all()
+    compiled = CompiledRuleSet(rules)
+    _compiled_cache[user_id] = (version, compiled)
+    return compiled
+
+
+def save_rule_stats(db: Session, user_id: int, compiled: CompiledRuleSet):
+    """Store the evaluation counters a processing run added to a compiled set"""
+    save_rule_profile(db, user_id, compiled.counters)
+
+
+def get_rule_profile(db: Session, user_id: int) -> Dict[int, Dict[str, Any]]:
+    """Per-rule evaluations, hits and estimated cost for a user, by rule ID"""
+    return load_rule_profile(db, user_id)
+
+
+def disable_slow_rules(db: Session, user_id: int, compiled: CompiledRuleSet) -> list[CompiledRule]:
+    """Deactivate the regex rules a run stopped at the time budget or found unsafe on load.
+
+    They get is_active=False and Rule.slow_flagged_at, so the user sees why;
+    editing the pattern clears the flag and the rule can be re-enabled.
+    """
+    slow_rules = [
+        compiled.rules[rank] for rank in sorted({*compiled.disabled, *compiled.unsafe})
+        if compiled.rules[rank].id is not None
+    ]
+    if not slow_rules:
+        return []
+
+    db.query(Rule).filter(
+        Rule.user_id == user_id,
+        Rule.id.in_([rule.id for rule in slow_rules])
+    ).update({Rule.is_active: False, Rule.slow_flagged_at: datetime.utcnow()}, synchronize_session=False)
+    bump_rule_set_version(db, user_id)
+    db.commit()
+    return slow_rules
+
+
+def split_keywords(match_value: str) -> list[str]:
+    """Split a non-regex match value into normalized keywords"""
+    if not match_value:
+        return []
+    keywords = (normalize_text(keyword.strip()) for keyword in match_value.split(KEYWORD_SEPARATOR))
+    return [keyword for keyword in keywords if keyword]
+
+
+@lru_cache(maxsize=1024)
+def split_sender_keywords(match_value: str) -> tuple[tuple[str, ...], frozenset, frozenset]:
+    """Split a sender match value into (substring keywords, exact addresses, exact domains)"""
+    keywords, addresses, domains = [], set(), set()
+    for keyword in split_keywords(match_value):
+        exact = keyword[len(EXACT_PREFIX):] if keyword.startswith(EXACT_PREFIX) else None
+        if exact and _ADDRESS_KEYWORD.match(exact):
+            addresses.add(exact)
+        elif exact and _DOMAIN_KEYWORD.match(exact):
+            domains.add(exact.lstrip("@"))
+        else:
+            keywords.append(keyword)
+    return tuple(keywords), frozenset(addresses), frozenset(domains)
+
+
+@lru_cache(maxsize=1024)
+def compile_match_pattern(match_type: str, match_value: str) -> Optional[Pattern]:
+    """Compile the matcher for a rule.
+
+    Regex rules compile their value case-insensitively. Other rules fold their
+    normalized keywords into one alternation matched against the normalized
+    target (see prepared_email.normalize_text).
+    Returns None when the rule can never match (invalid regex, no keywords).
+    """
+    if match_type == "regex":
+        try:
+            return compile_regex(match_value, regex.IGNORECASE)
+        except regex.error:
+            return None
+
+    if match_type == "sender":
+        keywords = list(split_sender_keywords(match_value)[0])
+    else:
+        keywords = split_keywords(match_value)
+    if not keywords:
+        return None
+    # Longest first so overlapping keywords resolve the same way every time
+    keywords.sort(key=len, reverse=True)
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+
+@lru_cache(maxsize=config.settings.regex_cache_size)
+def compile_regex(pattern: str, flags: int = 0) -> Pattern:
+    """Compile a regex through a bounded LRU cache keyed by (pattern, flags).
+
+    Uses the regex module (re-compatible syntax), whose searches accept a
+    timeout, so a catastrophic pattern can be stopped.
+    """
+    return regex.compile(pattern, flags)
+
+
+def check_regex_complexity(pattern: str) -> list[str]:
+    """Statically check a regex for constructs prone to catastrophic backtracking"""
+    errors = []
+    if len(pattern) > config.settings.regex_max_length:
+        errors.append(f"Regex pattern is too long (max {config.settings.regex_max_length} characters)")
+
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        # Syntax errors are reported by the compile check
+        return errors
+
+    if _has_nested_quantifier(parsed, False):
+        errors.append("Regex pattern nests unbounded quantifiers (e.g. (a+)+), which can backtrack catastrophically")
+    if _has_overlapping_repeat(parsed):
+        errors.append(
+            "Regex pattern repeats alternatives that can match the same text (e.g. (a|aa)*), "
+            "which can backtrack catastrophically"
+        )
+    return errors
+
+
+def _has_nested_quantifier(items, in_repeat: bool) -> bool:
+    """Walk a parsed regex looking for an unbounded repeat inside another one"""
+    for op, value in items:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            _, max_repeat, subpattern = value
+            unbounded = max_repeat == sre_constants.MAXREPEAT or max_repeat > _MAX_SAFE_REPEAT
+            if unbounded and in_repeat:
+                return True
+            if _has_nested_quantifier(subpattern, in_repeat or unbounded):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if _has_nested_quantifier(value[-1], in_repeat):
+                return True
+        elif op == sre_constants.BRANCH:
+            if any(_has_nested_quantifier(branch, in_repeat) for branch in value[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _has_nested_quantifier(value[1], in_repeat):
+                return True
+        elif op == getattr(sre_constants, "POSSESSIVE_REPEAT", None):
+            # Never gives back iterations, so it does not add backtracking
+            if _has_nested_quantifier(value[2], in_repeat):
+                return True
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            if _has_nested_quantifier(value, in_repeat):
+                return True
+    return False
+
+
+def _has_overlapping_repeat(items) -> bool:
+    """Walk a parsed regex looking for an unbounded repeat of alternatives that can start alike"""
+    for op, value in items:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            _, max_repeat, subpattern = value
+            unbounded = max_repeat == sre_constants.MAXREPEAT or max_repeat > _MAX_SAFE_REPEAT
+            if unbounded and _has_overlapping_branch(subpattern):
+                return True
+            children = [subpattern]
+        elif op == sre_constants.SUBPATTERN:
+            children = [value[-1]]
+        elif op == sre_constants.BRANCH:
+            children = value[1]
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            children = [value[1]]
+        else:
+            continue
+        if any(_has_overlapping_repeat(child) for child in children):
+            return True
+    return False
+
+
+def _has_overlapping_branch(items) -> bool:
+    """Whether a repeated body holds a branch whose alternatives can start with the same character"""
+    for op, value in items:
+        if op == sre_constants.BRANCH:
+            seen = set()
+            for branch in value[1]:
+                first = _first_chars(list(branch))
+                if first is None or first & seen:
+                    return True
+                seen |= first
+            if any(_has_overlapping_branch(branch) for branch in value[1]):
+                return True
+        elif op == sre_constants.SUBPATTERN and _has_overlapping_branch(value[-1]):
+            return True
+    return False
+
+
+def _first_chars(items) -> Optional[set]:
+    """Casefolded characters a parsed regex can start with; None when unknown, any or empty"""
+    for index, (op, value) in enumerate(items):
+        if op == sre_constants.AT:
+            continue  # Anchors consume nothing
+        if op == sre_constants.LITERAL:
+            return {chr(value).casefold()}
+        if op == sre_constants.IN:
+            chars = set()
+            for item_op, item in value:
+                if item_op == sre_constants.LITERAL:
+                    chars.add(chr(item).casefold())
+                elif item_op == sre_constants.RANGE and item[1] - item[0] <= 256:
+                    chars.update(chr(code).casefold() for code in range(item[0], item[1] + 1))
+                else:
+                    return None  # Categories, negations, wide ranges
+            return chars
+        if op == sre_constants.SUBPATTERN:
+            return _first_chars(list(value[-1]) + items[index + 1:])
+        if op == sre_constants.BRANCH:
+            chars = set()
+            for branch in value[1]:
+                first = _first_chars(list(branch) + items[index + 1:])
+                if first is None:
+                    return None
+                chars |= first
+            return chars
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_repeat, _, subpattern = value
+            first = _first_chars(list(subpattern))
+            if first is None or min_repeat > 0:
+                return first
+            rest = _first_chars(items[index + 1:])
+            return None if rest is None else first | rest
+        return None
+    return None
+
+
+def find_matching_rule(email: Dict[str, Any], rules):
     """
     Find the first matching rule for an email
     Rules are evaluated in priority order (lower priority number = higher priority)
+
+    Accepts a CompiledRuleSet (returns a CompiledRule) or a plain list of
+    rules, which is compiled on the fly (returns the original Rule).
     """
-    # Sort rules by priority (ascending)
-    sorted_rules = sorted(rules, key=lambda r: r.priority)
+    if isinstance(rules, CompiledRuleSet):
+        return rules.match(email)
 
-    for rule in sorted_rules:
-        if matches_rule(email, rule):
-            return rule
+    matched = CompiledRuleSet(rules).match(email)
+    return rules[matched.position] if matched else None
 
-    return None
+
+def find_matching_rules_batch(emails: Sequence[Dict[str, Any]], rules) -> list[Optional[int]]:
+    """
+    Find the first matching rule for every email of a batch
+    Returns one rule index (or None) per email, with the same first-match
+    semantics as find_matching_rule. Indexes point into rules.rules for a
+    CompiledRuleSet, or into the given list of rules otherwise.
+    """
+    if isinstance(rules, CompiledRuleSet):
+        return rules.match_batch(emails)
+
+    compiled = CompiledRuleSet(rules)
+    return [
+        compiled.rules[rank].position if rank is not None else None
+        for rank in compiled.match_batch(emails)
+    ]
+
+
+def find_all_matching_rules(email: Dict[str, Any], rules) -> int:
+    """
+    Find every rule matching an email, as a bitmask
+    Bit n is set when rules.rules[n] matches; use rules.rules_for_mask to get
+    the rules back in priority order. Takes a CompiledRuleSet.
+    """
+    return rules.match_all(email)
+
+
+def find_all_matching_rules_batch(emails: Sequence[Dict[str, Any]], rules) -> list[int]:
+    """Find every rule matching each email of a batch, as one bitmask per email"""
+    return rules.match_all_batch(emails)
 
 
-def matches_rule(email: Dict[str, Any], rule: Rule) -> bool:
+def matches_rule(email: Dict[str, Any], rule) -> bool:
     """Check if an email matches a specific rule"""
-    match_target = get_match_target(email, rule.match_type)
+    if isinstance(rule, CompiledRule):
+        return rule.matches(email)
+
+    if rule.match_type == "sender":
+        _, addresses, domains = split_sender_keywords(rule.match_value or "")
+        if _sender_keys_match(addresses, domains, email):
+            return True
+
+    pattern = compile_match_pattern(rule.match_type, rule.match_value or "")
+    return _pattern_matches(pattern, rule.match_type, email)
+
+
+def _sender_keys_match(addresses, domains, email: Dict[str, Any]) -> bool:
+    """Check the parsed sender against exact addresses and domains"""
+    if not (addresses or domains):
+        return False
+
+    if isinstance(email, PreparedEmail):
+        address, domain = email.sender_address, email.sender_domain
+    else:
+        address, domain = parse_sender(email.get("sender"))
+
+    if address in addresses:
+        return True
+    while domain:
+        if domain in domains:
+            return True
+        domain = domain.partition(".")[2]
+    return False
+
+
+def _pattern_matches(pattern: Optional[Pattern], match_type: str, email: Dict[str, Any]) -> bool:
+    """Search a compiled rule pattern in the email's match target"""
+    if pattern is None:
+        return False
+
+    if match_type == "regex":
+        match_target = get_match_target(email, match_type)
+    else:
+        # Keyword match (case and accent insensitive)
+        match_target = get_keyword_target(email, match_type)
     if not match_target:
         return False
 
-    if rule.match_type == "regex":
+    if match_type == "regex":
         try:
-            return bool(re.search(rule.match_value, match_target, re.IGNORECASE))
-        except re.error:
+            return pattern.search(match_target, timeout=config.settings.regex_time_budget_ms / 1000) is not None
+        except TimeoutError:
             return False
-    else:
-        # Simple substring match (case insensitive)
-        return rule.match_value.lower() in match_target.lower()
+    return pattern.search(match_target) is not None
+
+
+def get_keyword_target(email: Dict[str, Any], match_type: str) -> str:
+    """Get the normalized target string keyword rules match against"""
+    if isinstance(email, PreparedEmail):
+        return email.keyword_target(match_type)
+    return normalize_text(get_match_target(email, match_type))
 
 
 def get_match_target(email: Dict[str, Any], match_type: str) -> str:
     """Get the target string to match against based on match type"""
+    if isinstance(email, PreparedEmail):
+        if match_type == "regex":
+            return email.regex_target
+        if match_type == "body":
+            return email.body_text
+
     if match_type == "sender":
         return email.get("sender", "")
     elif match_type == "subject":
@@ -223,9 +942,8 @@ def validate_rule(rule_data: Dict[str, Any]) -> list[str]:
             errors.append(f"{field} is required")
 
     # Validate match_type
-    valid_match_types = ["sender", "subject", "body", "regex", "header"]
-    if rule_data.get("match_type") and rule_data["match_type"] not in valid_match_types:
-        errors.append(f"match_type must be one of: {', '.join(valid_match_types)}")
+    if rule_data.get("match_type") and rule_data["match_type"] not in MATCH_TYPES:
+        errors.append(f"match_type must be one of: {', '.join(MATCH_TYPES)}")
 
     # Validate action_type
     valid_action_types = ["tag", "archive", "mark_read", "move"]
@@ -236,11 +954,19 @@ def validate_rule(rule_data: Dict[str, Any]) -> list[str]:
     if rule_data.get("action_type") in ["tag", "move"] and not rule_data.get("action_value"):
         errors.append("action_value is required for tag and move actions")
 
+    # Exact sender keywords must be an address or a domain
+    if rule_data.get("match_type") == "sender" and rule_data.get("match_value"):
+        for keyword in split_keywords(rule_data["match_value"]):
+            exact = keyword[len(EXACT_PREFIX):] if keyword.startswith(EXACT_PREFIX) else None
+            if exact is not None and not (_ADDRESS_KEYWORD.match(exact) or _DOMAIN_KEYWORD.match(exact)):
+                errors.append(f"Exact sender keyword '{keyword}' must be an email address or a domain")
+
     # Validate regex
-    if rule_data.get("match_type") == "regex":
+    if rule_data.get("match_type") == "regex" and rule_data.get("match_value"):
         try:
-            re.compile(rule_data["match_value"])
-        except re.error as e:
+            compile_regex(rule_data["match_value"], regex.IGNORECASE)
+        except regex.error as e:
             errors.append(f"Invalid regex pattern: {e}")
+        errors.extend(check_regex_complexity(rule_data["match_value"]))
 
     return errors
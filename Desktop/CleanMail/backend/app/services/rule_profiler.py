@@ -0,0 +1,145 @@
+"""
+Rule profiler - Per-rule evaluation, hit and cost counters
+"""
+
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.rule_profile import RuleProfile
+from app.services.keyword_matcher import lowest_rank
+
+COUNTER_NAMES = ("evaluations", "hits", "sampled_evaluations", "sampled_seconds")
+
+
+class RuleSetCounters:
+    """Counters of one compiled rule set, indexed by rule rank.
+
+    Recording an email is O(1) for first-match evaluation: only the winning
+    rank is counted, and how many times each rule was evaluated is derived
+    later (a rule is evaluated for every email no higher-priority rule won).
+    Evaluation cost is measured on a sample of emails, one every
+    sample_every, by timing each rule the email reached on its own. After
+    each processing run the counts are added to the rule_profiles table and
+    reset (see save_rule_profile).
+    """
+
+    __slots__ = (
+        "rule_ids", "sample_every", "emails_seen", "wins", "all_match_emails",
+        "all_match_hits", "sampled_evaluations", "sampled_seconds"
+    )
+
+    def __init__(self, rule_ids: List[Optional[int]], sample_every: int = 0):
+        self.rule_ids = rule_ids
+        self.sample_every = sample_every
+        self.emails_seen = 0
+        self._reset()
+
+    def _reset(self):
+        rule_ids = self.rule_ids
+        self.wins = [0] * (len(rule_ids) + 1)  # Last slot counts emails no rule matched
+        self.all_match_emails = 0
+        self.all_match_hits = [0] * len(rule_ids)
+        self.sampled_evaluations = [0] * len(rule_ids)
+        self.sampled_seconds = [0.0] * len(rule_ids)
+
+    def record_first_match(self, rank: Optional[int]):
+        """Count a first-match evaluation won by rank (None: no match)"""
+        self.emails_seen += 1
+        self.wins[len(self.rule_ids) if rank is None else rank] += 1
+
+    def record_all_match(self, mask: int):
+        """Count an all-matches evaluation that matched the ranks in mask"""
+        self.emails_seen += 1
+        self.all_match_emails += 1
+        while mask:
+            self.all_match_hits[lowest_rank(mask)] += 1
+            mask &= mask - 1
+
+    def should_sample(self) -> bool:
+        """Whether the email just recorded should have its rule costs timed"""
+        return bool(self.sample_every) and self.emails_seen % self.sample_every == 0
+
+    def record_sample(self, rank: int, seconds: float):
+        """Add one timed evaluation of the rule at rank"""
+        self.sampled_evaluations[rank] += 1
+        self.sampled_seconds[rank] += seconds
+
+    def totals(self) -> Dict[Optional[int], Dict[str, float]]:
+        """Raw counters per rule ID"""
+        totals = {}
+        reached = self.wins[-1] + self.all_match_emails
+        for rank in range(len(self.rule_ids) - 1, -1, -1):
+            reached += self.wins[rank]
+            totals[self.rule_ids[rank]] = {
+                "evaluations": reached,
+                "hits": self.wins[rank] + self.all_match_hits[rank],
+                "sampled_evaluations": self.sampled_evaluations[rank],
+                "sampled_seconds": self.sampled_seconds[rank],
+            }
+        return totals
+
+    def take_totals(self) -> Dict[Optional[int], Dict[str, float]]:
+        """totals(), then start counting from zero again"""
+        totals = self.totals()
+        self._reset()
+        return totals
+
+
+def save_rule_profile(db: Session, user_id: int, counters: RuleSetCounters):
+    """Add the counters recorded since the last save to the user's rule_profiles rows.
+
+    Counts are added with UPDATE ... SET n = n + delta, so runs of several
+    processes add up instead of overwriting each other.
+    """
+    deltas = {
+        rule_id: stats
+        for rule_id, stats in counters.take_totals().items()
+        if rule_id is not None and stats["evaluations"]
+    }
+    if not deltas:
+        return
+
+    try:
+        existing = {
+            rule_id
+            for (rule_id,) in db.query(RuleProfile.rule_id).filter(RuleProfile.rule_id.in_(list(deltas)))
+        }
+        if existing:
+            table = RuleProfile.__table__
+            db.connection().execute(
+                update(table).where(table.c.rule_id == bindparam("b_rule_id")).values({
+                    name: table.c[name] + bindparam(f"b_{name}") for name in COUNTER_NAMES
+                }),
+                [
+                    {"b_rule_id": rule_id, **{f"b_{name}": deltas[rule_id][name] for name in COUNTER_NAMES}}
+                    for rule_id in existing
+                ]
+            )
+        db.add_all(
+            RuleProfile(user_id=user_id, rule_id=rule_id, **stats)
+            for rule_id, stats in deltas.items() if rule_id not in existing
+        )
+        db.commit()
+    except SQLAlchemyError as e:
+        # Profiling is best effort (e.g. a concurrent run created the same row)
+        db.rollback()
+        print(f"Error saving rule profile of user {user_id}: {e}")
+
+
+def load_rule_profile(db: Session, user_id: int) -> Dict[int, Dict[str, float]]:
+    """Per-rule evaluations, hits and estimated evaluation cost, by rule ID"""
+    profile = {}
+    for row in db.query(RuleProfile).filter(RuleProfile.user_id == user_id):
+        avg_seconds = row.sampled_seconds / row.sampled_evaluations if row.sampled_evaluations else None
+        profile[row.rule_id] = {
+            "evaluations": row.evaluations,
+            "hits": row.hits,
+            "hit_rate": row.hits / row.evaluations if row.evaluations else 0.0,
+            "sampled_evaluations": row.sampled_evaluations,
+            "avg_eval_us": avg_seconds * 1e6 if avg_seconds is not None else None,
+            "estimated_total_ms": avg_seconds * row.evaluations * 1000 if avg_seconds is not None else None,
+        }
+    return profile
@@ -0,0 +1,72 @@
+"""
+Sync service - Full and incremental (history-based) mailbox syncs
+"""
+
+import asyncio
+from typing import AsyncIterator, List, Optional
+from sqlalchemy.orm import Session
+
+from app.models.gmail_sync_state import GmailSyncState
+from app.models.user import User
+from app.services import gmail_async, message_cache
+from app.services.prepared_email import PreparedEmail
+from app.services.rule_engine import CompiledRuleSet
+
+
+def get_sync_state(db: Session, user_id: int) -> Optional[GmailSyncState]:
+    """Get the stored sync state of a user, if any"""
+    return db.query(GmailSyncState).filter(GmailSyncState.user_id == user_id).first()
+
+
+async def sync_emails(
+    db: Session,
+    user: User,
+    max_results: Optional[int] = 10,
+    rules: Optional[CompiledRuleSet] = None,
+    match_all: bool = False,
+    incremental: bool = False
+) -> tuple[AsyncIterator[List[PreparedEmail]], Optional[str]]:
+    """Stream the unread inbox emails to process, in chunks.
+
+    Incremental syncs only fetch the messages that arrived in (or came back
+    to) the unread inbox since the stored history ID, however many there
+    are. A full sync, or an incremental one whose history ID is missing or
+    has expired, streams the max_results most recent unread emails instead
+    (None: the whole unread inbox).
+
+    Returns the chunk iterator and the history ID to store with
+    save_history_id once every chunk has been processed. Database calls
+    run in a thread.
+    """
+    state = await asyncio.to_thread(get_sync_state, db, user.id)
+    if incremental and state and state.history_id:
+        history = await gmail_async.list_history(user, state.history_id)
+        if history is not None:
+            message_ids, deleted_ids, history_id = history
+            await asyncio.to_thread(message_cache.invalidate_messages, user.id, deleted_ids)
+            chunks = gmail_async.iter_message_details(user, message_ids, rules, match_all)
+            return _still_unread(chunks), history_id
+        print(f"History ID {state.history_id} of user {user.id} expired, falling back to a full sync")
+
+    # Read the history ID first so nothing arriving during the sync is missed
+    history_id = await gmail_async.get_history_id(user)
+    chunks = gmail_async.iter_emails(user, max_results=max_results, rules=rules, match_all=match_all)
+    return chunks, history_id
+
+
+async def _still_unread(chunks: AsyncIterator[List[PreparedEmail]]) -> AsyncIterator[List[PreparedEmail]]:
+    """Drop messages read or archived since history reported them"""
+    async for chunk in chunks:
+        yield [email for email in chunk if "INBOX" in email.labels and "UNREAD" in email.labels]
+
+
+def save_history_id(db: Session, user_id: int, history_id: Optional[str]):
+    """Store the history ID up to which a user's mailbox has been processed"""
+    if not history_id:
+        return
+    state = get_sync_state(db, user_id)
+    if state is None:
+        state = GmailSyncState(user_id=user_id)
+        db.add(state)
+    state.history_id = history_id
+    db.commit()
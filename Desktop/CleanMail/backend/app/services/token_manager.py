@@ -0,0 +1,189 @@
+"""
+Token manager - Cached, proactively refreshed Google OAuth access tokens
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+import requests
+
+from app import config
+from app.database import SessionLocal
+from app.models.user import User
+
+
+class _Token:
+    __slots__ = ("access_token", "expires_at", "refresh_token")
+
+    def __init__(self, access_token: str, expires_at: Optional[datetime], refresh_token: Optional[str]):
+        self.access_token = access_token
+        self.expires_at = expires_at  # Naive UTC, like User.token_expires_at
+        self.refresh_token = refresh_token
+
+    def seconds_left(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return (self.expires_at - datetime.utcnow()).total_seconds()
+
+    def newer_than(self, other: "_Token") -> bool:
+        """Whether this token was issued after other (it expires later)"""
+        if self.access_token == other.access_token or self.expires_at is None or other.expires_at is None:
+            return False
+        return self.expires_at > other.expires_at
+
+
+class TokenManager:
+    """Serves Gmail access tokens from memory and keeps them fresh.
+
+    A user's token is read from the User row and cached; whenever a User row
+    (or the users table, before a refresh) holds a newer token than the
+    cache, e.g. after the user signed in again or another process refreshed
+    it, that token replaces the cached one. Within
+    settings.token_refresh_margin_seconds of expiry the cached token is
+    still returned while a background thread refreshes it; an expired token
+    is refreshed before returning. Refreshes of a user are single-flight:
+    concurrent callers wait for the one refresh in progress and share its
+    result, and at most one background refresh per user is in flight. After
+    a failed background refresh the next one waits
+    settings.token_refresh_backoff_seconds, doubling on each failure. New
+    tokens are written to the users table in one UPDATE.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[int, _Token] = {}
+        self._refresh_locks: Dict[int, threading.Lock] = {}
+        self._background: Set[int] = set()  # Users with a background refresh in flight
+        self._backoff: Dict[int, tuple[float, float]] = {}  # User -> (retry at, delay), monotonic seconds
+        self._lock = threading.Lock()
+
+    def get_access_token(self, user: User) -> str:
+        """A valid access token for the user, refreshing it if it expired"""
+        token = self._token(user)
+        seconds_left = token.seconds_left()
+        if seconds_left > config.settings.token_refresh_margin_seconds:
+            return token.access_token
+        if seconds_left > 0:
+            self._refresh_in_background(user.id)
+            return token.access_token
+        return self.refresh(user.id).access_token
+
+    async def get_access_token_async(self, user: User) -> str:
+        """get_access_token, refreshing an expired token off the event loop"""
+        if self._token(user).seconds_left() <= 0:
+            return await asyncio.to_thread(self.get_access_token, user)
+        return self.get_access_token(user)
+
+    def refresh(self, user_id: int, stale_token: Optional[str] = None) -> _Token:
+        """Refresh a user's token, unless a concurrent caller just did.
+
+        stale_token forces a refresh when the cache still holds that token
+        (e.g. Gmail rejected it with a 401 before its expiry time).
+        """
+        with self._refresh_lock(user_id):
+            # Another process may have refreshed it already
+            token = self._adopt(user_id, self._load(user_id))
+            if (
+                token.access_token != stale_token
+                and token.seconds_left() > config.settings.token_refresh_margin_seconds
+            ):
+                return token
+            return self._refresh(user_id, token)
+
+    def _token(self, user: User) -> _Token:
+        return self._adopt(user.id, _Token(
+            user.access_token, getattr(user, "token_expires_at", None), getattr(user, "refresh_token", None)
+        ))
+
+    def _adopt(self, user_id: int, stored: _Token) -> _Token:
+        """The cached token, replaced by the stored one when that one is newer"""
+        with self._lock:
+            token = self._tokens.get(user_id)
+            if token is None or stored.newer_than(token):
+                token = self._tokens[user_id] = stored
+            return token
+
+    def _refresh_lock(self, user_id: int) -> threading.Lock:
+        with self._lock:
+            lock = self._refresh_locks.get(user_id)
+            if lock is None:
+                lock = self._refresh_locks[user_id] = threading.Lock()
+            return lock
+
+    def _refresh_in_background(self, user_id: int):
+        with self._lock:
+            retry_at, delay = self._backoff.get(user_id, (0.0, 0.0))
+            if user_id in self._background or time.monotonic() < retry_at:
+                return  # Already being refreshed, or backing off after a failure
+            self._background.add(user_id)
+
+        def run():
+            try:
+                self.refresh(user_id)
+                with self._lock:
+                    self._backoff.pop(user_id, None)
+            except Exception as e:
+                print(f"Error refreshing token of user {user_id}: {e}")
+                settings = config.settings
+                next_delay = min(2 * delay, settings.token_refresh_margin_seconds) if delay else \
+                    settings.token_refresh_backoff_seconds
+                with self._lock:
+                    self._backoff[user_id] = (time.monotonic() + next_delay, next_delay)
+            finally:
+                with self._lock:
+                    self._background.discard(user_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _refresh(self, user_id: int, token: _Token) -> _Token:
+        if not token.refresh_token:
+            raise Exception(f"User {user_id} has no refresh token, sign in again")
+
+        settings = config.settings
+        response = requests.post(settings.google_token_uri, data={
+            "client_id": settings.google_client_id,
+            "client_secret": settings.google_client_secret,
+            "refresh_token": token.refresh_token,
+            "grant_type": "refresh_token",
+        }, timeout=settings.gmail_timeout_seconds)
+        if response.status_code != 200:
+            raise Exception(f"Failed to refresh access token: {response.text}")
+
+        tokens = response.json()
+        new_token = _Token(
+            tokens["access_token"],
+            datetime.utcnow() + timedelta(seconds=tokens.get("expires_in", 3600)),
+            tokens.get("refresh_token") or token.refresh_token  # Google may rotate it
+        )
+        self._save(user_id, new_token)
+        with self._lock:
+            self._tokens[user_id] = new_token
+        return new_token
+
+    def _load(self, user_id: int) -> _Token:
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            if not user:
+                raise Exception(f"User {user_id} not found")
+            return _Token(user.access_token, user.token_expires_at, user.refresh_token)
+        finally:
+            db.close()
+
+    def _save(self, user_id: int, token: _Token):
+        db = SessionLocal()
+        try:
+            db.query(User).filter(User.id == user_id).update({
+                User.access_token: token.access_token,
+                User.refresh_token: token.refresh_token,
+                User.token_expires_at: token.expires_at,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+# Shared token manager of the process
+token_manager = TokenManager()
@@ -0,0 +1,137 @@
+"""
+CleanMail job worker - Runs queued email processing jobs
+
+Run standalone (see the Procfile):
+    python -m app.worker
+
+or embedded in the API process with settings.embedded_worker.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import uuid
+from typing import Optional, Set
+
+from app import config
+from app.database import SessionLocal
+from app.models.processing_job import ProcessingJob
+from app.services import email_processor, job_queue
+from app.services.job_queue import PermanentJobError
+from app.services.pipeline import Pipeline
+
+
+class Worker:
+    """Claims jobs from the queue and runs up to concurrency of them at once.
+
+    Each job gets its own database session, and its lease is renewed (with
+    the pipeline stats so far) while it runs; a job whose lease was lost is
+    cancelled. stop() releases the jobs in progress back to the queue.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, poll_seconds: Optional[float] = None):
+        settings = config.settings
+        self.concurrency = concurrency or settings.worker_concurrency
+        self.poll_seconds = poll_seconds or settings.worker_poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def run(self):
+        """Claim and run jobs until stop() is called"""
+        self._stopping = asyncio.Event()
+        print(f"Worker {self.worker_id} started ({self.concurrency} concurrent jobs)")
+
+        while not self._stopping.is_set():
+            while len(self._tasks) < self.concurrency:
+                try:
+                    job = await asyncio.to_thread(_with_session, job_queue.claim_job, self.worker_id)
+                except Exception as e:
+                    print(f"Error claiming job: {e}")
+                    job = None
+                if job is None:
+                    break
+                task = asyncio.create_task(self._run_job(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        print(f"Worker {self.worker_id} stopped")
+
+    def stop(self):
+        """Ask run() to release its jobs and return"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _run_job(self, job: ProcessingJob):
+        pipeline = Pipeline(config.settings.pipeline_queue_size)
+        heartbeat = asyncio.create_task(self._renew_lease(job.id, pipeline, asyncio.current_task()))
+        db = SessionLocal()
+        try:
+            processed = await email_processor.process_emails(
+                db, job.user_id, job.max_emails, job.stack_actions, job.incremental, pipeline
+            )
+            await asyncio.to_thread(
+                _with_session, job_queue.complete_job, job.id, self.worker_id, processed, pipeline.stats()
+            )
+        except asyncio.CancelledError:
+            await asyncio.to_thread(_with_session, job_queue.release_job, job.id, self.worker_id)
+            raise
+        except Exception as e:
+            print(f"Error processing emails (job {job.id}, attempt {job.attempts}): {e}")
+            await asyncio.to_thread(db.rollback)
+            await asyncio.to_thread(
+                _with_session, job_queue.fail_job, job.id, self.worker_id, str(e),
+                not isinstance(e, PermanentJobError)
+            )
+        finally:
+            heartbeat.cancel()
+            db.close()
+
+    async def _renew_lease(self, job_id: int, pipeline: Pipeline, job_task: asyncio.Task):
+        """Renew a job's lease until cancelled; cancel job_task if the lease was lost"""
+        while True:
+            await asyncio.sleep(config.settings.job_lease_seconds / 3)
+            try:
+                owned = await asyncio.to_thread(
+                    _with_session, job_queue.renew_lease, job_id, self.worker_id, pipeline.stats()
+                )
+            except Exception as e:
+                print(f"Error renewing lease of job {job_id}: {e}")
+                continue
+            if not owned:
+                # The job may already run on another worker: stop before
+                # applying any more actions
+                print(f"Worker {self.worker_id} lost the lease of job {job_id}, cancelling it")
+                job_task.cancel()
+                return
+
+
+def _with_session(function, *args):
+    """Call a job_queue function with a short-lived session of its own"""
+    db = SessionLocal()
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+
+async def serve():
+    """Run a worker until SIGINT/SIGTERM"""
+    worker = Worker()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Rule engine micro-benchmarks for CleanMail
+Measures find_matching_rule, find_all_matching_rules, matches_rule and
+validate_rule throughput on synthetic mailboxes and stores the results as
+JSON for regression checks
+
+Usage:
+    python benchmarks/bench_rule_engine.py --output results.json
+    python benchmarks/bench_rule_engine.py --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services import rule_engine
+from app.services.prepared_email import prepare_email
+from benchmarks.synthetic_corpus import generate_mailbox, generate_rules
+
+DEFAULT_RULE_COUNTS = [15, 100, 1000, 5000]
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    index = min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))
+    return samples[index]
+
+
+def summarize(name: str, rule_count: int, timings: list, unit: str) -> dict:
+    """Throughput and per-item latency percentiles from per-item timings (seconds)"""
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        "benchmark": name,
+        "rules": rule_count,
+        "items": len(timings),
+        f"{unit}_per_sec": round(len(timings) / total, 1) if total else None,
+        "p50_us": round(percentile(timings, 0.50) * 1e6, 2),
+        "p99_us": round(percentile(timings, 0.99) * 1e6, 2),
+        "mean_us": round(statistics.fmean(timings) * 1e6, 2),
+    }
+
+
+def summarize_batches(name: str, rule_count: int, timings: list, items: int, unit: str) -> dict:
+    """Throughput from per-batch timings (seconds); batches have no per-item latency"""
+    total = sum(timings)
+    return {
+        "benchmark": name,
+        "rules": rule_count,
+        "items": items,
+        "batches": len(timings),
+        f"{unit}_per_sec": round(items / total, 1) if total else None,
+        "mean_us": round(total / items * 1e6, 2) if items else None,
+    }
+
+
+def report(result: dict, unit: str):
+    latency = (
+        f"p50={result['p50_us']:>9.2f}us  p99={result['p99_us']:>9.2f}us"
+        if "p50_us" in result else f"{result['batches']} batches"
+    )
+    print(
+        f"{result['benchmark']:30} rules={result['rules']:<5} "
+        f"{result[f'{unit}_per_sec']:>12,.1f} {unit}/s  {latency}"
+    )
+
+
+def bench_prepare_email(emails: list) -> list:
+    timings = []
+    for email in emails:
+        started = time.perf_counter()
+        prepare_email(email)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_find_matching_rule(emails: list, compiled) -> list:
+    timings = []
+    for email in emails:
+        started = time.perf_counter()
+        rule_engine.find_matching_rule(email, compiled)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_find_matching_rules_batch(emails: list, compiled, batch_size: int = 500) -> list:
+    """Time of each batch evaluation"""
+    timings = []
+    for start in range(0, len(emails), batch_size):
+        batch = emails[start:start + batch_size]
+        started = time.perf_counter()
+        rule_engine.find_matching_rules_batch(batch, compiled)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_find_all_matching_rules_batch(emails: list, compiled, batch_size: int = 500) -> list:
+    """Time of each all-matches batch evaluation, rules looked up from the masks"""
+    timings = []
+    for start in range(0, len(emails), batch_size):
+        batch = emails[start:start + batch_size]
+        started = time.perf_counter()
+        for mask in rule_engine.find_all_matching_rules_batch(batch, compiled):
+            compiled.rules_for_mask(mask)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_matches_rule(emails: list, rules: list, pairs: int) -> list:
+    timings = []
+    rule_count = len(rules)
+    for i in range(pairs):
+        email = emails[i % len(emails)]
+        rule = rules[(i * 7) % rule_count]
+        started = time.perf_counter()
+        rule_engine.matches_rule(email, rule)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_validate_rule(rule_data: list) -> list:
+    timings = []
+    for data in rule_data:
+        started = time.perf_counter()
+        rule_engine.validate_rule(data)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run(email_count: int, rule_counts: list, seed: int) -> dict:
+    raw_emails = generate_mailbox(email_count, seed=seed)
+    results = [summarize("prepare_email", 0, bench_prepare_email(raw_emails), "emails")]
+    report(results[0], "emails")
+
+    # The Gmail service hands the rule engine prepared emails
+    emails = [prepare_email(email) for email in raw_emails]
+
+    for rule_count in rule_counts:
+        rule_data = generate_rules(rule_count, seed=seed)
+        rules = [SimpleNamespace(id=i, **data) for i, data in enumerate(rule_data)]
+
+        started = time.perf_counter()
+        compiled = rule_engine.CompiledRuleSet(rules)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        for name, timings, unit in [
+            ("find_matching_rule", bench_find_matching_rule(emails, compiled), "emails"),
+            ("matches_rule", bench_matches_rule(emails, rules, pairs=email_count), "checks"),
+            ("validate_rule", bench_validate_rule(rule_data), "rules"),
+        ]:
+            result = summarize(name, rule_count, timings, unit)
+            if name == "find_matching_rule":
+                result["compile_ms"] = round(compile_ms, 2)
+            results.append(result)
+            report(result, unit)
+
+        # Batches are timed as a whole, so they only report throughput
+        for name, timings in [
+            ("find_matching_rules_batch", bench_find_matching_rules_batch(emails, compiled)),
+            ("find_all_matching_rules_batch", bench_find_all_matching_rules_batch(emails, compiled)),
+        ]:
+            result = summarize_batches(name, rule_count, timings, len(emails), "emails")
+            results.append(result)
+            report(result, "emails")
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "emails": email_count,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """List the benchmarks whose throughput dropped by more than threshold"""
+    def key(result):
+        return result["benchmark"], result["rules"]
+
+    def throughput(result):
+        return next(value for name, value in result.items() if name.endswith("_per_sec"))
+
+    baseline_results = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        previous = baseline_results.get(key(result))
+        if not previous or not throughput(previous):
+            continue
+        change = (throughput(result) - throughput(previous)) / throughput(previous)
+        print(f"{result['benchmark']:30} rules={result['rules']:<5} {change:+.1%}")
+        if change < -threshold:
+            regressions.append({"benchmark": result["benchmark"], "rules": result["rules"], "change": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CleanMail rule engine benchmarks")
+    parser.add_argument("--emails", type=int, default=5000, help="Synthetic mailbox size")
+    parser.add_argument("--rules", type=str, default=",".join(map(str, DEFAULT_RULE_COUNTS)),
+                        help="Comma-separated rule set sizes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Throughput drop that counts as a regression (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print("CleanMail rule engine benchmarks")
+    print("=" * 50)
+    current = run(args.emails, [int(count) for count in args.rules.split(",")], args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.compare}")
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\nERROR: {len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return False
+
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,161 @@
+"""
+Synthetic corpus generator for CleanMail benchmarks
+Builds realistic Spanish/English mailboxes and rule sets of any size
+"""
+
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+SENDERS = [
+    ("Facebook", "notification@facebookmail.com"),
+    ("Instagram", "no-reply@mail.instagram.com"),
+    ("LinkedIn", "messages-noreply@linkedin.com"),
+    ("X", "info@x.com"),
+    ("Amazon.es", "confirmar-envio@amazon.es"),
+    ("Amazon.com", "order-update@amazon.com"),
+    ("Iberdrola", "facturas@iberdrola.es"),
+    ("Movistar", "sin-respuesta@movistar.es"),
+    ("Correos", "notificaciones@correos.es"),
+    ("GitHub", "noreply@github.com"),
+    ("Jenkins", "jenkins@ci.example.com"),
+    ("Vercel", "notifications@vercel.com"),
+    ("Zara", "newsletter@zara.com"),
+    ("El País", "boletines@elpais.es"),
+    ("Stripe", "receipts@stripe.com"),
+    ("Banco Santander", "avisos@santander.es"),
+]
+
+FIRST_NAMES = ["Ana", "Carlos", "Lucía", "Javier", "Marta", "John", "Emily", "David", "Sofía", "Pablo"]
+LAST_NAMES = ["García", "Martínez", "López", "Smith", "Johnson", "Fernández", "Brown", "Ruiz"]
+PERSONAL_DOMAINS = ["gmail.com", "hotmail.es", "outlook.com", "yahoo.es", "empresa.es"]
+
+SUBJECTS = [
+    "Tu factura de {month} ya está disponible",
+    "Your invoice #{number} is ready",
+    "Recibo de pago {number}",
+    "Payment receipt for order {number}",
+    "Tu pedido {number} ha sido enviado",
+    "Your order has shipped",
+    "Tu pedido llega hoy",
+    "Pedido confirmado: {number}",
+    "Order confirmation #{number}",
+    "¡Oferta especial solo este fin de semana!",
+    "Special offer: {percent}% off everything",
+    "Descuento exclusivo del {percent}%",
+    "Boletín semanal de noticias",
+    "Weekly newsletter: {month} edition",
+    "Deployment succeeded for {project}",
+    "Build failed on main ({project})",
+    "Alerta: uso de CPU elevado en {project}",
+    "[GitHub Actions] Pipeline {project} falló",
+    "Renovación de tu suscripción",
+    "Your subscription renewal is coming up",
+    "Reunión del lunes",
+    "Re: propuesta de proyecto {project}",
+    "Cena el sábado?",
+    "Fotos de las vacaciones",
+    "Question about the {project} contract",
+]
+
+BODIES = [
+    "Hola {name}, adjuntamos tu factura correspondiente a {month}. Puedes descargar el PDF desde tu área de cliente.",
+    "Hi {name}, thanks for your order. We'll let you know when it ships. Track your package any time.",
+    "Estimado cliente, su pedido está en camino y llegará en 2-3 días laborables.",
+    "Don't miss our biggest sale of the year. Click here to shop now. To unsubscribe, click here.",
+    "Si no deseas recibir más correos, puedes darte de baja aquí. Boletín enviado a {email}.",
+    "The deployment of {project} to production completed in {number} seconds.",
+    "Se ha detectado un error en el servicio {project}. Revisa los registros para más detalles.",
+    "Hola {name}, ¿te viene bien quedar el martes para revisar la propuesta?",
+    "Hi {name}, attached are the photos from last weekend. Let me know what you think!",
+    "Tu suscripción se renovará automáticamente el próximo mes. Gestiona tu plan desde tu cuenta.",
+]
+
+MONTHS = ["enero", "febrero", "marzo", "abril", "mayo", "June", "July", "August", "September", "October"]
+PROJECTS = ["cleanmail", "api-gateway", "billing", "frontend", "data-pipeline"]
+
+
+def generate_mailbox(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate a mailbox of email records shaped like the Gmail service output"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    emails = []
+
+    for i in range(size):
+        values = {
+            "name": rng.choice(FIRST_NAMES),
+            "month": rng.choice(MONTHS),
+            "number": rng.randint(10000, 99999),
+            "percent": rng.choice([10, 15, 20, 30, 50]),
+            "project": rng.choice(PROJECTS),
+            "email": "user@example.com",
+        }
+
+        if rng.random() < 0.7:
+            display_name, address = rng.choice(SENDERS)
+        else:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            display_name = f"{first} {last}"
+            address = f"{first.lower()}.{last.lower()}@{rng.choice(PERSONAL_DOMAINS)}"
+
+        body = rng.choice(BODIES).format(**values)
+        emails.append({
+            "id": f"msg{i:08d}",
+            "subject": rng.choice(SUBJECTS).format(**values),
+            "sender": f"{display_name} <{address}>",
+            "to": "user@example.com",
+            "received_at": now - timedelta(minutes=i),
+            "body_preview": body[:200] + "..." if len(body) > 200 else body,
+            "labels": ["INBOX", "UNREAD"],
+        })
+
+    return emails
+
+
+def generate_rules(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate a rule set: the built-in rules first, then synthetic ones.
+
+    Synthetic rules mix keyword rules on every field, sender block lists of
+    addresses and domains, and a few regex rules, like a long-lived account.
+    """
+    from app.services.rule_engine import get_built_in_rules
+
+    rng = random.Random(seed)
+    rules = get_built_in_rules()[:count]
+    labels = ["Bills", "Orders", "Trash", "Social", "Technical", "Personal", "Work"]
+
+    def word(length: int) -> str:
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+    while len(rules) < count:
+        priority = len(rules) + 1
+        kind = rng.random()
+        if kind < 0.15:
+            match_type = "sender"
+            match_value = "|".join(
+                f"={word(6)}@{word(8)}.com" if rng.random() < 0.5 else f"=@{word(7)}.es"
+                for _ in range(rng.randint(5, 40))
+            )
+        elif kind < 0.95:
+            match_type = rng.choice(["sender", "subject", "subject", "body", "header"])
+            match_value = "|".join(word(rng.randint(4, 10)) for _ in range(rng.randint(1, 6)))
+        else:
+            match_type = "regex"
+            match_value = rng.choice([
+                rf"{word(5)}\s+#?\d{{4,}}",
+                rf"(?:{word(4)}|{word(6)})-{word(3)}",
+                rf"\b{word(5)}\b.*\b{word(4)}\b",
+            ])
+
+        rules.append({
+            "name": f"Synthetic rule {priority}",
+            "description": "Generated for benchmarking",
+            "match_type": match_type,
+            "match_value": match_value,
+            "action_type": rng.choice(["tag", "tag", "tag", "archive", "mark_read"]),
+            "action_value": rng.choice(labels),
+            "priority": priority,
+        })
+
+    return rules
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Fake Gmail API server for CleanMail load testing
+Serves a synthetic mailbox over the Gmail REST API (messages list/get/modify/
+batchModify, labels, history, profile, /batch and the OAuth token endpoint)
+with configurable latency, error rate and quota throttling
+
+Usage:
+    python scripts/fake_gmail_server.py --messages 5000 --latency-ms 40 --error-rate 0.01
+
+Then point the backend at it:
+    GMAIL_API_BASE_URL=http://127.0.0.1:8025 GOOGLE_TOKEN_URI=http://127.0.0.1:8025/token \\
+        uvicorn app.main:app --port 8000
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.gmail_quota import quota_units
+from benchmarks.synthetic_corpus import generate_mailbox
+
+USER_PATH = re.compile(r"^/gmail/v1/users/[^/]+")
+SYSTEM_LABELS = [
+    "INBOX", "UNREAD", "STARRED", "IMPORTANT", "SENT", "DRAFT", "SPAM", "TRASH",
+    "CATEGORY_PERSONAL", "CATEGORY_SOCIAL", "CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_FORUMS",
+]
+MAX_BATCH_REQUESTS = 100
+MAX_BATCH_MODIFY_IDS = 1000
+
+
+class ApiError(Exception):
+    """An error response in the Gmail API format"""
+
+    def __init__(self, code: int, message: str, reason: str = "failedPrecondition", headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.reason = reason
+        self.headers = headers or {}
+
+    def body(self) -> Dict[str, Any]:
+        return {"error": {
+            "code": self.code,
+            "message": self.message,
+            "errors": [{"domain": "global", "reason": self.reason, "message": self.message}],
+        }}
+
+
+class FakeMailbox:
+    """A synthetic mailbox with Gmail's label and history semantics"""
+
+    def __init__(self, size: int, seed: int):
+        self.lock = threading.Lock()
+        self.labels = {name: {"id": name, "name": name, "type": "system"} for name in SYSTEM_LABELS}
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.order: List[str] = []  # Newest first
+        self.history: List[Dict[str, Any]] = []
+        self.history_id = 1000
+        self.first_history_id = self.history_id
+        self.delivered = 0
+
+        for record in generate_mailbox(size, seed=seed):
+            self._store(record)
+
+    def _store(self, record: Dict[str, Any], newest: bool = False) -> Dict[str, Any]:
+        self.history_id += 1
+        message = {"record": record, "labels": set(record["labels"]), "history_id": self.history_id}
+        self.messages[record["id"]] = message
+        if newest:
+            self.order.insert(0, record["id"])
+        else:
+            self.order.append(record["id"])
+        return message
+
+    def deliver(self, count: int) -> List[str]:
+        """New unread inbox messages, recorded as messageAdded history"""
+        with self.lock:
+            records = generate_mailbox(count, seed=len(self.messages))
+            ids = []
+            for record in records:
+                self.delivered += 1
+                record["id"] = f"new{self.delivered:08d}"
+                message = self._store(record, newest=True)
+                self.history.append({
+                    "id": str(message["history_id"]),
+                    "messagesAdded": [{"message": self._summary(record["id"])}],
+                })
+                ids.append(record["id"])
+            return ids
+
+    # messages
+
+    def list_messages(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        wanted = set(query.get("labelIds", []))
+        excluded = set()
+        for term in " ".join(query.get("q", [])).split():
+            term = term.lower()
+            if term == "is:unread":
+                wanted.add("UNREAD")
+            elif term == "is:read":
+                excluded.add("UNREAD")
+            elif term.startswith("in:") or term.startswith("label:"):
+                wanted.add(term.partition(":")[2].upper())
+
+        max_results = min(int(query.get("maxResults", ["100"])[0]), 500)
+        start = int(query.get("pageToken", ["0"])[0])
+        with self.lock:
+            matching = [
+                message_id for message_id in self.order
+                if wanted <= self.messages[message_id]["labels"] and not excluded & self.messages[message_id]["labels"]
+            ]
+
+        page = matching[start:start + max_results]
+        data: Dict[str, Any] = {
+            "messages": [{"id": message_id, "threadId": message_id} for message_id in page],
+            "resultSizeEstimate": len(matching),
+        }
+        if start + max_results < len(matching):
+            data["nextPageToken"] = str(start + max_results)
+        if not page:
+            del data["messages"]
+        return data
+
+    def get_message(self, message_id: str, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        with self.lock:
+            message = self.messages.get(message_id)
+            if message is None:
+                raise ApiError(404, "Requested entity was not found.", "notFound")
+            labels = sorted(message["labels"])
+            history_id = message["history_id"]
+
+        record = message["record"]
+        data = {
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": labels,
+            "snippet": record["body_preview"][:100],
+            "historyId": str(history_id),
+            "internalDate": str(int(record["received_at"].timestamp() * 1000)),
+        }
+
+        message_format = query.get("format", ["full"])[0]
+        if message_format == "minimal":
+            return data
+
+        headers = [
+            {"name": "From", "value": record["sender"]},
+            {"name": "To", "value": record["to"]},
+            {"name": "Subject", "value": record["subject"]},
+            {"name": "Date", "value": format_datetime(record["received_at"])},
+        ]
+        if message_format == "metadata":
+            wanted = {name.lower() for name in query.get("metadataHeaders", [])}
+            data["payload"] = {
+                "mimeType": "multipart/alternative",
+                "headers": [header for header in headers if not wanted or header["name"].lower() in wanted],
+            }
+            return data
+
+        text = record["body_preview"]
+        html = f"<html><body><p>{text}</p></body></html>"
+        data["payload"] = {
+            "mimeType": "multipart/alternative",
+            "headers": headers,
+            "body": {"size": 0},
+            "parts": [
+                {"partId": "0", "mimeType": "text/plain", "headers": [
+                    {"name": "Content-Type", "value": "text/plain; charset=UTF-8"}
+                ], "body": _encoded_body(text)},
+                {"partId": "1", "mimeType": "text/html", "headers": [
+                    {"name": "Content-Type", "value": "text/html; charset=UTF-8"}
+                ], "body": _encoded_body(html)},
+            ],
+        }
+        return data
+
+    def modify(self, message_ids: List[str], add: List[str], remove: List[str]):
+        with self.lock:
+            for label_id in add + remove:
+                if label_id not in self.labels:
+                    raise ApiError(400, f"Invalid label: {label_id}", "invalidArgument")
+            missing = [message_id for message_id in message_ids if message_id not in self.messages]
+            if missing and len(message_ids) == 1:
+                raise ApiError(404, "Requested entity was not found.", "notFound")
+
+            for message_id in message_ids:
+                message = self.messages.get(message_id)
+                if message is None:
+                    continue
+                added = [label_id for label_id in add if label_id not in message["labels"]]
+                removed = [label_id for label_id in remove if label_id in message["labels"]]
+                if not added and not removed:
+                    continue
+
+                message["labels"].update(added)
+                message["labels"].difference_update(removed)
+                self.history_id += 1
+                message["history_id"] = self.history_id
+                record = {"id": str(self.history_id)}
+                summary = self._summary(message_id)
+                if added:
+                    record["labelsAdded"] = [{"message": summary, "labelIds": added}]
+                if removed:
+                    record["labelsRemoved"] = [{"message": summary, "labelIds": removed}]
+                self.history.append(record)
+
+    def _summary(self, message_id: str) -> Dict[str, Any]:
+        return {"id": message_id, "threadId": message_id, "labelIds": sorted(self.messages[message_id]["labels"])}
+
+    # labels
+
+    def list_labels(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"labels": list(self.labels.values())}
+
+    def create_label(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        name = (data.get("name") or "").strip()
+        if not name:
+            raise ApiError(400, "Invalid label name", "invalidArgument")
+        with self.lock:
+            if any(label["name"].lower() == name.lower() for label in self.labels.values()):
+                raise ApiError(409, "Label name exists or conflicts", "duplicate")
+            label = {
+                "id": f"Label_{len(self.labels) - len(SYSTEM_LABELS) + 1}",
+                "name": name,
+                "type": "user",
+                "labelListVisibility": data.get("labelListVisibility", "labelShow"),
+                "messageListVisibility": data.get("messageListVisibility", "show"),
+            }
+            self.labels[label["id"]] = label
+            return label
+
+    # history and profile
+
+    def list_history(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        if "startHistoryId" not in query:
+            raise ApiError(400, "Missing startHistoryId", "invalidArgument")
+        start = int(query["startHistoryId"][0])
+        types = set(query.get("historyTypes", [])) or {"messageAdded", "messageDeleted", "labelAdded", "labelRemoved"}
+        label_id = query.get("labelId", [None])[0]
+        max_results = min(int(query.get("maxResults", ["100"])[0]), 500)
+        offset = int(query.get("pageToken", ["0"])[0])
+
+        with self.lock:
+            if start < self.first_history_id:
+                raise ApiError(404, "Requested entity was not found.", "notFound")
+            records = []
+            for record in self.history:
+                if int(record["id"]) <= start:
+                    continue
+                kept = {"id": record["id"]}
+                for field, history_type in (
+                    ("messagesAdded", "messageAdded"), ("messagesDeleted", "messageDeleted"),
+                    ("labelsAdded", "labelAdded"), ("labelsRemoved", "labelRemoved"),
+                ):
+                    changes = [
+                        change for change in record.get(field, [])
+                        if history_type in types and (
+                            label_id is None
+                            or label_id in change["message"]["labelIds"]
+                            or label_id in change.get("labelIds", [])
+                        )
+                    ]
+                    if changes:
+                        kept[field] = changes
+                if len(kept) > 1:
+                    kept["messages"] = [
+                        change["message"] for field in ("messagesAdded", "messagesDeleted", "labelsAdded", "labelsRemoved")
+                        for change in kept.get(field, [])
+                    ]
+                    records.append(kept)
+            history_id = self.history_id
+
+        data: Dict[str, Any] = {"historyId": str(history_id)}
+        if records[offset:offset + max_results]:
+            data["history"] = records[offset:offset + max_results]
+        if offset + max_results < len(records):
+            data["nextPageToken"] = str(offset + max_results)
+        return data
+
+    def profile(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "emailAddress": "user@example.com",
+                "messagesTotal": len(self.messages),
+                "threadsTotal": len(self.messages),
+                "historyId": str(self.history_id),
+            }
+
+
+class FaultInjector:
+    """Latency, random errors and a per-server quota bucket, like a busy Gmail backend"""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float,
+                 units_per_second: float, burst: Optional[float], seed: int):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.units_per_second = units_per_second
+        self.burst = burst or units_per_second
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "units": 0, "errors_injected": 0, "throttled": 0}
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                jitter = self._rng.uniform(-self.jitter, self.jitter)
+            time.sleep(max(0.0, self.latency + jitter))
+
+    def check(self, units: int):
+        """Raise the error a request should get instead of being served, if any"""
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.stats["errors_injected"] += 1
+                raise ApiError(503, "The service is currently unavailable.", "backendError")
+
+            if self.units_per_second:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.units_per_second)
+                self._updated = now
+                if self._tokens < units:
+                    self.stats["throttled"] += 1
+                    raise ApiError(429, "User-rate limit exceeded.", "rateLimitExceeded")
+                self._tokens -= units
+            self.stats["units"] += units
+
+
+class FakeGmailServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Load tests open many connections at once
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    mailbox: FakeMailbox
+    faults: FaultInjector
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_POST(self):
+        self._serve("POST")
+
+    def _serve(self, method: str):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        url = urlparse(self.path)
+        if url.path.startswith("/_fake/"):
+            return self._serve_admin(url.path, parse_qs(url.query))
+
+        self.faults.delay()
+        if url.path == "/token":
+            return self._send(200, _json({
+                "access_token": f"fake-{int(time.time() * 1000)}",
+                "expires_in": 3600,
+                "token_type": "Bearer",
+            }))
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send_error(ApiError(401, "Request is missing required authentication credential.", "required"))
+        if url.path.startswith("/batch/"):
+            return self._serve_batch(body)
+
+        status, payload, headers = self._call(method, url.path, url.query, body)
+        self._send(status, payload, headers=headers)
+
+    def _serve_admin(self, path: str, query: Dict[str, List[str]]):
+        if path == "/_fake/stats":
+            return self._send(200, _json(self.faults.stats))
+        if path == "/_fake/deliver":
+            ids = self.mailbox.deliver(int(query.get("count", ["1"])[0]))
+            return self._send(200, _json({"messages": ids}))
+        self._send_error(ApiError(404, "Not found", "notFound"))
+
+    def _call(self, method: str, path: str, query_string: str, body: bytes) -> tuple:
+        """Serve one API request: (status, body bytes, extra headers)"""
+        try:
+            self.faults.check(quota_units(method, path))
+            data = self._route(method, USER_PATH.sub("", path), parse_qs(query_string), body)
+        except ApiError as e:
+            return e.code, _json(e.body()), e.headers
+        if data is None:
+            return 204, b"", {}
+        return 200, _json(data), {}
+
+    def _route(self, method: str, path: str, query: Dict[str, List[str]], body: bytes) -> Optional[Dict[str, Any]]:
+        mailbox = self.mailbox
+        data = json.loads(body) if method == "POST" and body else {}
+
+        if path == "/messages" and method == "GET":
+            return mailbox.list_messages(query)
+        if path == "/messages/batchModify" and method == "POST":
+            ids = data.get("ids", [])
+            if len(ids) > MAX_BATCH_MODIFY_IDS:
+                raise ApiError(400, f"Too many ids: {len(ids)} > {MAX_BATCH_MODIFY_IDS}", "invalidArgument")
+            mailbox.modify(ids, data.get("addLabelIds", []), data.get("removeLabelIds", []))
+            return None
+        match = re.fullmatch(r"/messages/([^/]+)(/modify)?", path)
+        if match and method == "POST" and match.group(2):
+            mailbox.modify([match.group(1)], data.get("addLabelIds", []), data.get("removeLabelIds", []))
+            return mailbox.get_message(match.group(1), {"format": ["minimal"]})
+        if match and method == "GET" and not match.group(2):
+            return mailbox.get_message(match.group(1), query)
+        if path == "/labels":
+            return mailbox.create_label(data) if method == "POST" else mailbox.list_labels()
+        if path == "/history" and method == "GET":
+            return mailbox.list_history(query)
+        if path == "/profile" and method == "GET":
+            return mailbox.profile()
+        raise ApiError(404, f"Unknown endpoint: {method} {path}", "notFound")
+
+    def _serve_batch(self, body: bytes):
+        match = re.search(r'boundary="?([^";]+)"?', self.headers.get("Content-Type", ""))
+        if not match:
+            return self._send_error(ApiError(400, "Missing multipart boundary", "invalidArgument"))
+
+        requests = []
+        for part in body.replace(b"\r\n", b"\n").split(b"--" + match.group(1).encode()):
+            part = part.strip()
+            if not part or part == b"--":
+                continue
+            part_headers, _, http_request = part.partition(b"\n\n")
+            content_id = re.search(rb"content-id:\s*<?([^>\s]+)>?", part_headers, re.IGNORECASE)
+            request_line, _, rest = http_request.partition(b"\n")
+            method, _, target = request_line.decode().partition(" ")
+            _, _, request_body = rest.partition(b"\n\n")
+            requests.append((
+                content_id.group(1).decode() if content_id else str(len(requests)),
+                method, target.split(" ")[0], request_body.strip()
+            ))
+
+        if len(requests) > MAX_BATCH_REQUESTS:
+            return self._send_error(ApiError(
+                400, f"Too many requests in batch: {len(requests)} > {MAX_BATCH_REQUESTS}", "invalidArgument"
+            ))
+
+        boundary = f"batch_{random.getrandbits(64):016x}"
+        parts = []
+        for content_id, method, target, request_body in requests:
+            url = urlparse(target)
+            status, payload, _ = self._call(method, url.path, url.query, request_body)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n"
+                "\r\n"
+                f"HTTP/1.1 {status} {self.responses.get(status, ('',))[0]}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n"
+                "\r\n"
+                f"{payload.decode()}\r\n"
+            )
+        content = ("".join(parts) + f"--{boundary}--\r\n").encode()
+        self._send(200, content, content_type=f"multipart/mixed; boundary={boundary}")
+
+    def _send_error(self, error: ApiError):
+        self._send(error.code, _json(error.body()), headers=error.headers)
+
+    def _send(self, status: int, content: bytes, content_type: str = "application/json; charset=UTF-8",
+              headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        if content:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _encoded_body(text: str) -> Dict[str, Any]:
+    data = text.encode("utf-8")
+    return {"size": len(data), "data": base64.urlsafe_b64encode(data).decode().rstrip("=")}
+
+
+def _json(data: Any) -> bytes:
+    return json.dumps(data).encode("utf-8")
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8025, messages: int = 5000, seed: int = 42,
+                  latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                  quota_units_per_second: float = 0, quota_burst: Optional[float] = None) -> FakeGmailServer:
+    """Build a fake Gmail server (call serve_forever() on it); port 0 picks a free port"""
+    handler = type("Handler", (FakeGmailHandler,), {
+        "mailbox": FakeMailbox(messages, seed),
+        "faults": FaultInjector(latency_ms, jitter_ms, error_rate, quota_units_per_second, quota_burst, seed),
+    })
+    return FakeGmailServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gmail API server for CleanMail load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--messages", type=int, default=5000, help="Synthetic mailbox size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added latency per HTTP request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random +/- latency variation")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="Fraction of API requests (and batch sub-requests) failing with 503")
+    parser.add_argument("--quota-units-per-second", type=float, default=0,
+                        help="Quota units served per second before answering 429 (0: unlimited)")
+    parser.add_argument("--quota-burst", type=float, help="Quota bucket size (default: one second of quota)")
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port, args.messages, args.seed, args.latency_ms, args.jitter_ms,
+        args.error_rate, args.quota_units_per_second, args.quota_burst
+    )
+    print(f"Fake Gmail API serving {args.messages} messages on http://{args.host}:{args.port}")
+    print("Stats: /_fake/stats  New mail: POST /_fake/deliver?count=N")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\nServed: {json.dumps(server.RequestHandlerClass.faults.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Pytest fixtures for the CleanMail backend tests
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+
+# Register every model on Base.metadata
+import app.models.cached_message  # noqa: F401
+import app.models.email_log  # noqa: F401
+import app.models.gmail_sync_state  # noqa: F401
+import app.models.processing_job  # noqa: F401
+import app.models.rule  # noqa: F401
+import app.models.rule_profile  # noqa: F401
+from app.models.user import User
+
+
+@pytest.fixture
+def session_factory():
+    """Sessionmaker bound to a fresh in-memory SQLite database"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    """A session on the test database"""
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    """Create users with a valid access token"""
+    def make(email: str = "user@example.com", **values) -> User:
+        user = User(
+            email=email,
+            google_id=values.pop("google_id", email),
+            access_token=values.pop("access_token", "access-token"),
+            refresh_token=values.pop("refresh_token", "refresh-token"),
+            token_expires_at=values.pop("token_expires_at", datetime.utcnow() + timedelta(hours=1)),
+            **values
+        )
+        db.add(user)
+        db.commit()
+        return user
+    return make
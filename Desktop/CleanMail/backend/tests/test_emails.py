@@ -0,0 +1,179 @@
+"""
+Email fetching tests: Gmail batch responses and message body extraction
+"""
+
+import base64
+import json
+
+from app.services import gmail_service
+from app.services.mime_walker import extract_body_text
+
+
+def b64(text: str, charset: str = "utf-8") -> str:
+    return base64.urlsafe_b64encode(text.encode(charset)).decode().rstrip("=")
+
+
+def batch_part(content_id: str, status: int, body=None) -> str:
+    payload = json.dumps(body) if body is not None else ""
+    return (
+        "Content-Type: application/http\r\n"
+        f"Content-ID: <{content_id}>\r\n"
+        "\r\n"
+        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+        "Content-Type: application/json; charset=UTF-8\r\n"
+        "\r\n"
+        f"{payload}\r\n"
+    )
+
+
+def batch_response(boundary: str, parts: list) -> bytes:
+    return ("".join(f"--{boundary}\r\n{part}" for part in parts) + f"--{boundary}--\r\n").encode()
+
+
+def message(message_id: str, subject: str, text: str) -> dict:
+    return {
+        "id": message_id,
+        "labelIds": ["INBOX", "UNREAD"],
+        "historyId": "42",
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [{"name": "Subject", "value": subject}, {"name": "From", "value": "a@example.com"}],
+            "body": {"data": b64(text)},
+        },
+    }
+
+
+# Batch responses
+
+def test_parse_batch_response_splits_parts_by_content_id():
+    content = batch_response("batch_abc", [
+        batch_part("response-item0", 200, {"id": "m1"}),
+        batch_part("response-item1", 404, {"error": {"code": 404}}),
+        batch_part("response-item2", 429),
+    ])
+
+    responses = gmail_service.parse_batch_response("multipart/mixed; boundary=batch_abc", content)
+
+    assert responses == {
+        "response-item0": (200, {"id": "m1"}),
+        "response-item1": (404, {"error": {"code": 404}}),
+        "response-item2": (429, None),
+    }
+
+
+def test_parse_batch_response_accepts_quoted_boundary_and_bare_newlines():
+    content = batch_response("b1", [batch_part("response-item0", 200, {"id": "m1"})]).replace(b"\r\n", b"\n")
+
+    responses = gmail_service.parse_batch_response('multipart/mixed; boundary="b1"', content)
+
+    assert responses == {"response-item0": (200, {"id": "m1"})}
+
+
+def test_parse_batch_response_without_boundary_is_empty():
+    assert gmail_service.parse_batch_response("application/json", b'{"id": "m1"}') == {}
+
+
+def test_parse_batch_response_skips_malformed_parts():
+    content = batch_response("b1", [
+        "Content-Type: application/http\r\n\r\nnot an http response\r\n",
+        batch_part("response-item1", 200, {"id": "m2"}),
+    ])
+
+    assert gmail_service.parse_batch_response("multipart/mixed; boundary=b1", content) == {
+        "response-item1": (200, {"id": "m2"})
+    }
+
+
+def test_parse_message_batch_maps_parts_back_to_message_ids():
+    content = batch_response("b1", [
+        batch_part("response-item1", 200, message("m2", "Second", "two")),
+        batch_part("response-item0", 500),
+        batch_part("response-item7", 200, message("m9", "Unknown", "nine")),
+    ])
+
+    fetched = gmail_service.parse_message_batch(["m1", "m2"], "multipart/mixed; boundary=b1", content)
+
+    assert list(fetched) == ["m2"]
+    assert fetched["m2"].subject == "Second"
+    assert fetched["m2"].labels == ["INBOX", "UNREAD"]
+
+
+def test_build_message_batch_requests_each_message():
+    headers, body = gmail_service.build_message_batch(["m1", "m2"], "metadata")
+
+    boundary = headers["Content-Type"].split("boundary=")[1]
+    text = body.decode()
+    assert text.count(f"--{boundary}\r\n") == 2
+    assert "Content-ID: <item1>" in text
+    assert f"GET {gmail_service.GMAIL_API_PATH}/messages/m2?format=metadata" in text
+
+
+# Message bodies
+
+def test_extract_body_text_prefers_plain_text():
+    payload = {
+        "mimeType": "multipart/alternative",
+        "parts": [
+            {"mimeType": "text/html", "body": {"data": b64("<p>HTML version</p>")}},
+            {"mimeType": "text/plain", "body": {"data": b64("Plain version")}},
+        ],
+    }
+
+    assert extract_body_text(payload, 100) == "Plain version"
+
+
+def test_extract_body_text_falls_back_to_visible_html_text():
+    html = (
+        "<html><head><title>Title</title><style>p {color: red}</style></head>"
+        "<body><p>Tu factura</p><script>track()</script><div>de&nbsp;marzo</div></body></html>"
+    )
+    payload = {
+        "mimeType": "multipart/mixed",
+        "parts": [
+            {"mimeType": "multipart/alternative", "parts": [
+                {"mimeType": "text/html", "body": {"data": b64(html)}},
+            ]},
+            {"mimeType": "application/pdf", "filename": "factura.pdf", "body": {"attachmentId": "att1"}},
+        ],
+    }
+
+    assert extract_body_text(payload, 100) == "Tu factura de marzo"
+
+
+def test_extract_body_text_skips_attachments():
+    payload = {
+        "mimeType": "multipart/mixed",
+        "parts": [
+            {"mimeType": "text/plain", "filename": "notes.txt", "body": {"data": b64("attached notes")}},
+            {"mimeType": "text/plain", "body": {"data": b64("inline body")}},
+        ],
+    }
+
+    assert extract_body_text(payload, 100) == "inline body"
+
+
+def test_extract_body_text_is_limited_to_the_window():
+    long_text = "".join(f"word{i} " for i in range(5000))
+    plain = {"mimeType": "text/plain", "body": {"data": b64(long_text)}}
+    html = {"mimeType": "text/html", "body": {"data": b64(f"<p>{long_text}</p>")}}
+
+    assert extract_body_text(plain, 50) == long_text[:50]
+    assert extract_body_text(html, 50) == long_text[:50]
+
+
+def test_extract_body_text_decodes_the_part_charset():
+    payload = {
+        "mimeType": "text/plain",
+        "headers": [{"name": "Content-Type", "value": 'text/plain; charset="ISO-8859-1"'}],
+        "body": {"data": b64("Boletín de noticias", "iso-8859-1")},
+    }
+
+    assert extract_body_text(payload, 100) == "Boletín de noticias"
+
+
+def test_extract_body_text_without_text_parts_is_empty():
+    payload = {"mimeType": "multipart/mixed", "parts": [
+        {"mimeType": "image/png", "filename": "logo.png", "body": {"attachmentId": "att1"}},
+    ]}
+
+    assert extract_body_text(payload, 100) == ""
@@ -0,0 +1,157 @@
+"""
+Job queue tests: claiming, per-user limits, leases and retries
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import config
+from app.models.processing_job import ProcessingJob
+from app.services import job_queue
+
+
+@pytest.fixture(autouse=True)
+def queue_settings(monkeypatch):
+    monkeypatch.setattr(config.settings, "job_max_running_per_user", 1)
+    monkeypatch.setattr(config.settings, "job_max_attempts", 3)
+    monkeypatch.setattr(config.settings, "job_retry_base_seconds", 30.0)
+    monkeypatch.setattr(config.settings, "job_lease_seconds", 300.0)
+
+
+def reload(db, job) -> ProcessingJob:
+    db.expire_all()
+    return db.query(ProcessingJob).filter(ProcessingJob.id == job.id).first()
+
+
+def test_claim_job_takes_the_oldest_due_job(db, make_user):
+    user = make_user()
+    first = job_queue.enqueue_job(db, user.id)
+    job_queue.enqueue_job(db, user.id)
+
+    claimed = job_queue.claim_job(db, "worker-1")
+
+    assert claimed.id == first.id
+    assert claimed.status == "running"
+    assert claimed.worker_id == "worker-1"
+    assert claimed.attempts == 1
+    assert claimed.lease_expires_at > datetime.utcnow()
+
+
+def test_claim_job_respects_the_per_user_limit(db, make_user):
+    alice, bob = make_user("alice@example.com"), make_user("bob@example.com")
+    alice_first = job_queue.enqueue_job(db, alice.id)
+    job_queue.enqueue_job(db, alice.id)
+    bob_job = job_queue.enqueue_job(db, bob.id)
+
+    assert job_queue.claim_job(db, "worker-1").id == alice_first.id
+    # Alice's second job waits for her first one; Bob's job runs meanwhile
+    assert job_queue.claim_job(db, "worker-2").id == bob_job.id
+    assert job_queue.claim_job(db, "worker-3") is None
+
+    job_queue.complete_job(db, alice_first.id, "worker-1", emails_processed=5)
+    assert job_queue.claim_job(db, "worker-3").user_id == alice.id
+
+
+def test_claim_job_allows_more_running_jobs_when_configured(db, make_user, monkeypatch):
+    monkeypatch.setattr(config.settings, "job_max_running_per_user", 2)
+    user = make_user()
+    for _ in range(3):
+        job_queue.enqueue_job(db, user.id)
+
+    assert job_queue.claim_job(db, "worker-1") is not None
+    assert job_queue.claim_job(db, "worker-2") is not None
+    assert job_queue.claim_job(db, "worker-3") is None
+
+
+def test_claim_job_skips_jobs_not_yet_due(db, make_user):
+    user = make_user()
+    job = job_queue.enqueue_job(db, user.id)
+    job.run_after = datetime.utcnow() + timedelta(minutes=5)
+    db.commit()
+
+    assert job_queue.claim_job(db, "worker-1") is None
+
+
+def test_expired_lease_requeues_the_job(db, make_user):
+    user = make_user()
+    job = job_queue.enqueue_job(db, user.id)
+    job_queue.claim_job(db, "worker-1")
+    db.query(ProcessingJob).filter(ProcessingJob.id == job.id).update({
+        ProcessingJob.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)
+    })
+    db.commit()
+
+    claimed = job_queue.claim_job(db, "worker-2")
+
+    assert claimed.id == job.id
+    assert claimed.worker_id == "worker-2"
+    assert claimed.attempts == 2
+    # The first worker lost the job: it can neither renew nor settle it
+    assert not job_queue.renew_lease(db, job.id, "worker-1")
+    job_queue.complete_job(db, job.id, "worker-1", emails_processed=1)
+    assert reload(db, job).status == "running"
+    assert job_queue.renew_lease(db, job.id, "worker-2", stats={"stages": {}})
+
+
+def test_expired_lease_without_attempts_left_fails_the_job(db, make_user):
+    user = make_user()
+    job = job_queue.enqueue_job(db, user.id)
+    db.query(ProcessingJob).filter(ProcessingJob.id == job.id).update({
+        ProcessingJob.status: "running",
+        ProcessingJob.attempts: 3,
+        ProcessingJob.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)
+    })
+    db.commit()
+
+    job_queue.requeue_expired_jobs(db)
+
+    job = reload(db, job)
+    assert job.status == "failed"
+    assert job.error == "Worker stopped responding"
+
+
+def test_failed_attempts_are_retried_with_backoff_then_fail(db, make_user):
+    user = make_user()
+    job = job_queue.enqueue_job(db, user.id)
+
+    for attempt in (1, 2):
+        claimed = job_queue.claim_job(db, "worker-1")
+        assert claimed.attempts == attempt
+        before = datetime.utcnow()
+        job_queue.fail_job(db, job.id, "worker-1", "Gmail unavailable")
+
+        retried = reload(db, job)
+        assert retried.status == "queued"
+        assert retried.error == "Gmail unavailable"
+        delay = (retried.run_after - before).total_seconds()
+        assert delay == pytest.approx(30.0 * 2 ** (attempt - 1), abs=2)
+        retried.run_after = datetime.utcnow()
+        db.commit()
+
+    job_queue.claim_job(db, "worker-1")
+    job_queue.fail_job(db, job.id, "worker-1", "Gmail unavailable")
+    assert reload(db, job).status == "failed"
+
+
+def test_permanent_failures_are_not_retried(db, make_user):
+    user = make_user()
+    job = job_queue.enqueue_job(db, user.id)
+    job_queue.claim_job(db, "worker-1")
+
+    job_queue.fail_job(db, job.id, "worker-1", "User not found", retry=False)
+
+    assert reload(db, job).status == "failed"
+
+
+def test_released_jobs_keep_their_attempts(db, make_user):
+    user = make_user()
+    job = job_queue.enqueue_job(db, user.id)
+    job_queue.claim_job(db, "worker-1")
+
+    job_queue.release_job(db, job.id, "worker-1")
+
+    released = reload(db, job)
+    assert released.status == "queued"
+    assert released.attempts == 0
+    assert job_queue.claim_job(db, "worker-2").id == job.id
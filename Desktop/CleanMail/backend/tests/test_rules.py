@@ -0,0 +1,212 @@
+"""
+Rule engine tests: compiled matching against a naive reference, and regex checks
+"""
+
+import random
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import rule_engine
+from app.services.keyword_matcher import SCAN_THRESHOLD, KeywordMatcher
+from app.services.prepared_email import normalize_text, parse_sender
+from app.services.rule_engine import CompiledRuleSet, check_regex_complexity
+
+WORDS = [
+    "factura", "fact", "pedido", "order", "newsletter", "boletín", "promo", "oferta",
+    "deploy", "build", "alerta", "hola", "reunión", "invoice", "receipt", "news",
+]
+SENDERS = [
+    "Facturas <facturas@iberdrola.es>",
+    "GitHub <noreply@github.com>",
+    "News <news@mail.example.com>",
+    "bob@corp.es",
+    "Ana García <ana.garcia@gmail.com>",
+    '"Promo" <promo@shop.example.com>',
+]
+REGEXES = [r"\b\d{5}\b", r"(?:build|deploy)\s+\w+", r"^\S+@", r"factura\s+\d+"]
+EXACT_SENDERS = ["=example.com", "=@corp.es", "=bob@corp.es", "=noreply@github.com", "=iberdrola.es"]
+
+
+def naive_matches(rule, email) -> bool:
+    """Reference semantics of one rule, checked keyword by keyword"""
+    if rule.match_type == "regex":
+        target = f"{email['sender']} {email['subject']} {email['body_preview']}"
+        return re.search(rule.match_value, target, re.IGNORECASE) is not None
+
+    target = normalize_text({
+        "sender": email["sender"],
+        "subject": email["subject"],
+        "body": email["body_preview"],
+        "header": f"{email['sender']} {email['to']} {email['subject']}",
+    }[rule.match_type])
+    address, domain = parse_sender(email["sender"])
+    for keyword in rule.match_value.split("|"):
+        keyword = normalize_text(keyword.strip())
+        if not keyword:
+            continue
+        if rule.match_type == "sender" and keyword.startswith("="):
+            exact = keyword[1:]
+            if "@" in exact.lstrip("@"):
+                matched = exact == address
+            else:
+                exact = exact.lstrip("@")
+                matched = domain == exact or domain.endswith("." + exact)
+        else:
+            matched = keyword in target
+        if matched:
+            return True
+    return False
+
+
+def naive_ranks(rules, email) -> list:
+    """Ranks (indexes in priority order) of every rule matching the email"""
+    ordered = sorted(rules, key=lambda rule: rule.priority)
+    return [rank for rank, rule in enumerate(ordered) if naive_matches(rule, email)]
+
+
+def make_rules(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.1:
+            match_type, match_value = "regex", rng.choice(REGEXES)
+        elif kind < 0.25:
+            match_type = "sender"
+            match_value = "|".join(rng.sample(EXACT_SENDERS, 2) + rng.sample(WORDS, 1))
+        else:
+            match_type = rng.choice(["sender", "subject", "subject", "body", "header"])
+            match_value = "|".join(rng.sample(WORDS, rng.randint(1, 3)))
+        rules.append(SimpleNamespace(
+            id=i, name=f"Rule {i}", match_type=match_type, match_value=match_value,
+            action_type="tag", action_value="Label", priority=rng.randint(1, count // 2 + 1)
+        ))
+    return rules
+
+
+def make_emails(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    fillers = ["el", "the", "de", "tu", "your", "12345", "build main", "ok"]
+    return [
+        {
+            "id": f"m{i}",
+            "sender": rng.choice(SENDERS),
+            "to": "user@example.com",
+            "subject": " ".join(rng.choice(WORDS + fillers).capitalize() for _ in range(rng.randint(1, 5))),
+            "body_preview": " ".join(rng.choice(WORDS + fillers) for _ in range(rng.randint(0, 8))),
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("keyword_count", [SCAN_THRESHOLD // 2, SCAN_THRESHOLD * 3])
+def test_keyword_matcher_matches_naive_search(keyword_count):
+    rng = random.Random(keyword_count)
+    alphabet = "abc"
+    keywords = {}
+    while len(keywords) < keyword_count:
+        keyword = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5)))
+        keywords.setdefault(keyword, set()).add(rng.randrange(40))
+
+    matcher = KeywordMatcher()
+    for keyword, ranks in keywords.items():
+        for rank in ranks:
+            matcher.add(keyword, rank)
+    matcher.build()
+
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet + " ") for _ in range(rng.randint(0, 12)))
+        expected = {rank for keyword, ranks in keywords.items() if keyword in text for rank in ranks}
+        expected_mask = sum(1 << rank for rank in expected)
+        assert matcher.find_mask(text) == expected_mask
+
+        limit = rng.choice([None, 5, 20])
+        below = [rank for rank in expected if limit is None or rank < limit]
+        assert matcher.find_best(text, limit) == (min(below) if below else None)
+
+
+@pytest.mark.parametrize("rule_count", [6, 80])
+def test_compiled_rules_first_match_matches_naive_reference(rule_count):
+    rules = make_rules(rule_count, seed=rule_count)
+    emails = make_emails(400, seed=rule_count)
+    compiled = CompiledRuleSet(rules)
+    expected = [next(iter(naive_ranks(rules, email)), None) for email in emails]
+
+    assert [compiled.match_index(email) for email in emails] == expected
+    assert compiled.match_batch(emails) == expected
+
+    # Plain rule lists answer with positions in the given list
+    ordered = sorted(range(len(rules)), key=lambda index: rules[index].priority)
+    assert rule_engine.find_matching_rules_batch(emails, rules) == [
+        ordered[rank] if rank is not None else None for rank in expected
+    ]
+
+
+@pytest.mark.parametrize("rule_count", [6, 80])
+def test_compiled_rules_all_matches_match_naive_reference(rule_count):
+    rules = make_rules(rule_count, seed=rule_count + 1)
+    emails = make_emails(400, seed=rule_count + 1)
+    compiled = CompiledRuleSet(rules)
+    expected = [sum(1 << rank for rank in naive_ranks(rules, email)) for email in emails]
+
+    assert [compiled.match_all(email) for email in emails] == expected
+    assert compiled.match_all_batch(emails) == expected
+    for email, mask in zip(emails, expected):
+        matched = compiled.rules_for_mask(mask)
+        assert [rule.position for rule in matched] == [
+            compiled.rules[rank].position for rank in naive_ranks(rules, email)
+        ]
+
+
+def test_sender_keywords_are_substrings_unless_marked_exact():
+    rules = [
+        SimpleNamespace(id=1, name="substring", match_type="sender", match_value="example.com",
+                        action_type="tag", action_value="A", priority=1),
+        SimpleNamespace(id=2, name="exact", match_type="sender", match_value="=example.com",
+                        action_type="tag", action_value="B", priority=2),
+    ]
+    compiled = CompiledRuleSet(rules)
+
+    assert compiled.match_all({"sender": "x@notexample.com"}) == 0b01
+    assert compiled.match_all({"sender": "x@mail.example.com"}) == 0b11
+    assert compiled.match_all({"sender": "example.com fan <x@other.org>"}) == 0b01
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(a+)+$",
+    r"(\w+\s?)*$",
+    r"((ab)*c)*",
+    r"(a|aa)*$",
+    r"(factura|fact)+",
+    r"(\s|.)*x",
+    r"(x|y|)*",
+    r"(ab|a)*c",
+])
+def test_check_regex_complexity_flags_catastrophic_patterns(pattern):
+    assert check_regex_complexity(pattern)
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(foo|bar)+",
+    r"^(?:https?|ftp)://\S+",
+    r"(?:ab|cd)*e",
+    r"factura\s+#?\d{4,}",
+    r"(a{1,3})+",
+])
+def test_check_regex_complexity_accepts_safe_patterns(pattern):
+    assert check_regex_complexity(pattern) == []
+
+
+def test_check_regex_complexity_rejects_long_patterns():
+    assert check_regex_complexity("x" * 501)
+
+
+def test_unsafe_regex_rules_never_run():
+    rules = [SimpleNamespace(id=1, name="unsafe", match_type="regex", match_value=r"(a|aa)*$",
+                             action_type="archive", action_value=None, priority=1)]
+    compiled = CompiledRuleSet(rules)
+
+    assert compiled.unsafe == {0: check_regex_complexity(r"(a|aa)*$")}
+    assert compiled.match_index({"sender": "a" * 40 + "b"}) is None
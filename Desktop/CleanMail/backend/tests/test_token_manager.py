@@ -0,0 +1,172 @@
+"""
+Token manager tests: single-flight refreshes and background refresh backoff
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import config
+from app.models.user import User
+from app.services import token_manager as token_manager_module
+from app.services.token_manager import TokenManager
+
+
+class FakeTokenEndpoint:
+    """Stands in for requests.post to Google's token endpoint"""
+
+    def __init__(self, status_code: int = 200, delay: float = 0.0):
+        self.status_code = status_code
+        self.delay = delay
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def __call__(self, url, data=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        self.release.wait(5)
+        time.sleep(self.delay)
+        return SimpleNamespace(
+            status_code=self.status_code,
+            text="error" if self.status_code != 200 else "",
+            json=lambda: {"access_token": f"new-token-{number}", "expires_in": 3600}
+        )
+
+
+@pytest.fixture
+def endpoint(monkeypatch, session_factory):
+    monkeypatch.setattr(token_manager_module, "SessionLocal", session_factory)
+    monkeypatch.setattr(config.settings, "token_refresh_margin_seconds", 300)
+    monkeypatch.setattr(config.settings, "token_refresh_backoff_seconds", 5.0)
+    fake = FakeTokenEndpoint()
+    monkeypatch.setattr(token_manager_module.requests, "post", fake)
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable monotonic clock of the token manager"""
+    now = [1000.0]
+    monkeypatch.setattr(token_manager_module, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def detached(user: User) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=user.id,
+        access_token=user.access_token,
+        refresh_token=user.refresh_token,
+        token_expires_at=user.token_expires_at
+    )
+
+
+def wait_for_background(manager: TokenManager, user_id: int):
+    deadline = time.monotonic() + 5
+    while user_id in manager._background and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_valid_token_is_served_from_memory(endpoint, make_user):
+    user = make_user()
+    manager = TokenManager()
+
+    assert manager.get_access_token(detached(user)) == "access-token"
+    assert endpoint.calls == 0
+
+
+def test_concurrent_callers_share_one_refresh(endpoint, make_user, db):
+    user = make_user(token_expires_at=datetime.utcnow() - timedelta(minutes=1))
+    manager = TokenManager()
+    endpoint.delay = 0.05
+    tokens = []
+
+    threads = [
+        threading.Thread(target=lambda: tokens.append(manager.get_access_token(detached(user))))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert endpoint.calls == 1
+    assert tokens == ["new-token-1"] * 8
+    db.expire_all()
+    assert db.query(User).filter(User.id == user.id).first().access_token == "new-token-1"
+
+
+def test_stale_token_forces_one_refresh(endpoint, make_user):
+    user = make_user()
+    manager = TokenManager()
+
+    assert manager.refresh(user.id, stale_token="access-token").access_token == "new-token-1"
+    # A second caller that saw the same rejected token reuses the new one
+    assert manager.refresh(user.id, stale_token="access-token").access_token == "new-token-1"
+    assert endpoint.calls == 1
+
+
+def test_token_refreshed_elsewhere_is_adopted(endpoint, make_user, db):
+    user = make_user(token_expires_at=datetime.utcnow() - timedelta(minutes=1))
+    manager = TokenManager()
+    stored = db.query(User).filter(User.id == user.id).first()
+    stored.access_token = "refreshed-by-another-process"
+    stored.token_expires_at = datetime.utcnow() + timedelta(hours=1)
+    db.commit()
+
+    assert manager.refresh(user.id).access_token == "refreshed-by-another-process"
+    assert endpoint.calls == 0
+
+
+def test_one_background_refresh_per_user(endpoint, make_user, clock):
+    user = make_user(token_expires_at=datetime.utcnow() + timedelta(seconds=60))
+    manager = TokenManager()
+    endpoint.release.clear()
+
+    # Close to expiry: the current token is served while a refresh runs
+    for _ in range(5):
+        assert manager.get_access_token(detached(user)) == "access-token"
+    endpoint.release.set()
+    wait_for_background(manager, user.id)
+
+    assert endpoint.calls == 1
+    assert manager.get_access_token(detached(user)) == "new-token-1"
+
+
+def test_failed_background_refresh_backs_off(endpoint, make_user, clock):
+    user = make_user(token_expires_at=datetime.utcnow() + timedelta(seconds=60))
+    manager = TokenManager()
+    endpoint.status_code = 400
+
+    manager.get_access_token(detached(user))
+    wait_for_background(manager, user.id)
+    assert endpoint.calls == 1
+
+    # Within the backoff no new refresh is started
+    clock[0] += 4
+    manager.get_access_token(detached(user))
+    wait_for_background(manager, user.id)
+    assert endpoint.calls == 1
+
+    # After it, one more attempt; a second failure doubles the wait
+    clock[0] += 2
+    manager.get_access_token(detached(user))
+    wait_for_background(manager, user.id)
+    assert endpoint.calls == 2
+
+    clock[0] += 9
+    manager.get_access_token(detached(user))
+    wait_for_background(manager, user.id)
+    assert endpoint.calls == 2
+
+    clock[0] += 2
+    endpoint.status_code = 200
+    assert manager.get_access_token(detached(user)) == "access-token"
+    wait_for_background(manager, user.id)
+    assert endpoint.calls == 3
+    assert manager.get_access_token(detached(user)) == "new-token-3"